@@ -0,0 +1,133 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+from config.settings import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class SemanticAnswerCache:
+    """語意答案快取：依公司/季度篩選條件與檢索關鍵詞快取分析答案，以問題向量的餘弦相似度比對
+
+    問題向量相近但檢索關鍵詞不同（例如不同分析類型）的查詢會檢索不同的內容，因此關鍵詞也是快取鍵的一部分。
+    每個答案附帶儲存時的資料版本（檔案清單的寫入版本），版本不同（其他程序重新匯入了檔案）時視為未命中並移除。
+    """
+    def __init__(self, max_entries: int = None, similarity_threshold: float = None):
+        self.max_entries = settings.get("answer_cache.max_entries", 256) if max_entries is None else max_entries
+        self.similarity_threshold = settings.get("answer_cache.similarity_threshold", 0.92) if similarity_threshold is None else similarity_threshold
+        
+        # 以 (公司, 季度, 檢索關鍵詞) 為鍵，值為該篩選條件下的快取項目；OrderedDict 維護 LRU 順序
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        """正規化向量以便計算餘弦相似度"""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def lookup(self, question: str, question_embedding, company: str, quarter: str, keywords: str = "", source_fingerprint: str = None) -> Optional[Dict]:
+        """查詢快取，命中時返回答案及來源資訊；來源版本指紋與儲存時不同的答案已過期"""
+        key = (company, quarter, keywords or "")
+        query_vector = self._normalize(question_embedding)
+        
+        with self._lock:
+            bucket = self._entries.get(key)
+            best_index = None
+            best_score = -1.0
+            
+            if bucket:
+                fresh = [entry for entry in bucket if entry['source_fingerprint'] == source_fingerprint]
+                if len(fresh) < len(bucket):
+                    logger.info(f"答案快取過期: {company} - {quarter}，移除 {len(bucket) - len(fresh)} 筆")
+                    self._size -= len(bucket) - len(fresh)
+                    bucket[:] = fresh
+                    if not bucket:
+                        del self._entries[key]
+                
+                for index, entry in enumerate(bucket):
+                    score = float(np.dot(entry['embedding'], query_vector))
+                    if score > best_score:
+                        best_index, best_score = index, score
+            
+            if best_index is None or best_score < self.similarity_threshold:
+                self.misses += 1
+                return None
+            
+            # 更新LRU順序
+            best_entry = bucket.pop(best_index)
+            bucket.append(best_entry)
+            self._entries.move_to_end(key)
+            self.hits += 1
+        
+        logger.info(f"答案快取命中: {company} - {quarter}，相似度 {best_score:.3f}，來源問題: {best_entry['question'][:50]}")
+        
+        return {
+            "answer": best_entry['answer'],
+            "similarity": best_score,
+            "source_question": best_entry['question'],
+            "company": company,
+            "quarter": quarter,
+            "cached_at": best_entry['cached_at']
+        }
+    
+    def store(self, question: str, question_embedding, company: str, quarter: str, answer: str, keywords: str = "", source_fingerprint: str = None):
+        """儲存新答案，超過容量時淘汰最久未使用的項目"""
+        key = (company, quarter, keywords or "")
+        entry = {
+            "question": question,
+            "embedding": self._normalize(question_embedding),
+            "answer": answer,
+            "source_fingerprint": source_fingerprint,
+            "cached_at": datetime.now()
+        }
+        
+        with self._lock:
+            bucket = self._entries.setdefault(key, [])
+            bucket.append(entry)
+            self._entries.move_to_end(key)
+            self._size += 1
+            
+            while self._size > self.max_entries:
+                oldest_key, oldest_bucket = next(iter(self._entries.items()))
+                oldest_bucket.pop(0)
+                self._size -= 1
+                if not oldest_bucket:
+                    del self._entries[oldest_key]
+    
+    def invalidate(self, company: str = None, quarter: str = None) -> int:
+        """使符合公司/季度的快取失效，返回移除的項目數"""
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (company is None or key[0] == company) and (quarter is None or key[1] == quarter)
+            ]
+            removed = 0
+            for key in keys:
+                removed += len(self._entries.pop(key))
+            self._size -= removed
+        
+        if removed:
+            logger.info(f"答案快取失效: {company} - {quarter}，移除 {removed} 筆")
+        return removed
+    
+    def on_chunks_added(self, company: str, quarter: str):
+        """向量資料庫新增文檔塊時的失效回呼"""
+        self.invalidate(company, quarter)
+    
+    def stats(self) -> Dict:
+        """快取統計"""
+        with self._lock:
+            return {
+                "entries": self._size,
+                "keys": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,156 @@
+import hashlib
+import json
+from typing import Dict, List, Optional
+from openai import OpenAI
+from config.settings import settings
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+# 摘要提示版本，修改提示內容時需更新以避免沿用舊的快取摘要
+SUMMARY_PROMPT_VERSION = "1"
+
+SUMMARY_SYSTEM_PROMPT = "你是財報摘要助手，負責將多種語言的財報段落濃縮為精簡的繁體中文摘要，並完整保留關鍵財務數字與頁碼。"
+
+SUMMARY_INSTRUCTIONS = """摘要要求：
+- 每個段落各自產生一則摘要，摘要不超過 {max_summary_chars} 字，使用繁體中文
+- 保留公司策略、產品（部門）表現、風險等重點，省略重複與格式性內容
+- key_figures 列出段落中的關鍵財務數字（營收、營業利益、淨利、成長率等），每項包含指標、數值、單位、期間與頁碼，格式如「總營收 650.3 百萬美元 (Q3 2024, p.5)」
+- 部門或產品名稱使用原文，不需翻譯
+- 段落沒有實質內容時 summary 為空字串、key_figures 為空陣列
+- 僅輸出 JSON：{{"summaries": [{{"id": 段落編號, "summary": "摘要", "key_figures": ["關鍵數字"]}}]}}
+"""
+
+class ChunkSummarizer:
+    """文檔塊摘要器：以低成本模型批次產生每個塊的摘要與關鍵數字，並依內容雜湊快取"""
+    def __init__(self, client: OpenAI = None, model: str = None, batch_size: int = None, max_batch_chars: int = None):
+        self.client = client or OpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.get("openai_settings.base_url")
+        )
+        self.model = model or settings.get("chunk_summary.model", "gpt-4.1-mini")
+        self.batch_size = batch_size or settings.get("chunk_summary.batch_size", 5)
+        self.max_batch_chars = max_batch_chars or settings.get("chunk_summary.max_batch_chars", 40000)
+        self.max_summary_chars = settings.get("chunk_summary.max_summary_chars", 400)
+        
+        self.stats = {"llm_calls": 0, "summarized": 0, "cached": 0, "failed": 0}
+    
+    def cache_key(self, text: str) -> str:
+        """以模型、提示版本與塊內容計算快取鍵"""
+        hasher = hashlib.sha256()
+        hasher.update(f"{self.model}\0{SUMMARY_PROMPT_VERSION}\0".encode("utf-8"))
+        hasher.update(text.encode("utf-8"))
+        return hasher.hexdigest()
+    
+    def summarize_texts(self, texts: List[str]) -> List[Optional[Dict]]:
+        """依批次大小與字元上限分批摘要，返回與輸入順序相同的結果（失敗者為 None）"""
+        results: List[Optional[Dict]] = [None] * len(texts)
+        
+        batch = []
+        batch_chars = 0
+        for index, text in enumerate(texts):
+            if batch and (len(batch) >= self.batch_size or batch_chars + len(text) > self.max_batch_chars):
+                self._summarize_into(batch, texts, results)
+                batch, batch_chars = [], 0
+            batch.append(index)
+            batch_chars += len(text)
+        
+        if batch:
+            self._summarize_into(batch, texts, results)
+        
+        return results
+    
+    def _summarize_into(self, indices: List[int], texts: List[str], results: List[Optional[Dict]]):
+        """摘要一個批次並寫入結果"""
+        for index, summary in zip(indices, self._summarize_batch([texts[i] for i in indices])):
+            results[index] = summary
+    
+    def _summarize_batch(self, texts: List[str]) -> List[Optional[Dict]]:
+        """以一次請求摘要多個塊"""
+        sections = "\n\n".join(f"[段落 {i}]\n{text}" for i, text in enumerate(texts))
+        prompt = SUMMARY_INSTRUCTIONS.format(max_summary_chars=self.max_summary_chars) + f"\n共 {len(texts)} 個段落：\n\n{sections}"
+        
+        try:
+            with metrics.timer("llm_call", purpose="chunk_summary"):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    response_format={"type": "json_object"},
+                    max_tokens=settings.get("chunk_summary.max_tokens", 2000),
+                    temperature=0
+                )
+            self.stats["llm_calls"] += 1
+            return self._parse_response(response.choices[0].message.content, len(texts))
+        
+        except Exception as e:
+            logger.error(f"產生 {len(texts)} 個塊的摘要時發生錯誤: {e}")
+            return [None] * len(texts)
+    
+    @staticmethod
+    def _parse_response(content: str, count: int) -> List[Optional[Dict]]:
+        """解析摘要回應；缺少段落編號時依順序對應"""
+        try:
+            items = json.loads(content or "{}").get("summaries", [])
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"無法解析摘要回應: {e}")
+            return [None] * count
+        
+        results: List[Optional[Dict]] = [None] * count
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            
+            index = item.get("id", position)
+            try:
+                index = int(index)
+            except (TypeError, ValueError):
+                index = position
+            
+            if 0 <= index < count:
+                key_figures = item.get("key_figures") or []
+                results[index] = {
+                    "summary": str(item.get("summary") or "").strip(),
+                    "key_figures": [str(figure).strip() for figure in key_figures if str(figure).strip()]
+                }
+        
+        return results
+    
+    def summarize_pending_chunks(self, vector_store, company_name: str = None, file_name: str = None) -> Dict:
+        """為尚未有摘要的文檔塊產生摘要：先查快取，其餘批次呼叫模型，並寫回文檔塊"""
+        chunks = vector_store.find_chunks_without_summary(company_name, file_name)
+        if not chunks:
+            return dict(self.stats, chunks=0)
+        
+        keys = [self.cache_key(chunk["text"]) for chunk in chunks]
+        cached = vector_store.get_cached_summaries(keys)
+        
+        updates = []
+        pending = []
+        for chunk, key in zip(chunks, keys):
+            if key in cached:
+                updates.append(dict(cached[key], _id=chunk["_id"], key=key))
+            else:
+                pending.append((chunk, key))
+        self.stats["cached"] += len(updates)
+        
+        summaries = self.summarize_texts([chunk["text"] for chunk, _ in pending])
+        generated = 0
+        for (chunk, key), summary in zip(pending, summaries):
+            if summary is None:
+                continue
+            updates.append(dict(summary, _id=chunk["_id"], key=key))
+            generated += 1
+        self.stats["summarized"] += generated
+        self.stats["failed"] += len(pending) - generated
+        
+        vector_store.save_chunk_summaries(updates, self.model)
+        
+        logger.info(
+            f"文檔塊摘要：{len(chunks)} 個待處理，快取命中 {len(chunks) - len(pending)} 個，"
+            f"新產生 {generated} 個，失敗 {len(pending) - generated} 個"
+        )
+        return dict(self.stats, chunks=len(chunks))
@@ -1,20 +1,137 @@
 import re
 import time
-from typing import Dict, List
+import threading
+from typing import Dict, List, Tuple
 from openai import OpenAI
 from config.settings import settings
 from utils.logger import get_logger
+from utils.metrics import metrics
 from utils.file_utils import is_annual_report, is_quarterly_report, extract_year_and_quarter
+from analyzers.answer_cache import SemanticAnswerCache
 
 logger = get_logger(__name__)
 
+# 系統訊息（固定內容，構成可快取的提示前綴）
+SYSTEM_PROMPT = "你是一個專業的財務分析師，擅長分析多種語言的財報，財報內容包含表格數據和OCR提取的圖像內容。你能夠準確解讀財務表格和圖像中的數據，提供精確的數據分析，並將復雜的財務信息轉化為清晰易懂的中文分析報告。在引用數據時，你總是會準確標註頁碼來源。"
+
+# 分析要求（固定內容，置於每次請求的上下文之前）
+ANALYSIS_INSTRUCTIONS = """分析要求：
+- 按照分析任務裡的項目去撰寫內容
+- **對於英文財報，請特別關注以下項目**：
+  * "Revenue"、"Total Revenue"、"Net Revenue" = 總營收
+  * "Operating Income" = 營業利益  
+  * "Net Income" = 淨利
+  * "Three months ended" = 當季三個月數據
+- **營收數據優先級**：
+  * 第一優先：使用 "Three months ended" 的當季數據（適用於季報分析）
+  * 第二優先：使用年度數據 "Year ended" 或 "For the year ended"（適用於年報分析）
+  * **盡量避免使用**：累計數據（如 Six months ended、Nine months ended等）
+- 若是營收與產品（部門）相關分析任務，優先使用表格中的具體數字進行分析，若無表格則使用內文中提及的數字進行分析
+- 若是部門或產品名稱則使用原文，不需翻譯
+- **重要1：引用數據與財報內文時必須標註頁碼，格式為 (p.X)（括號一定要使用半形括號）**
+- **重要2：若找不到相關內容時使用「無明確提及」作為答案，不用添加額外的推論**
+- **重要3：直接輸出純文字內容，且分析內容前不需要有任何前導標題（如：XXXX年XX季度公司概況等）**
+- **重要4：米字號使用規則**
+  * 在重要的**數字、金額、百分比、營收數據、獲利數字**等關鍵財務數據前後添加兩個米字號
+  * 在重要的**公司策略、風險評估結論、關鍵業務變化**等重要資訊前後添加兩個米字號
+  * **不要**在以下內容添加米字號：
+    - 分析任務中的主要標題（如：1. 綜合營收與獲利、2. 部門表現等）
+    - 分析任務中的副標題（如：(1) 總營收、(2) 服務收入等）
+    - 一般性的描述文字和過渡語句
+    - 頁數
+    - 無明確提及
+- 分析應該結構化且簡明扼要、易於理解
+- 用繁體中文回答，字數控制在 300 字左右
+
+米字號使用範例：
+正確：「總營收達到**750億韓元**，較去年同期成長**15%**」
+正確：「公司計劃在**2024年推出5款新遊戲**，重點布局**全球市場**」
+錯誤：「**1. 綜合營收與獲利**」（主標題不要加）
+錯誤：「**(1) 總營收**」（副標題不要加）
+錯誤：「**(p.X)**」（頁數不要加）
+"""
+
+def _per_thread(name: str, default=None):
+    """每個執行緒各自保存的屬性，讓同一個分析器可供多個查詢並行使用"""
+    return property(
+        lambda self: getattr(self._local, name, default),
+        lambda self, value: setattr(self._local, name, value)
+    )
+
 class RAGAnalyzer:
     """RAG增強分析器"""
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+    # 最近一次查詢的用量、提示長度、LLM 耗時與答案來源
+    last_usage = _per_thread("last_usage")
+    last_prompt_chars = _per_thread("last_prompt_chars", 0)
+    last_llm_ms = _per_thread("last_llm_ms")
+    last_answer_provenance = _per_thread("last_answer_provenance")
+    
+    def __init__(self, client: OpenAI = None):
+        self.client = client or OpenAI(
+            api_key=settings.openai_api_key,
+            base_url=settings.get("openai_settings.base_url")
+        )
+        
+        # API用量統計（含供應端提示快取命中的 token 數）
+        self.usage_stats = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "prompt_chars": 0}
+        self._usage_lock = threading.Lock()
+        self._local = threading.local()
+        
+        # 語意答案快取
+        self.answer_cache = SemanticAnswerCache() if settings.get("answer_cache.enabled", True) else None
+    
+    def _reset_last_stats(self):
+        self.last_usage = None
+        self.last_prompt_chars = 0
+        self.last_llm_ms = None
+    
+    def answer_with_cache(self, query: str, vector_store, company_filter: str, quarter_filter: str, query_keywords_en: str) -> str:
+        """語意快取包裝：相近問題直接返回快取答案，否則執行RAG並儲存結果"""
+        self._reset_last_stats()
+        if self.answer_cache is None:
+            self.last_answer_provenance = None
+            return self.enhanced_rag_process(query, vector_store, company_filter, quarter_filter, query_keywords_en)
+        
+        # 新文檔塊寫入時使對應快取失效
+        vector_store.register_ingest_listener(self.answer_cache.on_chunks_added)
+        
+        # 其他程序（main.py、pipeline.py、ingest_worker.py）的匯入不會觸發上述回呼，以檔案清單的寫入版本判斷快取答案是否過期
+        source_fingerprint = vector_store.get_ingest_fingerprint(company_filter, quarter_filter)
+        
+        question_embedding = vector_store.embedding_model.encode(query, convert_to_tensor=False)
+        cached = self.answer_cache.lookup(query, question_embedding, company_filter, quarter_filter, query_keywords_en, source_fingerprint)
+        if cached:
+            self.last_answer_provenance = dict(cached, source="cache")
+            return cached["answer"]
+        
+        answer = self.enhanced_rag_process(query, vector_store, company_filter, quarter_filter, query_keywords_en)
+        self.last_answer_provenance = {"source": "retrieval", "company": company_filter, "quarter": quarter_filter}
+        
+        # 不快取錯誤或找不到資訊的回應
+        if answer and answer not in ("無法找到相關資訊", "處理查詢時發生錯誤"):
+            self.answer_cache.store(query, question_embedding, company_filter, quarter_filter, answer, query_keywords_en, source_fingerprint)
+        
+        return answer
+    
+    def _build_facts_section(self, vector_store, company: str, quarter: str) -> str:
+        """查詢公司-季度的關鍵財務數據"""
+        if not settings.get("financial_facts.include_in_prompt", True):
+            return ""
+        
+        format_financial_facts = getattr(vector_store, "format_financial_facts", None)
+        if not format_financial_facts:
+            return ""
+        
+        try:
+            metrics = settings.get("financial_facts.prompt_metrics", ["revenue", "operating_income", "net_income"])
+            return format_financial_facts(company, quarter, metrics)
+        except Exception as e:
+            logger.warning(f"查詢財務數據時發生錯誤: {e}")
+            return ""
     
     def enhanced_rag_process(self, query: str, vector_store, company_filter: str, quarter_filter: str, query_keywords_en: str) -> str:
         """RAG處理，支援公司和季度篩選"""
+        self._reset_last_stats()
         try:
             # 擴展多語言關鍵詞
             financial_keywords = [
@@ -44,95 +161,42 @@ class RAGAnalyzer:
             # 檢查查詢類型
             all_keywords = financial_keywords + strategy_keywords + risk_keywords
             needs_table_data = any(keyword.lower() in query.lower() for keyword in all_keywords)
+            needs_financial_facts = any(keyword.lower() in query.lower() for keyword in financial_keywords)
             
-            # 搜尋設定
-            search_limit = settings.get("vector_search.search_limit", 15)
-            backup_search_limit = settings.get("vector_search.backup_search_limit", 25)
-            universal_search_limit = settings.get("vector_search.universal_search_limit", 25)
+            # 建立檢索計劃，所有子查詢一次批次檢索
+            query_texts, limits = self._build_retrieval_plan(query, query_keywords_en)
             
-            # 第一次搜索
-            results = vector_store.search_similar_enhanced(
-                query, 
+            results = vector_store.search_similar_multi(
+                query_texts,
+                limits,
                 company_filter=company_filter,
                 quarter_filter=quarter_filter,
-                limit=search_limit,
                 prioritize_tables=needs_table_data
             )
             
-            # 如果結果不足，進行第二次搜索
-            if len(results) < search_limit:
-                logger.info("第一次搜索結果不足，進行關鍵詞搜索")
-                chinese_terms = re.findall(r'[\u4e00-\u9fff]{2,}', query)
-                english_terms = re.findall(r'[a-zA-Z]{3,}', query)
-                korean_terms = re.findall(r'[\uac00-\ud7af]{2,}', query)
-                stop_words = {"用", "繁體中文", "總結", "條列式", "呈現", "請", "提供", "具體", "詳細", "分析"}
-                key_terms = [term for term in chinese_terms + english_terms + korean_terms if term not in stop_words]
-                simplified_query = " ".join(key_terms[:5])
-                
-                backup_results = vector_store.search_similar_enhanced(
-                    simplified_query,
-                    company_filter=company_filter,
-                    quarter_filter=quarter_filter,
-                    limit=backup_search_limit,
-                    prioritize_tables=needs_table_data
-                )
-                
-                # 合併結果並去重
-                existing_texts = {r['text'][:100] for r in results}
-                for r in backup_results:
-                    if r['text'][:100] not in existing_texts:
-                        results.append(r)
-                        existing_texts.add(r['text'][:100])
-            
-            # 如果還是不足，使用英文關鍵詞搜索
-            if len(results) < 20 and query_keywords_en:
-                logger.info("進行英文關鍵詞搜索")
-                en_keywords = query_keywords_en.split(',')[:8]
-                en_query = ' '.join([kw.strip() for kw in en_keywords])
-                
-                general_results = vector_store.search_similar_enhanced(
-                    en_query,
-                    company_filter=company_filter,
-                    quarter_filter=quarter_filter,
-                    limit=20,
-                    prioritize_tables=needs_table_data
-                )
-                
-                existing_texts = {r['text'][:100] for r in results}
-                for r in general_results:
-                    if r['text'][:100] not in existing_texts:
-                        results.append(r)
-                        existing_texts.add(r['text'][:100])
-            
-            # 通用搜索
-            if len(results) < 15:
-                logger.info("進行通用搜索")
-                universal_query = "매출 매출액 세전이익 영업이익 순이익 revenue profit"
-                
-                universal_results = vector_store.search_similar_enhanced(
-                    universal_query,
-                    company_filter=company_filter,
-                    quarter_filter=quarter_filter,
-                    limit=universal_search_limit,
-                    prioritize_tables=needs_table_data
-                )
-                
-                results.extend(universal_results)
-            
             if not results:
                 return "無法找到相關資訊"
             
-            # 限制最終結果數量
-            results = results[:30]
+            # 摘要模式：相似度最高的前幾個塊使用原文，其餘使用預先產生的摘要
+            summary_mode = settings.get("analysis_settings.context_mode", "raw") == "summary"
+            raw_top_n = settings.get("analysis_settings.summary_raw_top_n", 1)
             
             # 整理搜索結果
             contexts = []
             page_references = set()
             table_count = 0
+            table_chars = 0
             ocr_content_count = 0
+            summary_count = 0
+            context_chars = 0
             
             for i, result in enumerate(results):
                 chunk_text = result['text']
+                use_summary = summary_mode and i >= raw_top_n and bool(result.get('summary'))
+                if use_summary:
+                    chunk_text = self._format_chunk_summary(result)
+                    summary_count += 1
+                context_chars += len(chunk_text)
                 metadata = result.get('metadata', {})
                 score = result.get('score', 0)
                 has_structured_data = metadata.get('has_structured_data', False)
@@ -140,6 +204,7 @@ class RAGAnalyzer:
                 
                 if has_structured_data:
                     table_count += 1
+                    table_chars += len(chunk_text)
                 
                 if is_ocr_content:
                     ocr_content_count += 1
@@ -160,6 +225,8 @@ class RAGAnalyzer:
                     content_type = "表格數據"
                 else:
                     content_type = "文本內容"
+                if use_summary:
+                    content_type += "摘要"
                 
                 context_info = f"=== {content_type} {i+1} (相似度: {score:.3f}) ===\n{chunk_text}"
                 contexts.append(context_info)
@@ -169,6 +236,13 @@ class RAGAnalyzer:
             # 合併上下文
             combined_context = '\n\n'.join(contexts)
             
+            search_stats = getattr(vector_store, "last_search_stats", {}) or {}
+            logger.info(
+                f"表格內容佔上下文 {table_chars / context_chars if context_chars else 0:.1%}"
+                f"（{table_count}/{len(results)} 個塊，{summary_count} 個使用摘要），"
+                f"檢索耗時 {search_stats.get('latency_ms', 'N/A')} ms"
+            )
+            
             # 控制上下文長度
             max_context_length = settings.get("vector_search.max_context_length", 300000)
             if len(combined_context) > max_context_length:
@@ -176,64 +250,39 @@ class RAGAnalyzer:
             
             page_ref_text = ", ".join(sorted(page_references)) if page_references else "未找到明確頁碼"
             
-            # 提示詞
-            llm_prompt = f"""
+            # 財報表格中的關鍵財務數據（精確數值，不需傳送整個表格）
+            facts_text = self._build_facts_section(vector_store, company_filter, quarter_filter) if needs_financial_facts else ""
+            facts_section = f"\n財報表格關鍵財務數據（請優先引用以下精確數值）：\n{facts_text}\n" if facts_text else ""
+            
+            # 提示詞：固定的系統訊息與分析要求在前，每次請求的上下文在後，以利供應端提示快取
+            llm_prompt = ANALYSIS_INSTRUCTIONS + facts_section + f"""
 財報內容分析 (包含 {table_count} 個表格數據段落, {ocr_content_count} 個OCR提取段落)：
 {combined_context}
 
 分析任務：{query}
 
 參考頁面：{page_ref_text}
-
-分析要求：
-- 按照分析任務裡的項目去撰寫內容
-- **對於英文財報，請特別關注以下項目**：
-  * "Revenue"、"Total Revenue"、"Net Revenue" = 總營收
-  * "Operating Income" = 營業利益  
-  * "Net Income" = 淨利
-  * "Three months ended" = 當季三個月數據
-- **營收數據優先級**：
-  * 第一優先：使用 "Three months ended" 的當季數據（適用於季報分析）
-  * 第二優先：使用年度數據 "Year ended" 或 "For the year ended"（適用於年報分析）
-  * **盡量避免使用**：累計數據（如 Six months ended、Nine months ended等）
-- 若是營收與產品（部門）相關分析任務，優先使用表格中的具體數字進行分析，若無表格則使用內文中提及的數字進行分析
-- 若是部門或產品名稱則使用原文，不需翻譯
-- **重要1：引用數據與財報內文時必須標註頁碼，格式為 (p.X)（括號一定要使用半形括號）**
-- **重要2：若找不到相關內容時使用「無明確提及」作為答案，不用添加額外的推論**
-- **重要3：直接輸出純文字內容，且分析內容前不需要有任何前導標題（如：XXXX年XX季度公司概況等）**
-- **重要4：米字號使用規則**
-  * 在重要的**數字、金額、百分比、營收數據、獲利數字**等關鍵財務數據前後添加兩個米字號
-  * 在重要的**公司策略、風險評估結論、關鍵業務變化**等重要資訊前後添加兩個米字號
-  * **不要**在以下內容添加米字號：
-    - 分析任務中的主要標題（如：1. 綜合營收與獲利、2. 部門表現等）
-    - 分析任務中的副標題（如：(1) 總營收、(2) 服務收入等）
-    - 一般性的描述文字和過渡語句
-    - 頁數
-    - 無明確提及
-- 分析應該結構化且簡明扼要、易於理解
-- 用繁體中文回答，字數控制在 300 字左右
-
-米字號使用範例：
-正確：「總營收達到**750億韓元**，較去年同期成長**15%**」
-正確：「公司計劃在**2024年推出5款新遊戲**，重點布局**全球市場**」
-錯誤：「**1. 綜合營收與獲利**」（主標題不要加）
-錯誤：「**(1) 總營收**」（副標題不要加）
-錯誤：「**(p.X)**」（頁數不要加）
 """
+            self.last_prompt_chars = len(SYSTEM_PROMPT) + len(llm_prompt)
+            with self._usage_lock:
+                self.usage_stats["prompt_chars"] += self.last_prompt_chars
+            logger.info(f"提示長度 {self.last_prompt_chars} 字元（上下文模式: {'summary' if summary_mode else 'raw'}）")
             
             # 使用 GPT-4.1 進行分析
-            response = self.client.chat.completions.create(
-                model=settings.llm_model,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "你是一個專業的財務分析師，擅長分析多種語言的財報，財報內容包含表格數據和OCR提取的圖像內容。你能夠準確解讀財務表格和圖像中的數據，提供精確的數據分析，並將復雜的財務信息轉化為清晰易懂的中文分析報告。在引用數據時，你總是會準確標註頁碼來源。"
-                    },
-                    {"role": "user", "content": llm_prompt}
-                ],
-                max_tokens=settings.get("openai_settings.max_tokens", 1800),
-                temperature=settings.get("openai_settings.temperature", 0.1)
-            )
+            llm_start = time.perf_counter()
+            with metrics.timer("llm_call", company=company_filter):
+                response = self.client.chat.completions.create(
+                    model=settings.llm_model,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": llm_prompt}
+                    ],
+                    max_tokens=settings.get("openai_settings.max_tokens", 1800),
+                    temperature=settings.get("openai_settings.temperature", 0.1)
+                )
+            self.last_llm_ms = round((time.perf_counter() - llm_start) * 1000, 2)
+            
+            self._record_usage(response)
             
             return response.choices[0].message.content
         
@@ -241,6 +290,75 @@ class RAGAnalyzer:
             logger.error(f"RAG 處理時發生錯誤: {e}")
             return "處理查詢時發生錯誤"
     
+    @staticmethod
+    def _format_chunk_summary(result: Dict) -> str:
+        """以預先產生的摘要與關鍵數字取代文檔塊原文"""
+        lines = [result['summary']]
+        key_figures = result.get('key_figures') or []
+        if key_figures:
+            lines.append("關鍵數字：" + "；".join(key_figures))
+        return "\n".join(lines)
+    
+    def _record_usage(self, response):
+        """記錄API用量，包含提示快取命中的 cached_tokens"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(prompt_details, "cached_tokens", 0) or 0
+        
+        self.last_usage = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0
+        }
+        
+        with self._usage_lock:
+            self.usage_stats["calls"] += 1
+            for key, value in self.last_usage.items():
+                self.usage_stats[key] += value
+        for key, value in self.last_usage.items():
+            metrics.increment(f"llm_{key}", value)
+        
+        logger.info(f"API用量: prompt {self.last_usage['prompt_tokens']} tokens (快取命中 {cached_tokens}), completion {self.last_usage['completion_tokens']} tokens")
+    
+    def _build_retrieval_plan(self, query: str, query_keywords_en: str) -> Tuple[List[str], List[int]]:
+        """建立檢索計劃：主查詢、關鍵詞查詢、英文關鍵詞查詢與通用查詢"""
+        # 搜尋設定
+        search_limit = settings.get("vector_search.search_limit", 15)
+        backup_search_limit = settings.get("vector_search.backup_search_limit", 25)
+        universal_search_limit = settings.get("vector_search.universal_search_limit", 25)
+        
+        # 主查詢
+        query_texts = [query]
+        limits = [search_limit]
+        
+        # 關鍵詞查詢
+        chinese_terms = re.findall(r'[\u4e00-\u9fff]{2,}', query)
+        english_terms = re.findall(r'[a-zA-Z]{3,}', query)
+        korean_terms = re.findall(r'[\uac00-\ud7af]{2,}', query)
+        stop_words = {"用", "繁體中文", "總結", "條列式", "呈現", "請", "提供", "具體", "詳細", "分析"}
+        key_terms = [term for term in chinese_terms + english_terms + korean_terms if term not in stop_words]
+        simplified_query = " ".join(key_terms[:5])
+        if simplified_query:
+            query_texts.append(simplified_query)
+            limits.append(backup_search_limit)
+        
+        # 英文關鍵詞查詢
+        if query_keywords_en:
+            en_keywords = query_keywords_en.split(',')[:8]
+            en_query = ' '.join([kw.strip() for kw in en_keywords])
+            query_texts.append(en_query)
+            limits.append(20)
+        
+        # 通用查詢
+        universal_query = "매출 매출액 세전이익 영업이익 순이익 revenue profit"
+        query_texts.append(universal_query)
+        limits.append(universal_search_limit)
+        
+        return query_texts, limits
+    
     def generate_enhanced_business_analysis_with_fallback(self, vector_store, file_name: str, company_name: str, quarter_filter: str) -> Dict:
         """生成商業分析，支援特定公司和季度的篩選"""
         # 判斷報告類型
@@ -313,9 +431,10 @@ class RAGAnalyzer:
             else:
                 display_quarter = "全年" if quarter == "全年" else f"{quarter}季度"
                 query = query_info["query"].format(year=year, quarter=display_quarter)
-
-            time.sleep(1)  # 短暫延遲
-
+            
+            time.sleep(settings.get("analysis_settings.query_delay_seconds", 1))  # 短暫延遲
+            
+            # 各分析類型的問題格式相近，不使用語意答案快取，以免返回其他分析類型的答案
             answer = self.enhanced_rag_process(query, vector_store, company_name, quarter_filter, query_info["keywords_en"])
             results[key] = answer
             
@@ -0,0 +1,139 @@
+"""
+PDF 提取結果快取基準測試
+
+比較重新提取與讀取提取結果快取（ExtractionArtifactStore）的耗時，並量測重新分塊的耗時
+（快取命中後，調整分塊或向量化設定的實驗只需重新分塊與向量化）：
+1. extract：PyMuPDF 文字、表格與圖像提取（指定 --pdf 時量測實際檔案，否則以合成內容模擬並略過）
+2. put：保存全文、各頁位置與表格（安裝 pyarrow 時為 Arrow IPC，否則為 JSON）
+3. get：以記憶體映射讀取全文與所有表格
+4. read_page：只讀取單一頁的文字
+5. rechunk：以快取的全文重新分塊
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.artifact_store_benchmark --pages 200 --tables 60
+    python -m benchmarks.artifact_store_benchmark --pdf 財報.pdf
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from models import artifact_store
+from models.artifact_store import ExtractionArtifactStore
+from processors.chunker import split_text
+from benchmarks.text_compression_benchmark import build_chunk, TABLE_ROWS
+
+def synthetic_extraction(pages: int, tables: int, chunk_chars: int, seed: int) -> dict:
+    """產生與 PDFProcessor 輸出格式相同的合成提取結果"""
+    rng = random.Random(seed)
+    parts = []
+    for page in range(1, pages + 1):
+        body = build_chunk(rng, chunk_chars, page).split("\n", 1)[1]
+        parts.append(f"\n{'=' * 50}\n[PAGE {page}]\n{'=' * 50}\n{body}")
+    
+    table_list = []
+    for index in range(tables):
+        rows = [[row] + [f"{rng.uniform(10, 9000):,.1f}" for _ in range(4)] for row in rng.sample(TABLE_ROWS, 6)]
+        dataframe = pd.DataFrame(rows, columns=["項目", "Q1", "Q2", "Q3", "Q4"])
+        table_list.append({"dataframe": dataframe, "page": index % pages + 1, "text": dataframe.to_string(index=False), "type": "structured_table"})
+    
+    text = "\n".join(parts) + "\n\n=== 結構化表格資料 ===\n" + "\n".join(table["text"] for table in table_list)
+    return {"text": text, "total_pages": pages, "tables": table_list, "images": []}
+
+def pdf_extraction(path: str):
+    """以 PyMuPDF 實際提取檔案，返回 (提取結果, 耗時秒數)"""
+    from processors.pdf_processor import PDFProcessor
+    processor = PDFProcessor()
+    start = time.perf_counter()
+    text, total_pages = processor.read_pdf_text_extraction(path)
+    seconds = time.perf_counter() - start
+    return {"text": text, "total_pages": total_pages, "tables": processor.current_tables, "images": processor.current_images}, seconds
+
+def timed(function, repeats: int):
+    """執行 repeats 次，返回最後一次的結果與每次耗時的中位數（毫秒）"""
+    durations, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return result, round(float(np.median(durations)), 3)
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def run(pages: int, tables: int, chunk_chars: int, pdf: str, repeats: int, seed: int) -> dict:
+    if pdf:
+        result, extract_seconds = pdf_extraction(pdf)
+        with open(pdf, "rb") as file:
+            sha256 = hashlib.sha256(file.read()).hexdigest()
+    else:
+        result, extract_seconds = synthetic_extraction(pages, tables, chunk_chars, seed), None
+        sha256 = hashlib.sha256(result["text"].encode("utf-8")).hexdigest()
+    
+    directory = tempfile.mkdtemp(prefix="insight_artifacts_")
+    try:
+        store = ExtractionArtifactStore(directory)
+        path, put_ms = timed(lambda: store.put(sha256, False, None, result), repeats)
+        cached, get_ms = timed(lambda: store.get(sha256, False), repeats)
+        middle_page = max(1, result["total_pages"] // 2)
+        _, read_page_ms = timed(lambda: store.read_page(sha256, False, middle_page), repeats)
+        chunks, rechunk_ms = timed(lambda: split_text(cached["text"], 6000), repeats)
+        
+        identical = cached["text"] == result["text"] and all(
+            original["dataframe"].astype(str).equals(restored["dataframe"])
+            for original, restored in zip(result["tables"], cached["tables"])
+        )
+        return {
+            "source": pdf or "synthetic",
+            "pages": result["total_pages"],
+            "tables": len(result["tables"]),
+            "text_chars": len(result["text"]),
+            "table_format": "arrow" if artifact_store.pa is not None else "json",
+            "artifact_bytes": directory_bytes(path),
+            "round_trip_identical": identical,
+            "milliseconds": {
+                "extract": round(extract_seconds * 1000, 1) if extract_seconds is not None else None,
+                "put": put_ms,
+                "get": get_ms,
+                "read_page": read_page_ms,
+                "rechunk": rechunk_ms
+            },
+            "chunks": len(chunks)
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 提取結果快取基準測試")
+    parser.add_argument("--pages", type=int, default=200, help="合成內容的頁數")
+    parser.add_argument("--tables", type=int, default=60, help="合成內容的表格數量")
+    parser.add_argument("--chunk-chars", type=int, default=2500, help="每頁的約略字元數")
+    parser.add_argument("--pdf", help="以實際 PDF 檔案量測提取與快取耗時（需要 PyMuPDF）")
+    parser.add_argument("--repeats", type=int, default=5, help="每項量測的重複次數")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.pages, args.tables, args.chunk_chars, args.pdf, args.repeats, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    
+    if not report["round_trip_identical"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Insight 效能基準測試套件
+
+以合成多語財報 PDF（benchmarks/synthetic_pdf.py）與本地資料庫（mongomock 或 --mongo-uri 指定的本地 MongoDB）
+離線量測處理流程各階段，輸出可跨版本比較的 JSON 報告：
+1. extraction：PDFProcessor.read_pdf_text_extraction 的開檔、逐頁文字提取與 find_tables 表格偵測耗時，
+   並檢查表格頁、掃描頁（沒有文字層）與韓文、中文文字是否正確提取
+2. chunking：PageChunkingStrategy（文字提取格式）與 OCRMarkerChunkingStrategy（同內容轉為 OCR 批次格式）的分塊耗時
+3. embedding：不同批次大小的向量編碼吞吐量（預設為離線雜湊向量器，--model 指定本地 SentenceTransformer 模型）
+4. search：search_similar_enhanced 在 1k～1M 文檔塊下的冷啟動（候選塊快取未命中）與熱快取延遲
+
+search 的文檔塊以隨機單位向量直接寫入資料庫（不逐塊編碼），只量測讀取候選塊與評分的耗時；
+mongomock 將所有文件保存在記憶體中，100k 以上的文檔塊建議以 --mongo-uri 指定本地 MongoDB。
+指定 --baseline 時與先前的報告比較各項耗時，列出比值（大於 1 表示變慢）。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.benchmark_suite --output benchmark_report.json
+    python -m benchmarks.benchmark_suite --pages 20 100 --chunks 1000 10000 100000 --mongo-uri mongodb://localhost:27017
+    python -m benchmarks.benchmark_suite --baseline benchmark_report.json --output benchmark_report_new.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from config.settings import settings
+from utils.metrics import metrics
+from processors.pdf_processor import PDFProcessor
+from processors.chunker import PageChunkingStrategy, OCRMarkerChunkingStrategy
+from models.vector_store import EnhancedMongoDBVectorStore
+from benchmarks.common import create_client, percentile
+from benchmarks.multi_vector_benchmark import HashingEmbedder
+from benchmarks.synthetic_pdf import build_report
+
+DATABASE_NAME = "insight_benchmark_suite"
+PAGE_SPLIT_PATTERN = re.compile(r"\n={50}\n\[PAGE (\d+)\]\n={50}\n")
+HANGUL_PATTERN = re.compile(r"[가-힣]")
+CJK_PATTERN = re.compile(r"[一-鿿]")
+QUERIES = ["營收與營業利益的季度變化", "매출 성장 요인", "operating margin guidance by region"]
+
+def max_rss_mb() -> float:
+    """本程序至今的最大常駐記憶體（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+def to_ocr_format(text: str, batch_size: int) -> str:
+    """將文字提取結果（[PAGE n] 標記）轉為 OCR 批次格式（[PAGES n-m] 標記），頁面內容不變"""
+    parts = PAGE_SPLIT_PATTERN.split(text)
+    pages = [(int(parts[index]), parts[index + 1]) for index in range(1, len(parts), 2)]
+    separator = "=" * 50
+    blocks = ["OCR 提取結果"]
+    for start in range(0, len(pages), batch_size):
+        batch = pages[start:start + batch_size]
+        first, last = batch[0][0], batch[-1][0]
+        page_info = f"{first}-{last}" if last > first else str(first)
+        blocks.append(f"\n{separator}\n[PAGES {page_info}]\n{separator}\n" + "\n".join(body for _, body in batch))
+    return "".join(blocks)
+
+def run_extraction(directory: str, page_counts, seed: int):
+    """量測 PDF 文字與表格提取，返回 (報告, 最大頁數財報的提取文字)"""
+    cases, largest_text = {}, ""
+    processor = PDFProcessor()
+    for pages in page_counts:
+        path = os.path.join(directory, f"SynthCo_{pages}p.pdf")
+        expected = build_report(path, "SynthCo", "2025_Q1", pages, seed)
+        
+        metrics.reset()
+        start = time.perf_counter()
+        text, total_pages = processor.read_pdf_text_extraction(path, max_pages=None)
+        seconds = time.perf_counter() - start
+        stages = metrics.summary()["stages"]
+        
+        page_texts = dict(
+            (int(number), body.split("\n\n=== ")[0])
+            for number, body in zip(*[iter(PAGE_SPLIT_PATTERN.split(text)[1:])] * 2)
+        )
+        table_pages = sorted({table["page"] for table in processor.current_tables})
+        empty_pages = sorted(number for number, body in page_texts.items() if not body.strip())
+        missing_facts = [
+            item["page"] for item in expected["facts"]
+            if not item["image_only"] and item["code"] not in page_texts.get(item["page"], "")
+        ]
+        cases[str(pages)] = {
+            "pages": total_pages,
+            "pdf_bytes": expected["bytes"],
+            "text_chars": len(text),
+            "seconds": round(seconds, 3),
+            "pages_per_second": round(total_pages / seconds, 1) if seconds else None,
+            "stage_seconds": {stage: stages[stage]["seconds"] for stage in ("pdf_open", "text_extraction", "find_tables") if stage in stages},
+            "tables": len(processor.current_tables),
+            "table_pages_expected": len(expected["table_pages"]),
+            "table_pages_found": len(set(table_pages) & set(expected["table_pages"])),
+            "image_only_pages": len(expected["image_only_pages"]),
+            "image_only_pages_empty": empty_pages == expected["image_only_pages"],
+            "missing_facts": len(missing_facts),
+            "hangul_chars": len(HANGUL_PATTERN.findall(text)),
+            "cjk_chars": len(CJK_PATTERN.findall(text))
+        }
+        if len(text) > len(largest_text):
+            largest_text = text
+    
+    return cases, largest_text
+
+def best_of(func, repeat: int):
+    """執行多次並返回最短時間與最後一次的結果"""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def run_chunking(text: str, max_tokens: int, repeat: int) -> dict:
+    """以相同內容比較文字提取格式與 OCR 批次格式的分塊耗時"""
+    cases = {}
+    batch_size = settings.get("ocr_settings.batch_size", 2)
+    for name, strategy, source in (
+        ("page", PageChunkingStrategy(), text),
+        ("ocr_marker", OCRMarkerChunkingStrategy(), to_ocr_format(text, batch_size))
+    ):
+        seconds, chunks = best_of(lambda: strategy.split(source, max_tokens), repeat)
+        megabytes = len(source.encode("utf-8")) / 1024 / 1024
+        cases[name] = {
+            "text_chars": len(source),
+            "chunks": len(chunks),
+            "ms": round(seconds * 1000, 3),
+            "mb_per_second": round(megabytes / seconds, 1) if seconds else None
+        }
+    return cases
+
+def run_embedding(embedder, texts, batch_sizes) -> dict:
+    """各批次大小的編碼吞吐量（batch_size=1 與逐塊向量化相同）"""
+    cases = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for index in range(0, len(texts), batch_size):
+            embedder.encode(texts[index:index + batch_size], convert_to_tensor=False)
+        seconds = time.perf_counter() - start
+        cases[str(batch_size)] = {
+            "texts": len(texts),
+            "seconds": round(seconds, 3),
+            "texts_per_second": round(len(texts) / seconds, 1) if seconds else None
+        }
+    return cases
+
+def seed_chunks(vector_store, chunks: int, companies: int, quarters: int, dims: int, seed: int, batch: int = 5000):
+    """以隨機單位向量寫入合成文檔塊，平均分配至各公司-季度"""
+    rng = np.random.default_rng(seed)
+    groups = [(f"SynthCo{company}", f"2025_Q{quarter + 1}") for company in range(companies) for quarter in range(quarters)]
+    for offset in range(0, chunks, batch):
+        count = min(batch, chunks - offset)
+        embeddings = rng.standard_normal((count, dims)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        documents = []
+        for row, embedding in enumerate(embeddings):
+            index = offset + row
+            company, quarter = groups[index % len(groups)]
+            page = index // len(groups) % 200 + 1
+            documents.append({
+                **vector_store.text_codec.text_fields(f"{company} {quarter} page {page} chunk {index} " + "revenue margin 營收 매출 " * 20),
+                "embedding": embedding.tolist(),
+                "metadata": {
+                    "company_name": company,
+                    "quarter": quarter,
+                    "file_name": f"{company}_{quarter.replace('_', '')}季報.pdf",
+                    "chunk_index": index,
+                    "start_page": str(page),
+                    "end_page": str(page),
+                    "has_structured_data": bool(index % 3 == 0)
+                }
+            })
+        vector_store.collection.insert_many(documents)
+    return groups
+
+def time_searches(vector_store, groups, company_only: bool, queries: int, cold: bool):
+    """依序對各公司-季度查詢，返回每次延遲（ms）與平均候選塊數"""
+    latencies, candidates = [], []
+    for index in range(queries):
+        company, quarter = groups[index % len(groups)]
+        if cold:
+            vector_store.invalidate_candidate_cache()
+        start = time.perf_counter()
+        vector_store.search_similar_enhanced(
+            QUERIES[index % len(QUERIES)], company_filter=company,
+            quarter_filter=None if company_only else quarter, limit=10
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        candidates.append(vector_store.last_search_stats.get("candidates", 0))
+    return latencies, round(sum(candidates) / len(candidates)) if candidates else 0
+
+def run_search(client, embedder, chunk_counts, companies: int, quarters: int, queries: int, seed: int) -> dict:
+    """各文檔塊數量下 search_similar_enhanced 的冷啟動與熱快取延遲"""
+    cases = {}
+    dims = len(np.asarray(embedder.encode("dimension probe", convert_to_tensor=False)).reshape(-1))
+    for chunks in chunk_counts:
+        client.drop_database(DATABASE_NAME)
+        vector_store = EnhancedMongoDBVectorStore(client=client, embedding_model=embedder)
+        start = time.perf_counter()
+        groups = seed_chunks(vector_store, chunks, companies, quarters, dims, seed)
+        seed_seconds = time.perf_counter() - start
+        
+        case = {"seed_seconds": round(seed_seconds, 2)}
+        for scope, company_only in (("company_quarter", False), ("company", True)):
+            scope_groups = list(dict.fromkeys((company, None if company_only else quarter) for company, quarter in groups))
+            cold, candidates = time_searches(vector_store, scope_groups, company_only, queries, cold=True)
+            time_searches(vector_store, scope_groups, company_only, len(scope_groups), cold=False)
+            warm, _ = time_searches(vector_store, scope_groups, company_only, queries, cold=False)
+            case[scope] = {
+                "candidates": candidates,
+                "cold_p50_ms": percentile(cold, 50),
+                "cold_p95_ms": percentile(cold, 95),
+                "warm_p50_ms": percentile(warm, 50),
+                "warm_p95_ms": percentile(warm, 95)
+            }
+        case["max_rss_mb"] = max_rss_mb()
+        cases[str(chunks)] = case
+        vector_store.bulk_writer.close()
+    
+    client.drop_database(DATABASE_NAME)
+    return cases
+
+def flatten_timings(report: dict, prefix: str = "", timed: bool = False) -> dict:
+    """取出報告中的耗時欄位（鍵名或上層鍵名以 seconds 或 ms 結尾），以路徑為鍵"""
+    values = {}
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        key_timed = timed or bool(re.search(r"(^|_)(seconds|ms)$", key))
+        if isinstance(value, dict):
+            values.update(flatten_timings(value, path, key_timed))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key_timed:
+            values[path] = value
+    return values
+
+def compare(report: dict, baseline: dict) -> dict:
+    """與基準報告比較相同項目的耗時（目前 / 基準）"""
+    current, previous = flatten_timings(report["sections"]), flatten_timings(baseline.get("sections", {}))
+    return {
+        path: round(value / previous[path], 2)
+        for path, value in current.items()
+        if previous.get(path)
+    }
+
+def run(page_counts, chunk_counts, batch_sizes, companies: int, quarters: int, queries: int, repeat: int, model_name: str, mongo_uri: str, seed: int) -> dict:
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(model_name)
+    else:
+        embedder = HashingEmbedder()
+    
+    mongodb_settings = settings.config.setdefault("mongodb_settings", {})
+    original_database = mongodb_settings.get("database_name")
+    mongodb_settings["database_name"] = DATABASE_NAME
+    max_tokens = settings.get("vector_search.chunk_max_tokens", 6000)
+    sections = {}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            sections["extraction"], text = run_extraction(directory, page_counts, seed)
+        sections["chunking"] = run_chunking(text, max_tokens, repeat)
+        
+        # 以最大財報的分塊文字為編碼樣本，不足 256 段時重複使用
+        texts = [chunk["text"] for chunk in PageChunkingStrategy().split(text, max_tokens // 4)]
+        texts = (texts * (256 // max(len(texts), 1) + 1))[:max(256, len(texts))]
+        sections["embedding"] = run_embedding(embedder, texts, batch_sizes)
+        sections["search"] = run_search(create_client(mongo_uri), embedder, chunk_counts, companies, quarters, queries, seed)
+    finally:
+        mongodb_settings["database_name"] = original_database
+    
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pymupdf": fitz.VersionBind,
+            "numpy": np.__version__,
+            "database": "mongodb" if mongo_uri else "mongomock"
+        },
+        "config": {
+            "pages": page_counts,
+            "chunks": chunk_counts,
+            "batch_sizes": batch_sizes,
+            "companies": companies,
+            "quarters": quarters,
+            "queries": queries,
+            "chunk_max_tokens": max_tokens,
+            "embedder": model_name or "hashing",
+            "seed": seed
+        },
+        "sections": sections,
+        "max_rss_mb": max_rss_mb()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Insight 效能基準測試套件")
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100], help="合成財報 PDF 頁數")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000], help="檢索測試的文檔塊數量（1000000 建議搭配 --mongo-uri）")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32, 128], help="向量編碼的批次大小")
+    parser.add_argument("--companies", type=int, default=4, help="檢索測試的公司數量")
+    parser.add_argument("--quarters", type=int, default=4, help="檢索測試每家公司的季度數量")
+    parser.add_argument("--queries", type=int, default=30, help="每種篩選條件的查詢次數")
+    parser.add_argument("--repeat", type=int, default=3, help="分塊重複次數（取最短時間）")
+    parser.add_argument("--model", help="本地 SentenceTransformer 模型（預設使用離線雜湊向量器）")
+    parser.add_argument("--mongo-uri", help="本地 MongoDB 連線字串（預設使用 mongomock）")
+    parser.add_argument("--baseline", help="先前的 JSON 報告，比較各項耗時")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(
+        args.pages, args.chunks, args.batch_sizes, args.companies, args.quarters,
+        args.queries, args.repeat, args.model, args.mongo_uri, args.seed
+    )
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            report["compared_to_baseline"] = compare(report, json.load(file))
+    
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+分塊器微基準測試
+
+以合成的長篇年報（常規 [PAGE n] 標記與 OCR [PAGES n-m] 標記兩種格式）
+比較舊版字串累加分割與 processors.chunker 的執行時間，並確認輸出完全相同。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.chunker_benchmark --pages 200 1000 4000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processors.chunker import PageChunkingStrategy, OCRMarkerChunkingStrategy
+
+PARAGRAPHS = [
+    "本公司本季合併營收較去年同期成長，主要受惠於社交博弈產品的穩定表現。",
+    "Total revenue increased year over year, driven by higher average revenue per daily active user.",
+    "經營團隊持續投入新市場拓展與產品優化，並審慎評估匯率與總體經濟風險。",
+    "Adjusted EBITDA margin remained stable as marketing spend was reallocated across titles.",
+]
+
+def build_table(page: int) -> str:
+    """產生一個結構化表格區塊"""
+    rows = "\n".join(f"Revenue | Q{q} | {page * 10 + q:,}" for q in range(1, 5))
+    return f"\n=== 表格 {page}-1 ===\n結構化表格資料\n{rows}\n"
+
+def build_page_body(rng: random.Random, page: int, page_chars: int) -> str:
+    """產生單頁內容，約三分之一的頁面含表格"""
+    parts = []
+    length = 0
+    while length < page_chars:
+        paragraph = rng.choice(PARAGRAPHS)
+        parts.append(paragraph)
+        length += len(paragraph) + 1
+    if page % 3 == 0:
+        parts.append(build_table(page))
+    return "\n".join(parts)
+
+def build_regular_report(pages: int, page_chars: int, seed: int = 0) -> str:
+    """合成常規PDF提取格式的年報文本"""
+    rng = random.Random(seed)
+    return "封面\n" + "".join(
+        f"[PAGE {page}]\n{build_page_body(rng, page, page_chars)}\n\n" for page in range(1, pages + 1)
+    )
+
+def build_ocr_report(pages: int, page_chars: int, batch_size: int = 5, seed: int = 0) -> str:
+    """合成OCR提取格式的年報文本"""
+    rng = random.Random(seed)
+    separator = "=" * 50
+    blocks = ["OCR 提取結果"]
+    for start in range(1, pages + 1, batch_size):
+        end = min(start + batch_size - 1, pages)
+        page_info = f"{start}-{end}" if end > start else str(start)
+        body = "\n".join(build_page_body(rng, page, page_chars) for page in range(start, end + 1))
+        blocks.append(f"\n{separator}\n[PAGES {page_info}]\n{separator}\n{body}")
+    return "".join(blocks)
+
+def legacy_split_regular(text: str, max_tokens: int):
+    """舊版常規分割（字串累加，作為對照）"""
+    chunks = []
+    pages = text.split('[PAGE ')
+    current_chunk = ""
+    current_page_info = []
+    
+    for i, page in enumerate(pages):
+        if not page.strip():
+            continue
+        
+        if i > 0 or page.startswith('[PAGE'):
+            page_content = '[PAGE ' + page if not page.startswith('[PAGE') else page
+        else:
+            page_content = page
+        
+        page_match = re.search(r'\[PAGE (\d+)\]', page_content)
+        page_num = page_match.group(1) if page_match else str(i)
+        
+        has_table = "=== 表格" in page_content or "結構化表格資料" in page_content
+        effective_max_tokens = max_tokens * 1.5 if has_table else max_tokens
+        
+        if len(current_chunk + page_content) > effective_max_tokens:
+            if current_chunk.strip():
+                chunks.append({
+                    'text': current_chunk.strip(),
+                    'pages': current_page_info.copy(),
+                    'start_page': current_page_info[0] if current_page_info else None,
+                    'end_page': current_page_info[-1] if current_page_info else None,
+                    'has_structured_data': "=== 表格" in current_chunk,
+                    'is_ocr_content': False
+                })
+            
+            current_chunk = page_content
+            current_page_info = [page_num]
+        else:
+            current_chunk += page_content
+            current_page_info.append(page_num)
+    
+    if current_chunk.strip():
+        chunks.append({
+            'text': current_chunk.strip(),
+            'pages': current_page_info,
+            'start_page': current_page_info[0] if current_page_info else None,
+            'end_page': current_page_info[-1] if current_page_info else None,
+            'has_structured_data': "=== 表格" in current_chunk,
+            'is_ocr_content': False
+        })
+    
+    return chunks
+
+def legacy_split_ocr(text: str, max_tokens: int):
+    """舊版OCR分割（字串累加，作為對照）"""
+    chunks = []
+    page_pattern = r'\n={50}\n\[PAGES (\d+(?:-\d+)?)\]\n={50}\n'
+    page_splits = re.split(page_pattern, text)
+    
+    current_chunk = ""
+    current_page_info = []
+    
+    i = 0
+    while i < len(page_splits):
+        if i == 0:
+            if page_splits[i].strip():
+                content = page_splits[i].strip()
+                if len(content) < max_tokens:
+                    current_chunk = content
+            i += 1
+            continue
+        
+        page_info = page_splits[i]
+        i += 1
+        
+        if i < len(page_splits):
+            page_content = page_splits[i].strip()
+            
+            if '-' in page_info:
+                start_page, end_page = page_info.split('-')
+                pages_list = list(range(int(start_page), int(end_page) + 1))
+            else:
+                pages_list = [int(page_info)]
+            
+            test_content = current_chunk + f"\n[PAGES {page_info}]\n" + page_content
+            
+            if len(test_content) > max_tokens and current_chunk.strip():
+                chunks.append({
+                    'text': current_chunk.strip(),
+                    'pages': current_page_info.copy(),
+                    'start_page': str(current_page_info[0]) if current_page_info else None,
+                    'end_page': str(current_page_info[-1]) if current_page_info else None,
+                    'has_structured_data': "=== 表格" in current_chunk,
+                    'is_ocr_content': True
+                })
+                
+                current_chunk = f"[PAGES {page_info}]\n" + page_content
+                current_page_info = pages_list.copy()
+            else:
+                if current_chunk:
+                    current_chunk += f"\n[PAGES {page_info}]\n" + page_content
+                else:
+                    current_chunk = f"[PAGES {page_info}]\n" + page_content
+                current_page_info.extend(pages_list)
+        
+        i += 1
+    
+    if current_chunk.strip():
+        chunks.append({
+            'text': current_chunk.strip(),
+            'pages': current_page_info,
+            'start_page': str(current_page_info[0]) if current_page_info else None,
+            'end_page': str(current_page_info[-1]) if current_page_info else None,
+            'has_structured_data': "=== 表格" in current_chunk,
+            'is_ocr_content': True
+        })
+    
+    return chunks
+
+def best_of(func, repeat: int):
+    """執行多次並返回最短時間與最後一次的結果"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def run(page_counts, page_chars: int, max_tokens: int, repeat: int) -> dict:
+    cases = []
+    for pages in page_counts:
+        for fmt, build, legacy, strategy in (
+            ("regular", build_regular_report, legacy_split_regular, PageChunkingStrategy()),
+            ("ocr", build_ocr_report, legacy_split_ocr, OCRMarkerChunkingStrategy()),
+        ):
+            text = build(pages, page_chars)
+            legacy_seconds, legacy_chunks = best_of(lambda: legacy(text, max_tokens), repeat)
+            new_seconds, new_chunks = best_of(lambda: strategy.split(text, max_tokens), repeat)
+            cases.append({
+                "format": fmt,
+                "pages": pages,
+                "text_chars": len(text),
+                "chunks": len(new_chunks),
+                "legacy_ms": round(legacy_seconds * 1000, 3),
+                "chunker_ms": round(new_seconds * 1000, 3),
+                "speedup": round(legacy_seconds / new_seconds, 2) if new_seconds else None,
+                "identical": legacy_chunks == new_chunks
+            })
+    
+    return {
+        "page_chars": page_chars,
+        "max_tokens": max_tokens,
+        "repeat": repeat,
+        "all_identical": all(case["identical"] for case in cases),
+        "cases": cases
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="分塊器微基準測試")
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 1000, 4000], help="合成年報頁數")
+    parser.add_argument("--page-chars", type=int, default=2500, help="每頁約略字元數")
+    parser.add_argument("--max-tokens", type=int, default=6000, help="分塊上限（與 vector_search.chunk_max_tokens 相同）")
+    parser.add_argument("--repeat", type=int, default=3, help="每個案例重複次數（取最短時間）")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.pages, args.page_chars, args.max_tokens, args.repeat)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    
+    if not report["all_identical"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+基準測試共用的輔助函式
+
+只依賴 pymongo 與 numpy，各基準測試可直接引用而不會載入 PyMuPDF 等其他基準測試的相依套件。
+"""
+import sys
+
+import numpy as np
+from pymongo import MongoClient
+
+def create_client(mongo_uri: str):
+    """建立本地 MongoDB 或 mongomock 連線"""
+    if mongo_uri:
+        return MongoClient(mongo_uri)
+    
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("需要安裝 mongomock（pip install mongomock），或以 --mongo-uri 指定本地 MongoDB")
+    return mongomock.MongoClient()
+
+def percentile(values, q: float) -> float:
+    return round(float(np.percentile(values, q)), 3) if values else None
@@ -0,0 +1,112 @@
+"""
+重複財報檔案偵測基準測試與回歸檢查
+
+以合成的首頁文字（不需 PDF）檢查 DuplicateDetector 的判定，並量測比對耗時：
+1. 內容相同（SHA-256 相同）的檔案連結至代表檔案
+2. 同一期間重新存檔的報告（檔名多了空白、首頁文字幾乎相同）視為近似重複
+3. 同一公司不同季度的報告首頁版型幾乎相同，但絕不可視為重複
+4. 不同公司資料夾中的相同檔案不連結
+任一檢查失敗時以非零狀態結束。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.duplicate_detection_benchmark --companies 5 --years 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.duplicate_detector import DuplicateDetector
+
+FIRST_PAGE_TEMPLATE = (
+    "{company} Quarterly Report\n"
+    "For the three months ended {period}\n"
+    "Consolidated Statements of Operations (unaudited)\n"
+    "Revenue, cost of revenue, research and development, sales and marketing, general and administrative\n"
+    "Forward-looking statements: this report contains statements that involve risks and uncertainties. "
+    "Actual results could differ materially from those anticipated in these statements.\n"
+)
+PERIOD_ENDINGS = {"Q1": "March 31", "Q2": "June 30", "Q3": "September 30", "Q4": "December 31"}
+PAGE_COUNT = 40
+
+def build_files(companies: int, years: int) -> tuple:
+    """產生檔案清單與首頁文字，返回 (files, 首頁文字, 預期重複 {檔案鍵: 代表檔案鍵})
+
+    每家公司每季一份報告（首頁只差在期間），另外加入一份相同內容的複本與一份重新存檔的報告。
+    """
+    files, pages, expected = [], {}, {}
+    
+    def add(company: str, file_name: str, sha256: str, text: str):
+        key = f"{company}/{file_name}"
+        files.append({"key": key, "path": key, "company_name": company, "file_name": file_name, "sha256": sha256})
+        pages[key] = text
+        return key
+    
+    for company_index in range(companies):
+        company = f"SynthCo{company_index}"
+        for year in range(2024 - years + 1, 2025):
+            for quarter, ending in PERIOD_ENDINGS.items():
+                text = FIRST_PAGE_TEMPLATE.format(company=company, period=f"{ending}, {year}")
+                add(company, f"{company}_{year}{quarter}季報.pdf", f"{company}-{year}{quarter}", text)
+        
+        latest = f"{company}_2024Q4季報.pdf"
+        latest_text = pages[f"{company}/{latest}"]
+        copy_key = add(company, f"{company}_2024Q4季報 (1).pdf", f"{company}-2024Q4", latest_text)
+        expected[copy_key] = f"{company}/{latest}"
+        resaved_key = add(company, f"{company}_2024Q4季報 .pdf", f"{company}-2024Q4-resaved", latest_text.replace("(unaudited)", "(unaudited) "))
+        expected[resaved_key] = f"{company}/{latest}"
+    
+    # 不同公司資料夾中的相同檔案：只記錄警告
+    add("OtherCo", "SynthCo0_2024Q4季報.pdf", "SynthCo0-2024Q4", pages["SynthCo0/SynthCo0_2024Q4季報.pdf"])
+    return files, pages, expected
+
+def run(companies: int, years: int) -> dict:
+    files, pages, expected = build_files(companies, years)
+    reads = []
+    
+    def read_first_page(path: str):
+        reads.append(path)
+        return pages[path], PAGE_COUNT
+    
+    detector = DuplicateDetector(read_first_page_func=read_first_page)
+    detector.near_duplicates, detector.threshold = True, 0.9
+    start = time.perf_counter()
+    duplicates = detector.find_duplicates(files)
+    seconds = time.perf_counter() - start
+    
+    found = {key: duplicate["duplicate_of"] for key, duplicate in duplicates.items()}
+    cross_period = [
+        key for key, canonical in found.items()
+        if key.split("_")[-1][:6] != canonical.split("_")[-1][:6]
+    ]
+    return {
+        "files": len(files),
+        "first_page_reads": len(reads),
+        "detect_ms": round(seconds * 1000, 3),
+        "duplicates": found,
+        "missing": sorted(set(expected) - set(found)),
+        "unexpected": sorted(set(found) - set(expected)),
+        "cross_period": sorted(cross_period),
+        "passed": found == expected,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="重複財報檔案偵測基準測試與回歸檢查")
+    parser.add_argument("--companies", type=int, default=3)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--output", help="將結果寫入 JSON 檔案")
+    args = parser.parse_args()
+    
+    report = run(args.companies, args.years)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if not report["passed"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+分散式向量化工作佇列基準測試
+
+以合成財報檔案（不需實際 PDF）與離線雜湊向量器，依不同的工作程序數量處理同一批工作，
+量測每種工作程序數量的總耗時與吞吐量（檔案/分鐘、文檔塊/秒），並檢查：
+1. 每個工作只被完成一次（沒有重複領取）
+2. 工作程序中斷（領取後不再送出心跳）時，租約到期的工作會重新排入佇列並由其他工作程序完成
+
+提取耗時以 --extract-latency 模擬（PDF 解析與 OCR 的等待時間）。
+未指定 --mongo-uri 時以 mongomock 在同一程序中以執行緒模擬工作程序；
+指定本地 MongoDB 時每個工作程序為獨立的子程序（各自的資料庫連線與向量器），與正式部署相同。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.ingest_queue_benchmark --files 24 --workers 1 2 4
+    python -m benchmarks.ingest_queue_benchmark --mongo-uri mongodb://localhost:27017 --files 48 --workers 1 2 4 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymongo import MongoClient
+
+from config.settings import settings
+from models.vector_store import EnhancedMongoDBVectorStore
+from models.job_queue import JobQueue
+from ingest_worker import IngestWorker
+from benchmarks.common import create_client
+from benchmarks.multi_vector_benchmark import HashingEmbedder
+from benchmarks.text_compression_benchmark import build_chunk
+
+DATABASE_NAME = "insight_ingest_queue_benchmark"
+
+class SyntheticIngestWorker(IngestWorker):
+    """以合成文字取代 PDF 提取的工作程序"""
+    def __init__(self, *args, pages: int = 20, chunk_chars: int = 1500, extract_latency: float = 0.2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pages = pages
+        self.chunk_chars = chunk_chars
+        self.extract_latency = extract_latency
+    
+    def extract(self, item):
+        rng = random.Random(item["sha256"])
+        time.sleep(self.extract_latency)
+        text = "\n".join(build_chunk(rng, self.chunk_chars, page + 1) for page in range(self.pages))
+        return {"text": text, "total_pages": self.pages, "use_ocr": False, "tables": [], "images_extracted": 0}
+
+def use_benchmark_database():
+    """將設定的資料庫名稱改為基準測試專用的資料庫，返回原本的名稱"""
+    mongodb_settings = settings.config.setdefault("mongodb_settings", {})
+    original_database = mongodb_settings.get("database_name")
+    mongodb_settings["database_name"] = DATABASE_NAME
+    return original_database
+
+def enqueue_synthetic(queue: JobQueue, files: int, quarters: int = 4):
+    """為每個合成檔案加入一個工作"""
+    for index in range(files):
+        company = f"Company{index // quarters}"
+        quarter = f"2025_Q{index % quarters + 1}"
+        file_name = f"{company}_{quarter}_Earnings.pdf"
+        queue.enqueue(f"{company}_{file_name}", f"synthetic-{index}", {
+            "path": os.path.join("synthetic", file_name),
+            "company_name": company,
+            "file_name": file_name,
+            "year": "2025",
+            "quarter": quarter,
+            "sha256": f"synthetic-{index}"
+        })
+
+def worker_process(mongo_uri: str, options: dict):
+    """子程序中的工作程序：建立獨立的資料庫連線與向量器"""
+    use_benchmark_database()
+    vector_store = EnhancedMongoDBVectorStore(client=MongoClient(mongo_uri), embedding_model=HashingEmbedder())
+    queue = JobQueue(vector_store.db[settings.job_queue_collection_name], lease_seconds=options["lease_seconds"])
+    SyntheticIngestWorker(vector_store, queue, poll_interval=0.2, **options["worker"]).run(exit_when_empty=True)
+    vector_store.bulk_writer.close()
+
+def run_workers(client, mongo_uri: str, workers: int, options: dict):
+    """以指定數量的工作程序處理佇列直到清空，返回總耗時"""
+    start = time.perf_counter()
+    if mongo_uri:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=worker_process, args=(mongo_uri, options)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        vector_store = EnhancedMongoDBVectorStore(client=client, embedding_model=HashingEmbedder())
+        queue = JobQueue(vector_store.db[settings.job_queue_collection_name], lease_seconds=options["lease_seconds"])
+        threads = [
+            threading.Thread(target=SyntheticIngestWorker(vector_store, queue, poll_interval=0.2, **options["worker"]).run, args=(True,))
+            for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        vector_store.bulk_writer.close()
+    return time.perf_counter() - start
+
+def measure(client, mongo_uri: str, files: int, workers: int, options: dict) -> dict:
+    """清空資料庫後以指定數量的工作程序處理 files 個工作"""
+    client.drop_database(DATABASE_NAME)
+    queue = JobQueue(client[DATABASE_NAME][settings.job_queue_collection_name], lease_seconds=options["lease_seconds"])
+    enqueue_synthetic(queue, files)
+    
+    elapsed = run_workers(client, mongo_uri, workers, options)
+    jobs = list(queue.collection.find({}, {"status": 1, "attempts": 1, "worker_id": 1}))
+    done = sum(1 for job in jobs if job["status"] == "done")
+    chunks = sum(worker["chunks"] for worker in queue.worker_report())
+    return {
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 2),
+        "jobs_done": done,
+        "chunks": chunks,
+        "jobs_per_minute": round(done * 60 / elapsed, 1),
+        "chunks_per_second": round(chunks / elapsed, 1),
+        "duplicate_claims": sum(job.get("attempts", 0) for job in jobs) - len(jobs),
+        "jobs_per_worker": sorted(worker["jobs"] for worker in queue.worker_report())
+    }
+
+def lease_recovery(client, mongo_uri: str, options: dict) -> dict:
+    """模擬工作程序中斷：領取一個工作後不再送出心跳，確認租約到期後由其他工作程序完成"""
+    client.drop_database(DATABASE_NAME)
+    lease_seconds = 1.0
+    queue = JobQueue(client[DATABASE_NAME][settings.job_queue_collection_name], lease_seconds=lease_seconds)
+    enqueue_synthetic(queue, 4)
+    crashed_job = queue.claim("crashed-worker")
+    
+    elapsed = run_workers(client, mongo_uri, 1, dict(options, lease_seconds=lease_seconds))
+    job = queue.collection.find_one({"_id": crashed_job["_id"]})
+    return {
+        "lease_seconds": lease_seconds,
+        "crashed_job": crashed_job["_id"],
+        "final_status": job["status"],
+        "completed_by": job.get("worker_id"),
+        "attempts": job.get("attempts"),
+        "recovered": job["status"] == "done" and job.get("worker_id") != "crashed-worker",
+        "elapsed_seconds": round(elapsed, 2)
+    }
+
+def run(files: int, worker_counts, pages: int, chunk_chars: int, extract_latency: float, mongo_uri: str) -> dict:
+    original_database = use_benchmark_database()
+    client = create_client(mongo_uri)
+    options = {
+        "lease_seconds": 60,
+        "worker": {"pages": pages, "chunk_chars": chunk_chars, "extract_latency": extract_latency}
+    }
+    try:
+        results = [measure(client, mongo_uri, files, workers, options) for workers in worker_counts]
+        baseline = results[0]["elapsed_seconds"]
+        for result in results:
+            result["speedup"] = round(baseline / result["elapsed_seconds"], 2)
+        
+        report = {
+            "backend": "mongodb (processes)" if mongo_uri else "mongomock (threads)",
+            "files": files,
+            "pages_per_file": pages,
+            "extract_latency_seconds": extract_latency,
+            "throughput": results,
+            "lease_recovery": lease_recovery(client, mongo_uri, options)
+        }
+        client.drop_database(DATABASE_NAME)
+        return report
+    finally:
+        settings.config["mongodb_settings"]["database_name"] = original_database
+
+def main():
+    parser = argparse.ArgumentParser(description="分散式向量化工作佇列基準測試")
+    parser.add_argument("--files", type=int, default=24, help="工作（檔案）數量")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="要比較的工作程序數量")
+    parser.add_argument("--pages", type=int, default=20, help="每個合成檔案的頁數")
+    parser.add_argument("--chunk-chars", type=int, default=1500, help="每頁的約略字元數")
+    parser.add_argument("--extract-latency", type=float, default=0.2, help="模擬的每個檔案提取耗時（秒）")
+    parser.add_argument("--mongo-uri", help="本地 MongoDB 連線字串（預設使用 mongomock 與執行緒）")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.files, args.workers, args.pages, args.chunk_chars, args.extract_latency, args.mongo_uri)
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    
+    if any(result["duplicate_claims"] or result["jobs_done"] != args.files for result in report["throughput"]) \
+            or not report["lease_recovery"]["recovered"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+文檔塊 metadata 正規化大小基準測試
+
+以合成文檔塊比較內嵌檔案層級欄位（舊格式）與正規化後（檔案層級欄位移至 files 集合、以 file_id 參照）
+的 BSON 文檔大小，以及檢索讀取（舊版讀取完整文檔、新版使用 SEARCH_PROJECTION）的傳輸位元組數。
+實際資料庫的集合與索引大小請使用 `python main.py --normalize-metadata` 回報。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.metadata_size_benchmark --files 40 --chunks-per-file 60
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime
+
+import bson
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.vector_store import FILE_LEVEL_FIELDS, SEARCH_PROJECTION
+
+def build_chunks(files: int, chunks_per_file: int, chunk_chars: int, seed: int):
+    """產生舊格式（內嵌檔案層級欄位）的文檔塊"""
+    rng = random.Random(seed)
+    chunks = []
+    for file_index in range(files):
+        file_metadata = {
+            "file_name": f"Company{file_index % 8}_2025_Q{file_index % 4 + 1}_Earnings_Presentation.pdf",
+            "company_name": f"Company{file_index % 8}",
+            "year": "2025",
+            "quarter": f"2025_Q{file_index % 4 + 1}",
+            "total_pages": rng.randint(20, 200),
+            "processing_mode": "pymupdf_enhanced_chunking",
+            "extraction_method": "pymupdf_text_extraction",
+            "tables_extracted": rng.randint(0, 40),
+            "images_extracted": rng.randint(0, 20),
+            "attempt_number": 1,
+            "embedding_model": "paraphrase-multilingual-MiniLM-L12-v2",
+            "embedding_dimensions": 384
+        }
+        for chunk_index in range(chunks_per_file):
+            page = str(chunk_index + 1)
+            metadata = dict(file_metadata)
+            metadata.update({
+                "chunk_index": chunk_index,
+                "total_chunks": chunks_per_file,
+                "chunk_length": chunk_chars,
+                "start_page": page,
+                "end_page": page,
+                "pages_covered": [page],
+                "is_partial_page": False,
+                "has_structured_data": chunk_index % 3 == 0,
+                "is_ocr_content": False,
+                "ingest_version": "0" * 32,
+                "ingest_state": "active"
+            })
+            chunks.append({
+                "_id": ObjectId(),
+                "text": "x" * chunk_chars,
+                "embedding": [rng.uniform(-1, 1) for _ in range(384)],
+                "metadata": metadata,
+                "created_at": datetime(2025, 1, 1)
+            })
+    return chunks
+
+def normalize(chunks):
+    """移除檔案層級欄位並加入 file_id"""
+    file_ids = {}
+    normalized = []
+    for chunk in chunks:
+        key = (chunk["metadata"]["company_name"], chunk["metadata"]["file_name"])
+        file_id = file_ids.setdefault(key, ObjectId())
+        metadata = {k: v for k, v in chunk["metadata"].items() if k not in FILE_LEVEL_FIELDS}
+        metadata["file_id"] = file_id
+        normalized.append(dict(chunk, metadata=metadata))
+    return normalized
+
+def project(doc, projection):
+    """模擬 find 投影（僅支援包含欄位）"""
+    if projection is None:
+        return doc
+    return {key: value for key, value in doc.items() if key == "_id" or projection.get(key)}
+
+def measure(chunks, projection=None) -> dict:
+    sizes = [len(bson.encode(project(chunk, projection))) for chunk in chunks]
+    metadata_sizes = [len(bson.encode(chunk["metadata"])) for chunk in chunks]
+    return {
+        "documents": len(chunks),
+        "bytes": sum(sizes),
+        "avg_doc_bytes": round(sum(sizes) / len(sizes), 1),
+        "avg_metadata_bytes": round(sum(metadata_sizes) / len(metadata_sizes), 1)
+    }
+
+def run(files: int, chunks_per_file: int, chunk_sizes, seed: int) -> dict:
+    cases = []
+    for chunk_chars in chunk_sizes:
+        legacy = build_chunks(files, chunks_per_file, chunk_chars, seed)
+        normalized = normalize(legacy)
+        legacy_find = measure(legacy)
+        normalized_find = measure(normalized, SEARCH_PROJECTION)
+        cases.append({
+            "chunk_chars": chunk_chars,
+            "legacy_stored_and_find": legacy_find,
+            "normalized_stored": measure(normalized),
+            "normalized_search_find": normalized_find,
+            "find_bytes_saved": round(1 - normalized_find["bytes"] / legacy_find["bytes"], 4)
+        })
+    return {"files": files, "chunks_per_file": chunks_per_file, "cases": cases}
+
+def main():
+    parser = argparse.ArgumentParser(description="文檔塊 metadata 正規化大小基準測試")
+    parser.add_argument("--files", type=int, default=40, help="檔案數量")
+    parser.add_argument("--chunks-per-file", type=int, default=60, help="每個檔案的文檔塊數量")
+    parser.add_argument("--chunk-chars", type=int, nargs="+", default=[600, 3000, 6000], help="文檔塊字元數（表格塊約 600）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.files, args.chunks_per_file, args.chunk_chars, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
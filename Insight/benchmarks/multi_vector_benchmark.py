@@ -0,0 +1,185 @@
+"""
+多向量（句子視窗）檢索基準測試
+
+合成長分塊（每塊約 6000 字元），將每塊唯一的關鍵句放在隨機位置，
+以改寫後的關鍵句查詢，比較單一向量與句子視窗最大相似度在不同 search_limit 下的召回率，
+並找出達到相同召回率所需的最小 search_limit 與對應的上下文字元數。
+
+預設使用離線的雜湊詞袋向量器（與 MiniLM 相同，只編碼前 128 個詞），不需下載模型；
+指定 --model 時改用 SentenceTransformer 模型。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.multi_vector_benchmark --chunks 300
+    python -m benchmarks.multi_vector_benchmark --chunks 300 --model paraphrase-multilingual-MiniLM-L12-v2
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.vector_store import EnhancedMongoDBVectorStore
+from processors.chunker import sentence_windows
+
+FILLER_WORDS = [
+    "revenue", "growth", "quarter", "market", "players", "games", "mobile", "social", "casino", "margin",
+    "operating", "expenses", "marketing", "users", "payers", "bookings", "segment", "results", "company", "guidance",
+    "營收", "成長", "季度", "市場", "玩家", "遊戲", "費用", "利潤", "매출", "성장", "분기", "시장"
+]
+FACT_SUBJECTS = ["slotomania", "bingo", "solitaire", "poker", "lottery", "arcade", "puzzle", "casual", "rpg", "sports"]
+FACT_REGIONS = ["japan", "korea", "taiwan", "germany", "brazil", "canada", "australia", "mexico", "france", "india"]
+
+class HashingEmbedder:
+    """離線雜湊詞袋向量器，模擬向量模型的長度限制（只編碼前 max_tokens 個詞）"""
+    def __init__(self, dimensions: int = 384, max_tokens: int = 128):
+        self.dimensions = dimensions
+        self.max_tokens = max_tokens
+    
+    def encode(self, texts, convert_to_tensor=False):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.lower())[:self.max_tokens]:
+                digest = zlib.crc32(token.encode("utf-8"))
+                embeddings[row, digest % self.dimensions] += 1.0 if digest & 1 else -1.0
+        return embeddings[0] if single else embeddings
+
+def build_corpus(chunks: int, chunk_chars: int, seed: int):
+    """產生長分塊與對應的查詢；每塊含一個位於隨機位置的唯一關鍵句"""
+    rng = random.Random(seed)
+    texts, queries = [], []
+    
+    for index in range(chunks):
+        subject = FACT_SUBJECTS[index % len(FACT_SUBJECTS)]
+        region = FACT_REGIONS[(index // len(FACT_SUBJECTS)) % len(FACT_REGIONS)]
+        code = f"title{index}"
+        fact = f"The {subject} {code} launch in {region} delivered {rng.randint(10, 99)} million revenue."
+        
+        sentences = []
+        length = 0
+        while length < chunk_chars:
+            sentence = " ".join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(8, 16))) + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        sentences.insert(rng.randint(0, len(sentences)), fact)
+        
+        texts.append(" ".join(sentences))
+        queries.append(f"{region} {code} {subject} launch revenue")
+    
+    return texts, queries
+
+def recall_at(similarities: np.ndarray, limits) -> dict:
+    """每個查詢的正確分塊即為同索引的分塊，計算各 search_limit 的召回率"""
+    target_scores = similarities[np.arange(len(similarities)), np.arange(len(similarities))]
+    ranks = (similarities > target_scores[:, None]).sum(axis=1)
+    return {limit: float(np.mean(ranks < limit)) for limit in limits}
+
+def min_limit_for(recalls: dict, target: float):
+    """達到目標召回率所需的最小 search_limit"""
+    for limit in sorted(recalls):
+        if recalls[limit] >= target:
+            return limit
+    return None
+
+def run(chunks: int, chunk_chars: int, limits, baseline_limit: int, model_name: str, seed: int) -> dict:
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(model_name)
+    else:
+        embedder = HashingEmbedder()
+    
+    texts, queries = build_corpus(chunks, chunk_chars, seed)
+    query_embeddings = np.asarray(embedder.encode(queries, convert_to_tensor=False), dtype=np.float32)
+    
+    start = time.perf_counter()
+    chunk_embeddings = np.asarray(embedder.encode(texts, convert_to_tensor=False), dtype=np.float32)
+    single_encode_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    window_blocks, segment_starts, rows, stored_bytes = [], [], 0, 0
+    for text in texts:
+        windows = sentence_windows(text)
+        packed = EnhancedMongoDBVectorStore._pack_windows(
+            np.asarray(embedder.encode(windows, convert_to_tensor=False), dtype=np.float32)
+        )
+        stored_bytes += len(packed)
+        vectors = EnhancedMongoDBVectorStore._unpack_windows(packed, chunk_embeddings.shape[1])
+        window_blocks.append(vectors)
+        segment_starts.append(rows)
+        rows += len(vectors)
+    window_encode_seconds = time.perf_counter() - start
+    window_matrix = np.vstack(window_blocks)
+    segment_starts = np.asarray(segment_starts, dtype=np.int64)
+    
+    start = time.perf_counter()
+    single_scores = EnhancedMongoDBVectorStore._score_candidates(query_embeddings, chunk_embeddings)
+    single_search_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    multi_scores = EnhancedMongoDBVectorStore._score_candidates(query_embeddings, window_matrix, segment_starts)
+    multi_search_seconds = time.perf_counter() - start
+    
+    single_recall = recall_at(single_scores, limits)
+    multi_recall = recall_at(multi_scores, limits)
+    target_recall = single_recall[baseline_limit]
+    multi_limit = min_limit_for(multi_recall, target_recall)
+    average_chars = sum(len(text) for text in texts) / len(texts)
+    
+    return {
+        "embedder": model_name or "hashing (first 128 tokens)",
+        "chunks": chunks,
+        "average_chunk_chars": round(average_chars),
+        "windows": int(rows),
+        "windows_per_chunk": round(rows / chunks, 2),
+        "window_storage_bytes_float16": stored_bytes,
+        "single_vector_storage_bytes_float32": int(chunk_embeddings.size * 4),
+        "encode_seconds": {"single": round(single_encode_seconds, 3), "windows": round(window_encode_seconds, 3)},
+        "search_ms_per_query": {
+            "single": round(single_search_seconds * 1000 / len(queries), 4),
+            "multi_vector": round(multi_search_seconds * 1000 / len(queries), 4)
+        },
+        "recall": {
+            str(limit): {"single": round(single_recall[limit], 3), "multi_vector": round(multi_recall[limit], 3)}
+            for limit in limits
+        },
+        "baseline": {
+            "search_limit": baseline_limit,
+            "recall": round(target_recall, 3),
+            "context_chars": round(baseline_limit * average_chars)
+        },
+        "multi_vector_same_recall": {
+            "search_limit": multi_limit,
+            "context_chars": round(multi_limit * average_chars) if multi_limit else None
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="多向量（句子視窗）檢索基準測試")
+    parser.add_argument("--chunks", type=int, default=300, help="分塊數量")
+    parser.add_argument("--chunk-chars", type=int, default=6000, help="每個分塊的約略字元數")
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 3, 5, 10, 15, 25], help="比較的 search_limit")
+    parser.add_argument("--baseline-limit", type=int, default=15, help="單一向量的基準 search_limit（與 vector_search.search_limit 相同）")
+    parser.add_argument("--model", help="SentenceTransformer 模型名稱（預設使用離線雜湊向量器）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    limits = sorted(set(args.limits) | {args.baseline_limit})
+    report = run(args.chunks, args.chunk_chars, limits, args.baseline_limit, args.model, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+提示前綴穩定性基準測試
+
+對本地 OpenAI 相容測試端點執行多次 enhanced_rag_process，
+確認系統訊息與分析要求在每次請求中構成位元組相同的前綴，並記錄 cached_tokens。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.prompt_prefix_benchmark --calls 6
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from analyzers.rag_analyzer import RAGAnalyzer, SYSTEM_PROMPT, ANALYSIS_INSTRUCTIONS
+from benchmarks.stub_llm_server import StubLLMServer
+
+QUERIES = [
+    "用繁體中文總結2025年Q1季度的公司概況，條列式呈現：1. 綜合營收與獲利、2. 部門（產品）表現。",
+    "用繁體中文總結2025年Q1季度的商業策略，條列式呈現：1. 市場拓展、2. 產品（營運）策略。",
+    "用繁體中文總結2025年Q1季度的主要風險，條列式呈現：1. 經濟與市場相關風險。",
+]
+
+class SyntheticVectorStore:
+    """產生每次呼叫內容皆不同的檢索結果"""
+    def __init__(self):
+        self.calls = 0
+    
+    def search_similar_multi(self, query_texts, limits, company_filter=None, quarter_filter=None, prioritize_tables=False, max_results=30):
+        self.calls += 1
+        return [
+            {
+                "text": f"[PAGE {page}] {company_filter} {quarter_filter} Total Revenue {self.calls * 100 + page} million, call {self.calls}",
+                "metadata": {"start_page": str(page), "end_page": str(page), "has_structured_data": page % 2 == 0},
+                "score": 0.9 - page * 0.01,
+                "_id": f"{self.calls}-{page}"
+            }
+            for page in range(1, 11)
+        ]
+
+def common_prefix_length(items):
+    """計算多個位元組序列的共同前綴長度"""
+    if not items:
+        return 0
+    shortest = min(len(item) for item in items)
+    for index in range(shortest):
+        byte = items[0][index]
+        if any(item[index] != byte for item in items[1:]):
+            return index
+    return shortest
+
+def run(calls: int) -> dict:
+    with StubLLMServer() as server:
+        analyzer = RAGAnalyzer(client=OpenAI(api_key="stub", base_url=server.base_url))
+        vector_store = SyntheticVectorStore()
+        
+        for i in range(calls):
+            company = ["Playtika", "DoubleDown", "Netmarble"][i % 3]
+            analyzer.enhanced_rag_process(QUERIES[i % len(QUERIES)], vector_store, company, "2025_Q1", "Revenue, Income")
+        
+        prompts = [StubLLMServer.serialize_prompt(body["messages"]) for body in server.requests]
+    
+    static_prefix = StubLLMServer.serialize_prompt([
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": ANALYSIS_INSTRUCTIONS}
+    ])
+    static_prefix_bytes = len(static_prefix)
+    shared_prefix_bytes = common_prefix_length(prompts)
+    
+    return {
+        "calls": len(prompts),
+        "static_prefix_bytes": static_prefix_bytes,
+        "shared_prefix_bytes": shared_prefix_bytes,
+        "prefix_identical": shared_prefix_bytes >= static_prefix_bytes,
+        "prompt_bytes": [len(p) for p in prompts],
+        "usage": analyzer.usage_stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="提示前綴穩定性基準測試")
+    parser.add_argument("--calls", type=int, default=6, help="請求次數")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.calls)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    
+    if not report["prefix_identical"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
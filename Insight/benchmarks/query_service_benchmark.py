@@ -0,0 +1,198 @@
+"""
+常駐查詢服務基準測試
+
+以本地 MongoDB 替身（mongomock，或 --mongo-uri 指定的本地 MongoDB）、離線雜湊向量器與本地 OpenAI 相容測試端點
+啟動 QueryService 與其 HTTP 端點，依序量測：
+1. cold：每個公司-季度的第一個查詢（候選塊尚未載入）
+2. warm：相同公司-季度的其他問題（候選塊快取命中，答案快取未命中）
+3. repeat：重複先前的問題（語意答案快取命中）
+4. overload：並行請求數超過 max_concurrency 且等候時間很短時，超出的請求返回 503
+5. no_cache：停用候選塊快取時的 warm 問題（每次檢索重新讀取資料庫，作為對照）
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.query_service_benchmark --companies 4 --quarters 4 --concurrency 4
+    python -m benchmarks.query_service_benchmark --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from config.settings import settings
+from models.vector_store import EnhancedMongoDBVectorStore
+from analyzers.rag_analyzer import RAGAnalyzer
+from query_service import QueryService, QueryServer
+from benchmarks.common import create_client
+from benchmarks.multi_vector_benchmark import HashingEmbedder
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.text_compression_benchmark import build_chunk
+
+QUESTIONS = [
+    "{quarter} 的總營收與營業利益是多少？",
+    "{quarter} 各產品的營收表現如何？",
+    "{quarter} 的行銷費用與調整後 EBITDA 有何變化？",
+    "{quarter} 公司提到哪些匯率或總體經濟風險？",
+]
+KEYWORDS_EN = "Revenue, Operating Income, Net Income, EBITDA, Marketing"
+
+def seed(vector_store, companies: int, quarters: int, pages: int, chunk_chars: int, seed_value: int):
+    """為每個公司-季度寫入一個合成財報檔案"""
+    rng = random.Random(seed_value)
+    sources = []
+    for company_index in range(companies):
+        company = f"Company{company_index}"
+        for quarter_index in range(quarters):
+            quarter = f"2025_Q{quarter_index + 1}"
+            text = "\n".join(build_chunk(rng, chunk_chars, page + 1) for page in range(pages))
+            vector_store.replace_file_chunks(text, {
+                "file_name": f"{company}_{quarter}_Earnings.pdf",
+                "company_name": company,
+                "year": "2025",
+                "quarter": quarter,
+                "total_pages": pages
+            })
+            sources.append((company, quarter))
+    return sources
+
+def post_query(url: str, company: str, quarter: str, question: str) -> dict:
+    """送出查詢，返回狀態碼、回應內容與用戶端量測的耗時"""
+    body = json.dumps({"company": company, "quarter": quarter, "question": question, "keywords_en": KEYWORDS_EN}).encode("utf-8")
+    request = urllib.request.Request(f"{url}/query", data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            status, payload = response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, json.loads(e.read() or b"{}")
+    return {"status": status, "payload": payload, "client_ms": (time.perf_counter() - start) * 1000}
+
+def summarize(responses) -> dict:
+    """彙整一組回應的狀態碼與耗時分位數"""
+    statuses = {}
+    for response in responses:
+        statuses[str(response["status"])] = statuses.get(str(response["status"]), 0) + 1
+    
+    def percentiles(values):
+        values = [value for value in values if value is not None]
+        if not values:
+            return None
+        return {
+            "p50": round(float(np.percentile(values, 50)), 2),
+            "p95": round(float(np.percentile(values, 95)), 2),
+            "max": round(float(max(values)), 2)
+        }
+    
+    ok = [response for response in responses if response["status"] == 200]
+    return {
+        "requests": len(responses),
+        "statuses": statuses,
+        "sources": sorted({response["payload"].get("source") for response in ok}),
+        "client_ms": percentiles([response["client_ms"] for response in responses]),
+        "retrieval_ms": percentiles([response["payload"]["timing_ms"]["retrieval"] for response in ok]),
+        "queue_ms": percentiles([response["payload"]["timing_ms"]["queue"] for response in ok]),
+        "total_ms": percentiles([response["payload"]["timing_ms"]["total"] for response in ok])
+    }
+
+def fire(url: str, jobs, concurrency: int):
+    """以固定並行數送出查詢"""
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda job: post_query(url, *job), jobs))
+
+def run(companies: int, quarters: int, pages: int, chunk_chars: int, concurrency: int, max_concurrency: int, llm_latency: float, mongo_uri: str, seed_value: int) -> dict:
+    mongodb_settings = settings.config.setdefault("mongodb_settings", {})
+    original_database = mongodb_settings.get("database_name")
+    mongodb_settings["database_name"] = "insight_query_service_benchmark"
+    
+    client = create_client(mongo_uri)
+    embedder = HashingEmbedder()
+    try:
+        client.drop_database(mongodb_settings["database_name"])
+        vector_store = EnhancedMongoDBVectorStore(client=client, embedding_model=embedder)
+        sources = seed(vector_store, companies, quarters, pages, chunk_chars, seed_value)
+        chunks = vector_store.collection.count_documents({})
+        
+        cold_jobs = [(company, quarter, QUESTIONS[0].format(quarter=quarter)) for company, quarter in sources]
+        warm_jobs = [
+            (company, quarter, question.format(quarter=quarter))
+            for company, quarter in sources for question in QUESTIONS[1:]
+        ]
+        
+        report = {"company_quarters": len(sources), "chunks": chunks, "llm_latency_seconds": llm_latency, "max_concurrency": max_concurrency}
+        with StubLLMServer(latency=llm_latency) as llm:
+            analyzer = RAGAnalyzer(client=OpenAI(api_key="stub", base_url=llm.base_url))
+            service = QueryService(vector_store, analyzer, max_concurrency=max_concurrency)
+            with QueryServer(service, "127.0.0.1", 0) as server:
+                report["cold"] = summarize(fire(server.url, cold_jobs, concurrency))
+                report["warm"] = summarize(fire(server.url, warm_jobs, concurrency))
+                report["repeat"] = summarize(fire(server.url, warm_jobs, concurrency))
+                report["health"] = service.health()
+                
+                # 停用答案快取，讓每個請求都需要呼叫 LLM
+                analyzer.answer_cache = None
+                service.queue_timeout = 0.01
+                overload_jobs = warm_jobs * 2
+                report["overload"] = summarize(fire(server.url, overload_jobs, max_concurrency * 4))
+            
+            # 對照：停用候選塊快取（每次檢索重新讀取資料庫），並使用新的分析器（答案快取為空）
+            candidate_cache = settings.config.setdefault("vector_search", {}).setdefault("candidate_cache", {})
+            original_enabled = candidate_cache.get("enabled")
+            candidate_cache["enabled"] = False
+            try:
+                uncached_store = EnhancedMongoDBVectorStore(client=client, embedding_model=embedder)
+            finally:
+                if original_enabled is None:
+                    candidate_cache.pop("enabled")
+                else:
+                    candidate_cache["enabled"] = original_enabled
+            
+            analyzer = RAGAnalyzer(client=OpenAI(api_key="stub", base_url=llm.base_url))
+            service = QueryService(uncached_store, analyzer, max_concurrency=max_concurrency)
+            with QueryServer(service, "127.0.0.1", 0) as server:
+                report["no_cache"] = summarize(fire(server.url, warm_jobs, concurrency))
+            
+            vector_store.bulk_writer.close()
+            uncached_store.bulk_writer.close()
+        
+        client.drop_database(mongodb_settings["database_name"])
+        return report
+    finally:
+        mongodb_settings["database_name"] = original_database
+
+def main():
+    parser = argparse.ArgumentParser(description="常駐查詢服務基準測試")
+    parser.add_argument("--companies", type=int, default=4, help="公司數量")
+    parser.add_argument("--quarters", type=int, default=4, help="每家公司的季度數量")
+    parser.add_argument("--pages", type=int, default=60, help="每個財報檔案的頁數")
+    parser.add_argument("--chunk-chars", type=int, default=1500, help="每頁的約略字元數")
+    parser.add_argument("--concurrency", type=int, default=4, help="用戶端的並行請求數")
+    parser.add_argument("--max-concurrency", type=int, default=settings.get("query_service.max_concurrency", 4), help="服務同時執行的查詢數上限")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="測試端點每次回應的延遲秒數")
+    parser.add_argument("--mongo-uri", help="本地 MongoDB 連線字串（預設使用 mongomock）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(
+        args.companies, args.quarters, args.pages, args.chunk_chars,
+        args.concurrency, args.max_concurrency, args.llm_latency, args.mongo_uri, args.seed
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+端到端 RAG 回歸基準測試
+
+以合成多語財報（benchmarks/synthetic_pdf.py）、本地資料庫（mongomock 或 --mongo-uri）與本地 OpenAI 相容測試端點離線執行完整流程：
+1. 以 PipelineRunner 執行 discover、extract、chunk、embed 階段寫入文檔塊與表格分區
+2. 對每個公司-季度執行 generate_enhanced_business_analysis_with_fallback（與 pipeline.py 的 analyze 階段相同）
+3. 記錄每個章節分析的檢索次數與子查詢數、檢索耗時、上下文字元數、提示字元數與 token 數、LLM 耗時，以及每個公司-季度的總耗時
+
+token 數為測試端點的估計值（提示位元組數 / 4），只用於比較同一套測試資料在不同版本間的變化；
+每個公司-季度另記錄送出提示的 SHA-256，提示內容改變時比較結果會標示 prompt_changed。
+各章節分析之間的間隔（analysis_settings.query_delay_seconds）預設設為 0，只量測處理本身的耗時。
+
+比較兩個版本：在舊版本執行並保存報告，於新版本以 --baseline 指定該報告；或以 --diff 比較兩份已保存的報告。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.rag_regression_benchmark --output rag_baseline.json
+    python -m benchmarks.rag_regression_benchmark --baseline rag_baseline.json --output rag_current.json
+    python -m benchmarks.rag_regression_benchmark --diff rag_baseline.json rag_current.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from config.settings import settings
+from models.vector_store import EnhancedMongoDBVectorStore
+from analyzers.rag_analyzer import RAGAnalyzer
+from pipeline import PipelineRunner
+from utils.file_utils import analysis_file_name
+from benchmarks.common import create_client, percentile
+from benchmarks.multi_vector_benchmark import HashingEmbedder
+from benchmarks.stub_llm_server import StubLLMServer
+from benchmarks.synthetic_pdf import build_corpus
+
+DATABASE_NAME = "insight_rag_regression_benchmark"
+QUERY_FIELDS = ("search_passes", "sub_queries", "retrieval_ms", "context_chars", "prompt_chars", "prompt_tokens", "cached_tokens", "completion_tokens", "llm_ms")
+DIFF_FIELDS = ("wall_seconds", "search_passes", "sub_queries", "retrieval_ms", "context_chars", "prompt_chars", "prompt_tokens", "llm_ms")
+
+class RecordingVectorStore(EnhancedMongoDBVectorStore):
+    """記錄每次檢索的子查詢數、耗時、候選塊數與返回結果的字元數"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.searches = []
+    
+    def search_similar_multi(self, query_texts, limits, *args, **kwargs):
+        start = time.perf_counter()
+        results = super().search_similar_multi(query_texts, limits, *args, **kwargs)
+        self.searches.append({
+            "queries": len(query_texts),
+            "ms": (time.perf_counter() - start) * 1000,
+            "candidates": self.last_search_stats.get("candidates", 0) if results else 0,
+            "results": len(results),
+            "context_chars": sum(len(result.get("text") or "") for result in results)
+        })
+        return results
+
+class RecordingAnalyzer(RAGAnalyzer):
+    """記錄每個章節分析的檢索、提示與 LLM 用量"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+    
+    def enhanced_rag_process(self, query, vector_store, company_filter, quarter_filter, query_keywords_en):
+        first_search = len(vector_store.searches)
+        answer = super().enhanced_rag_process(query, vector_store, company_filter, quarter_filter, query_keywords_en)
+        searches = vector_store.searches[first_search:]
+        usage = self.last_usage or {}
+        self.records.append({
+            "search_passes": len(searches),
+            "sub_queries": sum(search["queries"] for search in searches),
+            "retrieval_ms": round(sum(search["ms"] for search in searches), 2),
+            "candidates": max((search["candidates"] for search in searches), default=0),
+            "results": sum(search["results"] for search in searches),
+            "context_chars": sum(search["context_chars"] for search in searches),
+            "prompt_chars": self.last_prompt_chars,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "llm_ms": self.last_llm_ms or 0
+        })
+        return answer
+
+@contextmanager
+def override_settings(values: dict):
+    """暫時覆寫設定（以點分隔的鍵），結束時還原"""
+    originals = []
+    for dotted_key, value in values.items():
+        *parents, key = dotted_key.split(".")
+        section = settings.config
+        for parent in parents:
+            section = section.setdefault(parent, {})
+        originals.append((section, key, key in section, section.get(key)))
+        section[key] = value
+    try:
+        yield
+    finally:
+        for section, key, existed, value in reversed(originals):
+            if existed:
+                section[key] = value
+            else:
+                section.pop(key, None)
+
+def prompt_fingerprint(requests) -> str:
+    """送出提示的 SHA-256（提示內容改變時不同）"""
+    hasher = hashlib.sha256()
+    for body in requests:
+        hasher.update(StubLLMServer.serialize_prompt(body.get("messages", [])))
+    return hasher.hexdigest()
+
+def analyze_company_quarter(vector_store, analyzer, llm, company: str, quarter: str) -> dict:
+    """執行單一公司-季度的分析並彙整各章節的記錄"""
+    first_record, first_request = len(analyzer.records), len(llm.requests)
+    start = time.perf_counter()
+    analysis = analyzer.generate_enhanced_business_analysis_with_fallback(vector_store, analysis_file_name(company, quarter), company, quarter)
+    wall_seconds = time.perf_counter() - start
+    
+    sections = [key for key in (analysis or {}) if key != "year_quarter"]
+    records = analyzer.records[first_record:]
+    entry = {
+        "company": company,
+        "quarter": quarter,
+        "ok": analysis is not None,
+        "wall_seconds": round(wall_seconds, 3),
+        **{field: round(sum(record[field] for record in records), 2) for field in QUERY_FIELDS},
+        "prompt_sha256": prompt_fingerprint(llm.requests[first_request:]),
+        "queries": dict(zip(sections, records)) if len(sections) == len(records) else records
+    }
+    return entry
+
+def totals(entries) -> dict:
+    """所有公司-季度的合計與總耗時分佈"""
+    walls = [entry["wall_seconds"] for entry in entries]
+    report = {field: round(sum(entry[field] for entry in entries), 2) for field in QUERY_FIELDS}
+    report.update({
+        "company_quarters": len(entries),
+        "failed": sum(1 for entry in entries if not entry["ok"]),
+        "wall_seconds": round(sum(walls), 3),
+        "wall_p50_seconds": percentile(walls, 50),
+        "wall_p95_seconds": percentile(walls, 95)
+    })
+    return report
+
+def compare(current: dict, baseline: dict) -> dict:
+    """比較兩份報告：合計與各公司-季度的差異（目前 - 基準）與比值（目前 / 基準）"""
+    def difference(now: dict, before: dict) -> dict:
+        changes = {}
+        for field in DIFF_FIELDS:
+            if field in now and field in before:
+                changes[field] = {
+                    "baseline": before[field],
+                    "current": now[field],
+                    "delta": round(now[field] - before[field], 3),
+                    "ratio": round(now[field] / before[field], 3) if before[field] else None
+                }
+        return changes
+    
+    previous = {(entry["company"], entry["quarter"]): entry for entry in baseline["company_quarters"]}
+    company_quarters = []
+    for entry in current["company_quarters"]:
+        before = previous.get((entry["company"], entry["quarter"]))
+        if before is None:
+            continue
+        company_quarters.append({
+            "company": entry["company"],
+            "quarter": entry["quarter"],
+            "prompt_changed": entry["prompt_sha256"] != before["prompt_sha256"],
+            "changes": difference(entry, before)
+        })
+    
+    return {
+        "config_changed": {
+            key: {"baseline": baseline["config"].get(key), "current": value}
+            for key, value in current["config"].items() if baseline["config"].get(key) != value
+        },
+        "totals": difference(current["totals"], baseline["totals"]),
+        "prompts_changed": sum(1 for entry in company_quarters if entry["prompt_changed"]),
+        "company_quarters": company_quarters
+    }
+
+def run(companies: int, quarters: int, pages: int, llm_latency: float, query_delay: float, model_name: str, mongo_uri: str, seed: int) -> dict:
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(model_name)
+    else:
+        embedder = HashingEmbedder()
+    
+    client = create_client(mongo_uri)
+    with tempfile.TemporaryDirectory() as directory, override_settings({
+        "mongodb_settings.database_name": DATABASE_NAME,
+        "file_processing.base_directory": directory,
+        "analysis_settings.query_delay_seconds": query_delay
+    }):
+        build_corpus(directory, companies, quarters, pages, seed)
+        client.drop_database(DATABASE_NAME)
+        vector_store = RecordingVectorStore(client=client, embedding_model=embedder)
+        
+        start = time.perf_counter()
+        runner = PipelineRunner(vector_store, stages=("discover", "extract", "chunk", "embed"))
+        if not runner.run():
+            print("部分檔案處理失敗", file=sys.stderr)
+        vector_store.bulk_writer.flush()
+        ingest = {
+            "seconds": round(time.perf_counter() - start, 2),
+            "files": len(vector_store.get_file_manifest()),
+            "chunks": vector_store.collection.count_documents({}),
+            "table_chunks": vector_store.table_collection.count_documents({})
+        }
+        company_quarters = sorted({
+            (document["metadata"]["company_name"], document["metadata"]["quarter"])
+            for document in vector_store.collection.find({}, {"metadata.company_name": 1, "metadata.quarter": 1})
+        })
+        
+        entries = []
+        with StubLLMServer(latency=llm_latency) as llm:
+            analyzer = RecordingAnalyzer(client=OpenAI(api_key="stub", base_url=llm.base_url))
+            for company, quarter in company_quarters:
+                entries.append(analyze_company_quarter(vector_store, analyzer, llm, company, quarter))
+        
+        vector_store.bulk_writer.close()
+        client.drop_database(DATABASE_NAME)
+        config = {
+            "companies": companies,
+            "quarters": quarters,
+            "pages": pages,
+            "seed": seed,
+            "embedder": model_name or "hashing",
+            "llm_latency_seconds": llm_latency,
+            "chunk_max_tokens": settings.get("vector_search.chunk_max_tokens", 6000),
+            "search_limit": settings.get("vector_search.search_limit", 15),
+            "backup_search_limit": settings.get("vector_search.backup_search_limit", 25),
+            "universal_search_limit": settings.get("vector_search.universal_search_limit", 25),
+            "max_context_length": settings.get("vector_search.max_context_length", 300000),
+            "context_mode": settings.get("analysis_settings.context_mode", "raw"),
+            "multi_vector": settings.get("vector_search.multi_vector.enabled", False)
+        }
+    
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "mongodb" if mongo_uri else "mongomock"
+        },
+        "config": config,
+        "ingest": ingest,
+        "totals": totals(entries),
+        "company_quarters": entries
+    }
+
+def load_report(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端 RAG 回歸基準測試")
+    parser.add_argument("--companies", type=int, default=2, help="合成財報的公司數量")
+    parser.add_argument("--quarters", type=int, default=2, help="每家公司的季度數量")
+    parser.add_argument("--pages", type=int, default=30, help="每份合成財報的頁數")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="測試端點每次回應的延遲秒數")
+    parser.add_argument("--query-delay", type=float, default=0.0, help="各章節分析之間的間隔秒數（analysis_settings.query_delay_seconds）")
+    parser.add_argument("--model", help="本地 SentenceTransformer 模型（預設使用離線雜湊向量器）")
+    parser.add_argument("--mongo-uri", help="本地 MongoDB 連線字串（預設使用 mongomock）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--baseline", help="先前版本的 JSON 報告，執行後比較差異")
+    parser.add_argument("--diff", nargs=2, metavar=("BASELINE", "CURRENT"), help="只比較兩份已保存的報告，不執行測試")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    if args.diff:
+        report = compare(load_report(args.diff[1]), load_report(args.diff[0]))
+    else:
+        report = run(args.companies, args.quarters, args.pages, args.llm_latency, args.query_delay, args.model, args.mongo_uri, args.seed)
+        if args.baseline:
+            report["compared_to_baseline"] = compare(report, load_report(args.baseline))
+    
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
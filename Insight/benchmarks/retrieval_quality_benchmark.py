@@ -0,0 +1,276 @@
+"""
+檢索品質與延遲基準測試（向量模型 x 分塊大小）
+
+以標準答案集（公司、季度、問題、答案所在頁碼）評估不同本地向量模型與 chunk_max_tokens 的組合：
+1. 提取每個財報檔案的文字，依各分塊大小以 split_text 分塊，批次編碼並寫入本地資料庫（mongomock 或 --mongo-uri）
+2. 以 search_similar_enhanced（依公司-季度篩選）查詢每個問題，包含答案頁碼的文檔塊即為相關結果
+3. 報告 recall@k、MRR、前 k 個結果的上下文字元數、索引大小（向量與文字位元組）、編碼吞吐量與查詢延遲
+
+未指定 --golden 時以 benchmarks/synthetic_pdf.py 產生合成多語財報，並以各頁關鍵句的三種語言問題為標準答案
+（只有圖像的掃描頁沒有文字層，不列入）；結果另依問題與頁面語言是否相同分組（same_language / cross_language）。
+
+--golden 為 JSON 陣列，每個項目：
+    {"company": "Playtika", "quarter": "2025_Q1", "question": "本季的總營收是多少？", "page": 5,
+     "file": "Playtika_財報資料/Playtika_2025Q1季報.pdf", "tag": "revenue"}
+file 為相對於 --base-directory（預設為 file_processing.base_directory）的路徑；tag 可省略，指定時另依 tag 分組報告。
+實際財報以 EnhancedMongoDBVectorStore.extract_file 提取，已處理過的檔案直接讀取提取結果快取（OCR 檔案未快取時需呼叫視覺模型）。
+
+--models 的 hashing 為離線雜湊向量器，其他名稱或路徑以 SentenceTransformer 載入（需事先下載至本地）。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.retrieval_quality_benchmark --chunk-sizes 1500 3000 6000
+    python -m benchmarks.retrieval_quality_benchmark --models paraphrase-multilingual-MiniLM-L12-v2 intfloat/multilingual-e5-small --chunk-sizes 1500 6000
+    python -m benchmarks.retrieval_quality_benchmark --golden golden.json --models paraphrase-multilingual-MiniLM-L12-v2 --output retrieval_report.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings
+from processors.pdf_processor import PDFProcessor
+from processors.chunker import split_text
+from models.vector_store import EnhancedMongoDBVectorStore
+from benchmarks.common import create_client, percentile
+from benchmarks.multi_vector_benchmark import HashingEmbedder
+from benchmarks.synthetic_pdf import build_corpus
+
+DATABASE_NAME = "insight_retrieval_quality_benchmark"
+
+def synthetic_golden(directory: str, companies: int, quarters: int, pages: int, seed: int):
+    """產生合成財報並以各頁關鍵句的問題為標準答案，返回 (檔案清單, 標準答案)"""
+    reports = build_corpus(directory, companies, quarters, pages, seed)
+    files, golden = [], []
+    for report in reports:
+        files.append({"path": report["path"], "company": report["company"], "quarter": report["quarter"]})
+        for item in report["facts"]:
+            if item["image_only"]:
+                continue
+            for language, question in item["questions"].items():
+                golden.append({
+                    "company": report["company"],
+                    "quarter": report["quarter"],
+                    "question": question,
+                    "page": item["page"],
+                    "tag": "same_language" if language == item["language"] else "cross_language"
+                })
+    return files, golden
+
+def load_golden(path: str, base_directory: str):
+    """讀取標準答案 JSON，返回 (檔案清單, 標準答案)"""
+    with open(path, "r", encoding="utf-8") as file:
+        golden = json.load(file)
+    
+    files = {}
+    for item in golden:
+        file_path = os.path.join(base_directory, item["file"])
+        files.setdefault(file_path, {"path": file_path, "company": item["company"], "quarter": item["quarter"]})
+    return list(files.values()), golden
+
+def extract_texts(files, vector_store=None) -> dict:
+    """提取每個檔案的文字；指定 vector_store 時使用 extract_file（含提取結果快取與 OCR 判斷）"""
+    processor = PDFProcessor()
+    texts = {}
+    for item in files:
+        try:
+            if vector_store is not None:
+                text = vector_store.extract_file(item["path"], item["company"])["text"]
+            else:
+                text, _ = processor.read_pdf_text_extraction(item["path"], max_pages=None)
+        except OSError as e:
+            print(f"無法讀取 {item['path']}，略過: {e}", file=sys.stderr)
+            continue
+        if not text:
+            print(f"無法讀取 {item['path']}，略過", file=sys.stderr)
+            continue
+        texts[item["path"]] = text
+    return texts
+
+def chunk_pages(chunk: dict) -> set:
+    """文檔塊涵蓋的頁碼（OCR 批次的 "3-4" 展開為 3、4）"""
+    pages = set()
+    for page in chunk.get("pages") or [chunk.get("start_page")]:
+        numbers = [int(number) for number in re.findall(r"\d+", str(page))]
+        if numbers:
+            pages.update(range(numbers[0], numbers[-1] + 1))
+    return pages
+
+def load_embedder(name: str):
+    """載入向量模型，返回 (模型, 載入秒數)"""
+    start = time.perf_counter()
+    if name == "hashing":
+        embedder = HashingEmbedder()
+    else:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(name)
+    return embedder, time.perf_counter() - start
+
+def index_chunks(vector_store, embedder, files, texts: dict, chunk_size: int) -> dict:
+    """分塊、批次編碼並寫入文檔塊，返回分塊數、索引大小與編碼耗時"""
+    documents, chunk_texts = [], []
+    for item in files:
+        if item["path"] not in texts:
+            continue
+        for index, chunk in enumerate(split_text(texts[item["path"]], chunk_size)):
+            chunk_texts.append(chunk["text"])
+            documents.append({
+                **vector_store.text_codec.text_fields(chunk["text"]),
+                "metadata": {
+                    "company_name": item["company"],
+                    "quarter": item["quarter"],
+                    "file_name": os.path.basename(item["path"]),
+                    "chunk_index": index,
+                    "chunk_length": len(chunk["text"]),
+                    "start_page": chunk["start_page"],
+                    "end_page": chunk["end_page"],
+                    "pages_covered": sorted(chunk_pages(chunk)),
+                    "has_structured_data": chunk.get("has_structured_data", False),
+                    "is_ocr_content": chunk.get("is_ocr_content", False)
+                }
+            })
+    
+    start = time.perf_counter()
+    embeddings = np.asarray(embedder.encode(chunk_texts, convert_to_tensor=False), dtype=np.float32)
+    encode_seconds = time.perf_counter() - start
+    for document, embedding in zip(documents, embeddings):
+        document["embedding"] = embedding.tolist()
+    if documents:
+        vector_store.collection.insert_many(documents)
+    
+    text_chars = sum(len(text) for text in chunk_texts)
+    return {
+        "chunks": len(documents),
+        "average_chunk_chars": round(text_chars / len(documents)) if documents else 0,
+        "dims": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "embedding_bytes": int(embeddings.size * 4),
+        "text_bytes": sum(len(text.encode("utf-8")) for text in chunk_texts),
+        "encode_seconds": round(encode_seconds, 3),
+        "encode_chunks_per_second": round(len(chunk_texts) / encode_seconds, 1) if encode_seconds else None,
+        "encode_chars_per_second": round(text_chars / encode_seconds) if encode_seconds else None
+    }
+
+def evaluate(vector_store, golden, ks) -> dict:
+    """查詢每個問題，計算 recall@k、MRR、上下文字元數與查詢延遲（整體與依 tag 分組）"""
+    max_k = max(ks)
+    ranks, latencies, context_chars, candidates, tags = [], [], [], [], []
+    for item in golden:
+        start = time.perf_counter()
+        results = vector_store.search_similar_enhanced(item["question"], company_filter=item["company"], quarter_filter=item["quarter"], limit=max_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        candidates.append(vector_store.last_search_stats.get("candidates", 0))
+        
+        rank = None
+        for position, result in enumerate(results):
+            if int(item["page"]) in set(result["metadata"].get("pages_covered") or []):
+                rank = position + 1
+                break
+        ranks.append(rank)
+        context_chars.append(sum(len(result.get("text") or "") for result in results))
+        tags.append(item.get("tag"))
+    
+    def scores(indices):
+        selected = [ranks[index] for index in indices]
+        return {
+            "questions": len(selected),
+            "recall": {str(k): round(sum(1 for rank in selected if rank and rank <= k) / len(selected), 3) for k in ks},
+            "mrr": round(sum(1 / rank for rank in selected if rank) / len(selected), 3)
+        }
+    
+    report = scores(range(len(golden)))
+    # 每個公司-季度的候選塊數：候選塊少時 recall@k 接近隨機選取的上限（k / 候選塊數）
+    report["average_candidates"] = round(sum(candidates) / len(candidates), 1) if candidates else 0
+    report[f"context_chars_at_{max_k}"] = round(sum(context_chars) / len(context_chars)) if context_chars else 0
+    report["query_p50_ms"] = percentile(latencies, 50)
+    report["query_p95_ms"] = percentile(latencies, 95)
+    by_tag = {}
+    for index, tag in enumerate(tags):
+        if tag:
+            by_tag.setdefault(tag, []).append(index)
+    if by_tag:
+        report["by_tag"] = {tag: scores(indices) for tag, indices in sorted(by_tag.items())}
+    return report
+
+def run(model_names, chunk_sizes, ks, golden_path: str, base_directory: str, companies: int, quarters: int, pages: int, mongo_uri: str, seed: int) -> dict:
+    mongodb_settings = settings.config.setdefault("mongodb_settings", {})
+    original_database = mongodb_settings.get("database_name")
+    mongodb_settings["database_name"] = DATABASE_NAME
+    client = create_client(mongo_uri)
+    
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            if golden_path:
+                # 提取結果快取位於 base_directory 下，與 main.py 處理同一批財報時共用
+                file_processing = settings.config.setdefault("file_processing", {})
+                original_base_directory = file_processing.get("base_directory")
+                file_processing["base_directory"] = base_directory or original_base_directory or "."
+                try:
+                    files, golden = load_golden(golden_path, file_processing["base_directory"])
+                    texts = extract_texts(files, EnhancedMongoDBVectorStore(client=client, embedding_model=HashingEmbedder()))
+                finally:
+                    file_processing["base_directory"] = original_base_directory
+            else:
+                files, golden = synthetic_golden(directory, companies, quarters, pages, seed)
+                texts = extract_texts(files)
+        # 無法提取的檔案不列入評估
+        indexed = {(entry["company"], entry["quarter"]) for entry in files if entry["path"] in texts}
+        golden = [item for item in golden if (item["company"], item["quarter"]) in indexed]
+        
+        configurations = []
+        for model_name in model_names:
+            embedder, load_seconds = load_embedder(model_name)
+            for chunk_size in chunk_sizes:
+                client.drop_database(DATABASE_NAME)
+                vector_store = EnhancedMongoDBVectorStore(client=client, embedding_model=embedder)
+                configuration = {"model": model_name, "chunk_max_tokens": chunk_size, "model_load_seconds": round(load_seconds, 2)}
+                configuration["index"] = index_chunks(vector_store, embedder, files, texts, chunk_size)
+                configuration["retrieval"] = evaluate(vector_store, golden, ks)
+                configurations.append(configuration)
+                vector_store.bulk_writer.close()
+        
+        client.drop_database(DATABASE_NAME)
+    finally:
+        mongodb_settings["database_name"] = original_database
+    
+    return {
+        "golden": golden_path or "synthetic",
+        "files": len(texts),
+        "questions": len(golden),
+        "ks": ks,
+        "configurations": configurations
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="檢索品質與延遲基準測試")
+    parser.add_argument("--models", nargs="+", default=["hashing"], help="向量模型名稱或本地路徑（hashing 為離線雜湊向量器）")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1500, 3000, settings.get("vector_search.chunk_max_tokens", 6000)], help="分塊大小（chunk_max_tokens）")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10], help="recall@k 的 k 值")
+    parser.add_argument("--golden", help="標準答案 JSON（預設使用合成財報）")
+    parser.add_argument("--base-directory", help="標準答案中檔案路徑的根目錄")
+    parser.add_argument("--companies", type=int, default=2, help="合成財報的公司數量")
+    parser.add_argument("--quarters", type=int, default=2, help="合成財報每家公司的季度數量")
+    parser.add_argument("--pages", type=int, default=30, help="合成財報的頁數")
+    parser.add_argument("--mongo-uri", help="本地 MongoDB 連線字串（預設使用 mongomock）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(
+        args.models, args.chunk_sizes, sorted(args.k), args.golden, args.base_directory,
+        args.companies, args.quarters, args.pages, args.mongo_uri, args.seed
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
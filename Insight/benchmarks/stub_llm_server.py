@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# 供應端提示快取的模擬規則：前綴至少 1024 tokens，以 128 tokens 為單位命中
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+BYTES_PER_TOKEN = 4
+
+class StubLLMServer:
+    """本地 OpenAI 相容測試端點，記錄每次請求並模擬提示快取的 cached_tokens"""
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, reply: str = "無明確提及", latency: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.requests: List[Dict] = []
+        self._seen_prompts: List[bytes] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+    
+    def start(self):
+        """在背景執行緒啟動測試端點"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止測試端點"""
+        self._server.shutdown()
+        self._server.server_close()
+    
+    @staticmethod
+    def serialize_prompt(messages: List[Dict]) -> bytes:
+        """將訊息序列化為供應端比對前綴時使用的位元組"""
+        return "".join(f"<{m.get('role')}>{m.get('content')}" for m in messages).encode("utf-8")
+    
+    def _cached_tokens(self, prompt: bytes) -> int:
+        """模擬與先前請求共享前綴時命中的 token 數"""
+        best_prefix = 0
+        for previous in self._seen_prompts:
+            limit = min(len(previous), len(prompt))
+            prefix = 0
+            while prefix < limit and previous[prefix] == prompt[prefix]:
+                prefix += 1
+            best_prefix = max(best_prefix, prefix)
+        
+        prefix_tokens = best_prefix // BYTES_PER_TOKEN
+        if prefix_tokens < CACHE_MIN_TOKENS:
+            return 0
+        return prefix_tokens - prefix_tokens % CACHE_BLOCK_TOKENS
+    
+    def _complete(self, body: Dict) -> Dict:
+        """產生聊天完成回應"""
+        prompt = self.serialize_prompt(body.get("messages", []))
+        
+        with self._lock:
+            cached_tokens = self._cached_tokens(prompt)
+            self._seen_prompts.append(prompt)
+            self.requests.append(body)
+        
+        if self.latency:
+            time.sleep(self.latency)
+        
+        return {
+            "id": f"chatcmpl-stub-{len(self.requests)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.reply},
+                    "finish_reason": "stop"
+                }
+            ],
+            "usage": {
+                "prompt_tokens": len(prompt) // BYTES_PER_TOKEN,
+                "completion_tokens": len(self.reply),
+                "total_tokens": len(prompt) // BYTES_PER_TOKEN + len(self.reply),
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}
+            }
+        }
+    
+    def _make_handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    payload = json.dumps(stub._complete(body)).encode("utf-8")
+                    self.send_response(200)
+                else:
+                    payload = json.dumps({"error": {"message": f"unknown path {self.path}"}}).encode("utf-8")
+                    self.send_response(404)
+                
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
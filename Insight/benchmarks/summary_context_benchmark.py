@@ -0,0 +1,169 @@
+"""
+摘要上下文基準測試
+
+以本地 OpenAI 相容測試端點模擬完整流程：
+1. 以 ChunkSummarizer 批次為合成長分塊（每塊約 6000 字元）產生摘要，並確認第二次執行全部命中快取
+2. 對三種章節分析（公司概況、商業策略、風險）分別以 raw 與 summary 上下文模式執行 enhanced_rag_process
+並比較送出的提示位元組數。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.summary_context_benchmark --chunks 30
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from config.settings import settings
+from analyzers.rag_analyzer import RAGAnalyzer
+from analyzers.chunk_summarizer import ChunkSummarizer
+from benchmarks.prompt_prefix_benchmark import QUERIES
+from benchmarks.stub_llm_server import StubLLMServer
+
+PARAGRAPHS = [
+    "本公司本季合併營收較去年同期成長，主要受惠於社交博弈產品的穩定表現。",
+    "Total revenue increased year over year, driven by higher average revenue per daily active user.",
+    "經營團隊持續投入新市場拓展與產品優化，並審慎評估匯率與總體經濟風險。",
+    "Adjusted EBITDA margin remained stable as marketing spend was reallocated across titles.",
+    "신작 게임 출시와 지역별 마케팅 확대로 분기 매출이 증가했습니다.",
+]
+
+def build_summary_reply(batch_size: int, summary_chars: int) -> str:
+    """測試端點的固定摘要回應（每個段落一則長度接近上限的摘要）"""
+    summary = ("本段說明季度營收成長來源、產品表現與行銷費用配置，並提及匯率與市場競爭風險。" * 10)[:summary_chars]
+    return json.dumps({
+        "summaries": [
+            {
+                "id": index,
+                "summary": summary,
+                "key_figures": ["總營收 650.3 百萬美元 (Q1 2025, p.5)", "調整後 EBITDA 180.2 百萬美元 (Q1 2025, p.6)"]
+            }
+            for index in range(batch_size)
+        ]
+    }, ensure_ascii=False)
+
+class SyntheticVectorStore:
+    """記憶體中的文檔塊，提供摘要器與分析器所需的介面"""
+    def __init__(self, chunks: int, chunk_chars: int, seed: int):
+        rng = random.Random(seed)
+        self.chunks = []
+        for index in range(chunks):
+            parts = [f"[PAGE {index + 1}]"]
+            length = 0
+            while length < chunk_chars:
+                paragraph = rng.choice(PARAGRAPHS)
+                parts.append(paragraph)
+                length += len(paragraph) + 1
+            self.chunks.append({
+                "_id": f"chunk-{index}",
+                "text": "\n".join(parts),
+                "metadata": {"start_page": str(index + 1), "end_page": str(index + 1), "has_structured_data": index % 4 == 0}
+            })
+        self.summary_cache = {}
+    
+    def find_chunks_without_summary(self, company_name=None, file_name=None):
+        return [{"_id": chunk["_id"], "text": chunk["text"]} for chunk in self.chunks if "summary" not in chunk]
+    
+    def get_cached_summaries(self, keys):
+        return {key: self.summary_cache[key] for key in keys if key in self.summary_cache}
+    
+    def save_chunk_summaries(self, updates, model):
+        by_id = {chunk["_id"]: chunk for chunk in self.chunks}
+        for update in updates:
+            by_id[update["_id"]].update(summary=update["summary"], key_figures=update["key_figures"])
+            self.summary_cache[update["key"]] = {"summary": update["summary"], "key_figures": update["key_figures"]}
+        return len(updates)
+    
+    def clear_summaries(self):
+        """移除文檔塊上的摘要（保留快取），模擬重新匯入相同內容"""
+        for chunk in self.chunks:
+            chunk.pop("summary", None)
+            chunk.pop("key_figures", None)
+    
+    def search_similar_multi(self, query_texts, limits, company_filter=None, quarter_filter=None, prioritize_tables=False, max_results=30):
+        return [
+            dict(chunk, score=0.9 - rank * 0.01)
+            for rank, chunk in enumerate(self.chunks[:max_results])
+        ]
+
+def run(chunks: int, chunk_chars: int, raw_top_n: int, seed: int) -> dict:
+    vector_store = SyntheticVectorStore(chunks, chunk_chars, seed)
+    batch_size = settings.get("chunk_summary.batch_size", 5)
+    summary_chars = settings.get("chunk_summary.max_summary_chars", 400)
+    
+    # 產生摘要，第二次（相同內容重新匯入）應全部命中快取
+    with StubLLMServer(reply=build_summary_reply(batch_size, summary_chars)) as server:
+        summarizer = ChunkSummarizer(client=OpenAI(api_key="stub", base_url=server.base_url))
+        first = summarizer.summarize_pending_chunks(vector_store)
+        summary_calls = len(server.requests)
+        
+        vector_store.clear_summaries()
+        second = summarizer.summarize_pending_chunks(vector_store)
+        repeat_calls = len(server.requests) - summary_calls
+    
+    analysis_settings = settings.config.setdefault("analysis_settings", {})
+    original = {key: analysis_settings.get(key) for key in ("context_mode", "summary_raw_top_n")}
+    analysis_settings["summary_raw_top_n"] = raw_top_n
+    
+    prompt_bytes = {}
+    prompt_chars = {}
+    try:
+        for mode in ("raw", "summary"):
+            analysis_settings["context_mode"] = mode
+            with StubLLMServer() as server:
+                analyzer = RAGAnalyzer(client=OpenAI(api_key="stub", base_url=server.base_url))
+                for query in QUERIES:
+                    analyzer.enhanced_rag_process(query, vector_store, "Playtika", "2025_Q1", "Revenue, Income")
+                prompt_bytes[mode] = [len(StubLLMServer.serialize_prompt(body["messages"])) for body in server.requests]
+                prompt_chars[mode] = analyzer.usage_stats["prompt_chars"]
+    finally:
+        for key, value in original.items():
+            if value is None:
+                analysis_settings.pop(key, None)
+            else:
+                analysis_settings[key] = value
+    
+    raw_total = sum(prompt_bytes["raw"])
+    summary_total = sum(prompt_bytes["summary"])
+    return {
+        "chunks": chunks,
+        "average_chunk_chars": round(sum(len(chunk["text"]) for chunk in vector_store.chunks) / chunks),
+        "summary_raw_top_n": raw_top_n,
+        "summarization": {
+            "batch_size": batch_size,
+            "llm_calls": summary_calls,
+            "summarized": first["summarized"],
+            "failed": first["failed"],
+            "repeat_llm_calls": repeat_calls,
+            "repeat_cached": second["cached"] - first["cached"]
+        },
+        "prompt_bytes": prompt_bytes,
+        "prompt_chars": prompt_chars,
+        "reduction_bytes": round(raw_total / summary_total, 2) if summary_total else None,
+        "reduction_chars": round(prompt_chars["raw"] / prompt_chars["summary"], 2) if prompt_chars.get("summary") else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="摘要上下文基準測試")
+    parser.add_argument("--chunks", type=int, default=30, help="檢索結果的分塊數量（與 search_similar_multi 的 max_results 相同）")
+    parser.add_argument("--chunk-chars", type=int, default=6000, help="每個分塊的約略字元數")
+    parser.add_argument("--raw-top-n", type=int, default=settings.get("analysis_settings.summary_raw_top_n", 1), help="summary 模式下使用原文的塊數")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.chunks, args.chunk_chars, args.raw_top_n, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
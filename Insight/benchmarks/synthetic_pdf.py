@@ -0,0 +1,257 @@
+"""
+合成多語財報 PDF
+
+以 PyMuPDF 產生與實際財報結構相近的 PDF，供基準測試離線使用：
+1. 英文、韓文與中文段落（每頁一種語言，使用 PyMuPDF 內建的 CJK 字型）
+2. 格線表格（find_tables 可偵測的框線表格，欄位名稱混合三種語言）
+3. 只有圖像的掃描頁（整頁為點陣圖，沒有文字層，文字提取結果為空，需 OCR）
+4. 每頁一句含唯一專案代號的關鍵句，並記錄其頁碼，作為檢索評估的標準答案
+
+檔名與資料夾依 file_processing 的慣例（{公司}_財報資料/{公司}_{年}Q{季}季報.pdf），
+產生的資料夾可直接作為 base_directory 以 main.py 或 pipeline.py 處理。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.synthetic_pdf --output synthetic_reports --companies 2 --quarters 4 --pages 40
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from functools import lru_cache
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from benchmarks.text_compression_benchmark import TABLE_ROWS
+
+LANGUAGES = ("en", "ko", "zh")
+
+PROSE = {
+    "en": [
+        "Total revenue for the quarter was {value} million dollars, {direction} {pct}% year over year.",
+        "Average daily active users reached {value} thousand while paying users grew {pct}% sequentially.",
+        "Adjusted EBITDA was {value} million dollars, representing a margin of {pct}% of revenue.",
+        "Marketing expenses were reallocated toward {product} to improve payer conversion and retention.",
+        "Management expects foreign exchange movements to affect reported results in the coming quarters.",
+    ],
+    "ko": [
+        "당사의 분기 매출액은 {value}억원으로 전년 동기 대비 {pct}% {direction}했습니다.",
+        "{product} 일평균 이용자 수는 {value}천 명을 기록했으며 결제 이용자는 {pct}% 증가했습니다.",
+        "영업이익은 {value}억원이며 영업이익률은 {pct}%입니다.",
+        "마케팅 비용은 {product} 중심으로 재배치되어 이용자 유지율 개선에 기여했습니다.",
+        "환율 변동과 시장 경쟁 심화는 향후 실적에 영향을 줄 수 있는 주요 위험 요인입니다.",
+    ],
+    "zh": [
+        "本季合併營收為 {value} 百萬美元，較去年同期{direction} {pct}%。",
+        "{product} 的每日活躍用戶達 {value} 千人，付費用戶較上季成長 {pct}%。",
+        "調整後 EBITDA 為 {value} 百萬美元，佔營收比率為 {pct}%。",
+        "行銷費用重新配置於 {product}，以提升付費轉換率與用戶留存。",
+        "經營團隊持續評估匯率變動與總體經濟風險對未來營運的影響。",
+    ],
+}
+DIRECTIONS = {"en": ["up", "down"], "ko": ["증가", "감소"], "zh": ["成長", "減少"]}
+PRODUCTS = ["Slotomania", "Bingo Blitz", "Solitaire Grand Harvest", "DoubleDown Casino", "Lineage M", "Marvel Future Fight"]
+
+# 關鍵句與對應的問題：{code} 為唯一的專案代號，{region} 依語言翻譯
+REGIONS = [
+    {"en": "Japan", "ko": "일본", "zh": "日本"},
+    {"en": "Korea", "ko": "한국", "zh": "韓國"},
+    {"en": "Taiwan", "ko": "대만", "zh": "台灣"},
+    {"en": "Germany", "ko": "독일", "zh": "德國"},
+    {"en": "Brazil", "ko": "브라질", "zh": "巴西"},
+    {"en": "Canada", "ko": "캐나다", "zh": "加拿大"},
+]
+CODENAMES = ["Aurora", "Falcon", "Harbor", "Juniper", "Meridian", "Nimbus", "Orchid", "Quartz", "Sierra", "Tundra"]
+FACTS = {
+    "en": ("Project {code} generated revenue of {value} million dollars in {region} during the quarter.",
+           "How much revenue did project {code} generate in {region}?"),
+    "ko": ("프로젝트 {code}의 {region} 매출은 이번 분기에 {value}억원을 기록했습니다.",
+           "프로젝트 {code}의 {region} 매출은 얼마입니까?"),
+    "zh": ("{code} 專案本季在{region}的營收為 {value} 百萬美元。",
+           "{code} 專案在{region}的營收是多少？"),
+}
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4
+MARGIN = 50
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+
+def font_for(text: str) -> str:
+    """依文字選擇 PyMuPDF 內建字型：韓文、中文或 Helvetica"""
+    if any("가" <= char <= "힣" or "ᄀ" <= char <= "ᇿ" or "㄰" <= char <= "㆏" for char in text):
+        return "korea"
+    if any(ord(char) >= 0x2e80 for char in text):
+        return "china-t"
+    return "helv"
+
+@lru_cache(maxsize=None)
+def char_width(char: str, fontname: str) -> float:
+    """字元以 insert_text 寫入時的寬度（內建 CJK 字型的半形字元也佔一個字寬）"""
+    return fitz.get_text_length(char, fontname=fontname, fontsize=FONT_SIZE)
+
+def wrap(text: str, max_width: float) -> List[str]:
+    """依實際字寬換行，英文盡量在空白處斷行"""
+    fontname = font_for(text)
+    lines, line, width = [], "", 0.0
+    for char in text:
+        if width + char_width(char, fontname) > max_width and line:
+            cut = line.rfind(" ")
+            if cut > len(line) // 2:
+                lines.append(line[:cut])
+                line = line[cut + 1:]
+            else:
+                lines.append(line)
+                line = ""
+            width = sum(char_width(c, fontname) for c in line)
+        line += char
+        width += char_width(char, fontname)
+    if line:
+        lines.append(line)
+    return lines
+
+def prose(rng: random.Random, language: str) -> str:
+    return rng.choice(PROSE[language]).format(
+        value=f"{rng.uniform(10, 9000):,.1f}",
+        pct=f"{rng.uniform(0, 40):.1f}",
+        direction=rng.choice(DIRECTIONS[language]),
+        product=rng.choice(PRODUCTS)
+    )
+
+def fact(rng: random.Random, language: str, page: int, image_only: bool) -> Dict:
+    """產生一頁的關鍵句與對應問題（各語言的問題都保留，供跨語言檢索評估）"""
+    code = f"{rng.choice(CODENAMES)}-{page:03d}"
+    region = rng.choice(REGIONS)
+    value = f"{rng.uniform(10, 900):,.1f}"
+    sentence_template, _ = FACTS[language]
+    return {
+        "page": page,
+        "language": language,
+        "image_only": image_only,
+        "code": code,
+        "text": sentence_template.format(code=code, region=region[language], value=value),
+        "answer": value,
+        "questions": {lang: FACTS[lang][1].format(code=code, region=region[lang]) for lang in LANGUAGES}
+    }
+
+def draw_lines(page, lines: List[str], y: float) -> float:
+    """逐行寫入文字，返回下一行的位置"""
+    for line in lines:
+        if y > PAGE_HEIGHT - MARGIN:
+            break
+        page.insert_text((MARGIN, y), line, fontname=font_for(line), fontsize=FONT_SIZE)
+        y += LINE_HEIGHT
+    return y
+
+def draw_table(page, rng: random.Random, y: float, rows: int = 5) -> float:
+    """繪製格線表格（第一列為欄位名稱），返回表格下方的位置"""
+    header = ["Item", "Q1", "Q2", "Q3", "Q4"]
+    body = [[label] + [f"{rng.uniform(10, 9000):,.1f}" for _ in range(4)] for label in rng.sample(TABLE_ROWS, min(rows, len(TABLE_ROWS)))]
+    column_widths = [155, 85, 85, 85, 85]
+    row_height = 18
+    for row in [header] + body:
+        x = MARGIN
+        for width, cell in zip(column_widths, row):
+            rect = fitz.Rect(x, y, x + width, y + row_height)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.6)
+            page.insert_text((rect.x0 + 4, rect.y1 - 5), cell, fontname=font_for(cell), fontsize=FONT_SIZE - 1)
+            x += width
+        y += row_height
+    return y + LINE_HEIGHT
+
+def fill_page(page, rng: random.Random, language: str, heading: str, page_fact: Dict, with_table: bool):
+    """寫入一頁內容：標題、段落（隨機位置插入關鍵句）與可選的格線表格"""
+    max_width = PAGE_WIDTH - 2 * MARGIN
+    y = draw_lines(page, [heading], MARGIN + FONT_SIZE) + LINE_HEIGHT / 2
+    
+    sentences = [prose(rng, language) for _ in range(rng.randint(10, 16))]
+    sentences.insert(rng.randint(0, len(sentences)), page_fact["text"])
+    middle = len(sentences) // 2
+    y = draw_lines(page, [line for sentence in sentences[:middle] for line in wrap(sentence, max_width)], y)
+    if with_table:
+        y = draw_table(page, rng, y + LINE_HEIGHT / 2)
+    draw_lines(page, [line for sentence in sentences[middle:] for line in wrap(sentence, max_width)], y)
+
+def build_report(path: str, company: str, quarter: str, pages: int, seed: int = 0,
+                 table_every: int = 3, image_only_every: int = 10, dpi: int = 100) -> Dict:
+    """產生單一合成財報 PDF，返回頁面、表格、語言與關鍵句等標準答案
+
+    每 table_every 頁有一個格線表格，每 image_only_every 頁為只有圖像的掃描頁（0 表示不產生）。
+    """
+    rng = random.Random(f"{seed}:{company}:{quarter}")
+    document = fitz.open()
+    facts, image_only_pages, table_pages, languages = [], [], [], {language: 0 for language in LANGUAGES}
+    
+    for page_number in range(1, pages + 1):
+        language = LANGUAGES[(page_number + rng.randint(0, 2)) % len(LANGUAGES)]
+        image_only = bool(image_only_every) and page_number % image_only_every == 0
+        with_table = bool(table_every) and page_number % table_every == 0
+        page_fact = fact(rng, language, page_number, image_only)
+        heading = f"{company} {quarter} Financial Report - Page {page_number}"
+        
+        page = document.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        if image_only:
+            # 先在暫存文件中排版，再將整頁點陣圖插入（模擬掃描頁）
+            scratch = fitz.open()
+            scratch_page = scratch.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            fill_page(scratch_page, rng, language, heading, page_fact, with_table)
+            page.insert_image(page.rect, pixmap=scratch_page.get_pixmap(dpi=dpi))
+            scratch.close()
+            image_only_pages.append(page_number)
+        else:
+            fill_page(page, rng, language, heading, page_fact, with_table)
+            if with_table:
+                table_pages.append(page_number)
+        
+        languages[language] += 1
+        facts.append(page_fact)
+    
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    document.save(path, garbage=3, deflate=True)
+    document.close()
+    return {
+        "path": path,
+        "company": company,
+        "quarter": quarter,
+        "pages": pages,
+        "bytes": os.path.getsize(path),
+        "languages": languages,
+        "table_pages": table_pages,
+        "image_only_pages": image_only_pages,
+        "facts": facts
+    }
+
+def build_corpus(directory: str, companies: int = 2, quarters: int = 2, pages: int = 20, seed: int = 0, year: int = 2025, **options) -> List[Dict]:
+    """在 directory 下產生 companies x quarters 份合成財報，並寫入 manifest.json"""
+    reports = []
+    for company_index in range(companies):
+        company = f"SynthCo{company_index}"
+        for quarter_index in range(1, quarters + 1):
+            file_name = f"{company}_{year}Q{quarter_index}季報.pdf"
+            path = os.path.join(directory, f"{company}_財報資料", file_name)
+            reports.append(build_report(path, company, f"{year}_Q{quarter_index}", pages, seed, **options))
+    
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(reports, file, ensure_ascii=False, indent=2)
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成多語財報 PDF")
+    parser.add_argument("--output", required=True, help="輸出資料夾")
+    parser.add_argument("--companies", type=int, default=2, help="公司數量")
+    parser.add_argument("--quarters", type=int, default=2, help="每家公司的季度數量")
+    parser.add_argument("--pages", type=int, default=20, help="每份財報的頁數")
+    parser.add_argument("--table-every", type=int, default=3, help="每幾頁一個格線表格（0 表示不產生）")
+    parser.add_argument("--image-only-every", type=int, default=10, help="每幾頁一個只有圖像的掃描頁（0 表示不產生）")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    args = parser.parse_args()
+    
+    reports = build_corpus(args.output, args.companies, args.quarters, args.pages, args.seed,
+                           table_every=args.table_every, image_only_every=args.image_only_every)
+    print(json.dumps([{key: report[key] for key in ("path", "pages", "bytes", "languages", "table_pages", "image_only_pages")} for report in reports],
+                     ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+表格分區檢索基準測試
+
+以合成向量比較表格優先查詢的兩種選取方式（不含資料庫讀取時間）：
+- 舊版：對所有文檔塊排序並建立結果，再以兩次列表篩選區分表格與非表格
+- 表格分區：文檔塊與表格分區各自部分排序取前 k 個，保證表格名額後合併
+並記錄每次查詢的耗時與表格佔上下文的比例。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.table_partition_benchmark --chunks 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.vector_store import EnhancedMongoDBVectorStore
+
+def legacy_select_top(similarities, doc_info, limit):
+    """舊版表格優先選取（作為對照）"""
+    order = np.argsort(-similarities, kind='stable')
+    results_with_scores = [
+        {
+            'text': doc_info[i]['text'],
+            'metadata': doc_info[i]['metadata'],
+            'score': float(similarities[i]),
+            '_id': doc_info[i]['_id']
+        }
+        for i in order
+    ]
+    
+    table_results = [r for r in results_with_scores if r.get('metadata', {}).get('has_structured_data', False)]
+    non_table_results = [r for r in results_with_scores if not r.get('metadata', {}).get('has_structured_data', False)]
+    
+    final_results = []
+    table_limit = min(len(table_results), limit // 2)
+    final_results.extend(table_results[:table_limit])
+    remaining_limit = limit - len(final_results)
+    final_results.extend(non_table_results[:remaining_limit])
+    return final_results
+
+def build_partition(rng, count, dims, prefix, table_ratio, text_length):
+    """產生合成候選塊與向量"""
+    embeddings = rng.standard_normal((count, dims)).astype(np.float32)
+    doc_info = [
+        {
+            'text': f"{prefix} {i} " + "x" * text_length,
+            'metadata': {'has_structured_data': bool(rng.random() < table_ratio), 'start_page': str(i % 50 + 1)},
+            '_id': f"{prefix}-{i}"
+        }
+        for i in range(count)
+    ]
+    return doc_info, embeddings
+
+def table_share(results):
+    """表格結果佔結果數與字元數的比例"""
+    if not results:
+        return 0.0, 0.0
+    tables = [r for r in results if r['metadata'].get('has_structured_data', False)]
+    total_chars = sum(len(r['text']) for r in results)
+    return len(tables) / len(results), sum(len(r['text']) for r in tables) / total_chars
+
+def run(chunk_counts, tables_per_chunk: float, dims: int, queries: int, limit: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    cases = []
+    
+    for chunks in chunk_counts:
+        # 舊版：表格內容僅以文檔塊的 has_structured_data 標記
+        doc_info, doc_embeddings = build_partition(rng, chunks, dims, "chunk", 0.3, 3000)
+        table_count = max(1, int(chunks * tables_per_chunk))
+        table_info, table_embeddings = build_partition(rng, table_count, dims, "table", 1.0, 600)
+        query_embeddings = rng.standard_normal((queries, dims)).astype(np.float32)
+        
+        start = time.perf_counter()
+        similarities = EnhancedMongoDBVectorStore._cosine_scores(query_embeddings, doc_embeddings)
+        legacy_results = [legacy_select_top(similarities[q], doc_info, limit) for q in range(queries)]
+        legacy_seconds = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        similarities = EnhancedMongoDBVectorStore._cosine_scores(query_embeddings, doc_embeddings)
+        table_similarities = EnhancedMongoDBVectorStore._cosine_scores(query_embeddings, table_embeddings)
+        partition_results = [
+            EnhancedMongoDBVectorStore._merge_partitions(similarities[q], doc_info, table_similarities[q], table_info, limit, 0.5)
+            for q in range(queries)
+        ]
+        partition_seconds = time.perf_counter() - start
+        
+        legacy_share = [table_share(r) for r in legacy_results]
+        partition_share = [table_share(r) for r in partition_results]
+        
+        cases.append({
+            "chunks": chunks,
+            "table_chunks": table_count,
+            "queries": queries,
+            "limit": limit,
+            "legacy_ms_per_query": round(legacy_seconds * 1000 / queries, 3),
+            "partition_ms_per_query": round(partition_seconds * 1000 / queries, 3),
+            "speedup": round(legacy_seconds / partition_seconds, 2) if partition_seconds else None,
+            "legacy_table_share": round(float(np.mean([s[0] for s in legacy_share])), 3),
+            "partition_table_share": round(float(np.mean([s[0] for s in partition_share])), 3),
+            "legacy_table_char_share": round(float(np.mean([s[1] for s in legacy_share])), 3),
+            "partition_table_char_share": round(float(np.mean([s[1] for s in partition_share])), 3)
+        })
+    
+    return {"dims": dims, "seed": seed, "cases": cases}
+
+def main():
+    parser = argparse.ArgumentParser(description="表格分區檢索基準測試")
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 100000], help="文檔塊數量")
+    parser.add_argument("--tables-per-chunk", type=float, default=0.5, help="每個文檔塊對應的表格塊數量")
+    parser.add_argument("--dims", type=int, default=384, help="向量維度")
+    parser.add_argument("--queries", type=int, default=8, help="子查詢數量")
+    parser.add_argument("--limit", type=int, default=20, help="每個子查詢的結果數量")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.chunks, args.tables_per_chunk, args.dims, args.queries, args.limit, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+文檔塊文字壓縮基準測試
+
+以合成的多語言財報文檔塊比較三種文字儲存方式的大小與解壓耗時：
+原始 UTF-8、無字典 zstd、共用訓練字典的 zstd（ChunkTextCodec），
+並估算每次檢索的文字傳輸量（讀取所有候選塊文字 vs 只讀取最終 top-k 結果的文字）。
+
+執行方式（於 Insight 目錄）：
+    python -m benchmarks.text_compression_benchmark --chunks 2000 --candidates 600 --top-k 30
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.text_codec import ChunkTextCodec
+
+SENTENCE_TEMPLATES = [
+    "本公司{quarter}合併營收為新台幣{value}百萬元，較去年同期{direction}{pct}%，主要受惠於{product}的穩定表現。",
+    "Total revenue for {quarter} was ${value} million, {direction_en} {pct}% year over year, driven by {product}.",
+    "{product} 매출은 {value}억원으로 전년 동기 대비 {pct}% {direction_ko}했습니다.",
+    "Adjusted EBITDA was ${value} million, representing a margin of {pct}% of revenue.",
+    "經營團隊持續投入{product}的新市場拓展，並審慎評估匯率與總體經濟風險。",
+    "Average daily active users reached {value} thousand, while paying users grew {pct}% sequentially.",
+]
+PRODUCTS = ["Slotomania", "Bingo Blitz", "Solitaire Grand Harvest", "DoubleDown Casino", "Lineage M", "Marvel Future Fight", "社交博弈", "休閒遊戲"]
+TABLE_ROWS = ["Revenue", "Cost of revenue", "Operating expenses", "Operating income", "Net income", "營業收入", "營業利益", "매출액"]
+
+def build_chunk(rng: random.Random, chunk_chars: int, page: int) -> str:
+    """產生一個含段落與表格列的合成文檔塊"""
+    parts = [f"[PAGE {page}]"]
+    length = 0
+    while length < chunk_chars:
+        if rng.random() < 0.25:
+            row = rng.choice(TABLE_ROWS)
+            line = f"{row} | " + " | ".join(f"{rng.uniform(10, 9000):,.1f}" for _ in range(4))
+        else:
+            line = rng.choice(SENTENCE_TEMPLATES).format(
+                quarter=f"Q{rng.randint(1, 4)} {rng.randint(2021, 2025)}",
+                value=f"{rng.uniform(10, 9000):,.1f}",
+                pct=f"{rng.uniform(0, 40):.1f}",
+                direction=rng.choice(["成長", "減少"]),
+                direction_en=rng.choice(["up", "down"]),
+                direction_ko=rng.choice(["증가", "감소"]),
+                product=rng.choice(PRODUCTS)
+            )
+        parts.append(line)
+        length += len(line) + 1
+    return "\n".join(parts)
+
+def run(chunks: int, chunk_chars: int, training_chunks: int, candidates: int, top_k: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    texts = [build_chunk(rng, chunk_chars, index + 1) for index in range(chunks)]
+    raw_sizes = [len(text.encode("utf-8")) for text in texts]
+    
+    plain_codec = ChunkTextCodec(enabled=True)
+    plain_sizes = [len(plain_codec.compress(text)) for text in texts]
+    
+    dict_codec = ChunkTextCodec(enabled=True)
+    start = time.perf_counter()
+    dict_id = dict_codec.train_dictionary(texts[:training_chunks])
+    train_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    compressed = [dict_codec.compress(text) for text in texts]
+    compress_seconds = time.perf_counter() - start
+    dict_sizes = [len(data) for data in compressed]
+    
+    start = time.perf_counter()
+    restored = [dict_codec.decompress(data) for data in compressed]
+    decompress_seconds = time.perf_counter() - start
+    
+    average_raw = sum(raw_sizes) / chunks
+    average_dict = sum(dict_sizes) / chunks
+    return {
+        "chunks": chunks,
+        "average_chunk_chars": round(sum(len(text) for text in texts) / chunks),
+        "dict_id": dict_id,
+        "round_trip_identical": restored == texts,
+        "bytes": {
+            "raw_utf8": sum(raw_sizes),
+            "zstd_no_dictionary": sum(plain_sizes),
+            "zstd_dictionary": sum(dict_sizes)
+        },
+        "ratio": {
+            "zstd_no_dictionary": round(sum(raw_sizes) / sum(plain_sizes), 2),
+            "zstd_dictionary": round(sum(raw_sizes) / sum(dict_sizes), 2)
+        },
+        "seconds": {
+            "train_dictionary": round(train_seconds, 3),
+            "compress_per_chunk_ms": round(compress_seconds * 1000 / chunks, 4),
+            "decompress_per_chunk_ms": round(decompress_seconds * 1000 / chunks, 4)
+        },
+        "per_query_text_bytes": {
+            "all_candidates_raw": round(candidates * average_raw),
+            "top_k_raw": round(min(top_k, candidates) * average_raw),
+            "top_k_compressed": round(min(top_k, candidates) * average_dict)
+        }
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="文檔塊文字壓縮基準測試")
+    parser.add_argument("--chunks", type=int, default=2000, help="文檔塊數量")
+    parser.add_argument("--chunk-chars", type=int, default=6000, help="每個文檔塊的約略字元數")
+    parser.add_argument("--training-chunks", type=int, default=500, help="訓練字典使用的文檔塊數量")
+    parser.add_argument("--candidates", type=int, default=600, help="每次檢索的候選塊數量（單一公司-季度）")
+    parser.add_argument("--top-k", type=int, default=30, help="每次檢索最終返回的結果數量")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--output", help="JSON 報告輸出路徑")
+    args = parser.parse_args()
+    
+    report = run(args.chunks, args.chunk_chars, args.training_chunks, args.candidates, args.top_k, args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    
+    if not report["round_trip_identical"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -79,6 +79,34 @@ class Settings:
     def analysis_collection_name(self) -> str:
         return self.get("mongodb_settings.analysis_collection_name")
     
+    @property
+    def files_collection_name(self) -> str:
+        return self.get("mongodb_settings.files_collection_name", "files")
+    
+    @property
+    def facts_collection_name(self) -> str:
+        return self.get("mongodb_settings.facts_collection_name", "financial_facts")
+    
+    @property
+    def table_collection_name(self) -> str:
+        return self.get("mongodb_settings.table_collection_name", "financial_analysis_tables")
+    
+    @property
+    def summary_cache_collection_name(self) -> str:
+        return self.get("mongodb_settings.summary_cache_collection_name", "chunk_summary_cache")
+    
+    @property
+    def text_dictionary_collection_name(self) -> str:
+        return self.get("mongodb_settings.text_dictionary_collection_name", "chunk_text_dictionaries")
+    
+    @property
+    def pipeline_state_collection_name(self) -> str:
+        return self.get("mongodb_settings.pipeline_state_collection_name", "pipeline_state")
+    
+    @property
+    def job_queue_collection_name(self) -> str:
+        return self.get("mongodb_settings.job_queue_collection_name", "ingest_jobs")
+    
     @property
     def base_directory(self) -> str:
         return self.get("file_processing.base_directory")
@@ -0,0 +1,283 @@
+"""
+分散式財報向量化工作程序
+
+discover 步驟為每個財報檔案在 ingest_jobs 集合加入一個工作；任意數量的工作程序（同一台或多台主機）
+以 find_one_and_update 原子地領取工作並取得租約，處理期間定期送出心跳延長租約，
+完成提取、OCR、分塊與向量化後標記工作完成。工作程序中斷時租約到期，工作會重新排入佇列。
+
+多台主機執行時，各主機需能以相同路徑讀取財報檔案（例如共用掛載的 base_directory），並連線到同一個 MongoDB。
+
+執行方式（於 Insight 目錄）：
+    python ingest_worker.py enqueue                  # 掃描財報資料夾，為每個新增或變更的檔案加入工作
+    python ingest_worker.py work                     # 啟動一個工作程序，持續等待新工作
+    python ingest_worker.py work --processes 4 --exit-when-empty  # 在本機啟動 4 個工作程序，佇列清空後結束
+    python ingest_worker.py status                   # 佇列狀態與各工作程序的吞吐量
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from pymongo import MongoClient
+
+from config.settings import settings
+from utils.logger import setup_logger, get_logger
+from utils.metrics import metrics
+from processors.chunker import split_text
+from models.vector_store import EnhancedMongoDBVectorStore
+from models.job_queue import JobQueue
+from pipeline import PipelineRunner, ingest_extracted
+
+logger = get_logger(__name__)
+
+def create_job_queue(database=None) -> JobQueue:
+    """依設定建立工作佇列；未指定資料庫時直接連線 MongoDB（不需建立向量資料庫或載入向量模型）"""
+    if database is None:
+        database = MongoClient(settings.mongodb_uri)[settings.database_name]
+    return JobQueue(
+        database[settings.job_queue_collection_name],
+        lease_seconds=settings.get("ingest_queue.lease_seconds", 300),
+        max_attempts=settings.get("ingest_queue.max_attempts", 3)
+    )
+
+def job_version(item: Dict) -> str:
+    """工作版本：檔案內容、分塊大小或向量模型改變時需要重新處理"""
+    return f"{item['sha256']}:{settings.get('vector_search.chunk_max_tokens', 6000)}:{settings.embedding_model}"
+
+def enqueue_files(vector_store, queue: JobQueue, force: bool = False) -> Dict[str, int]:
+    """掃描財報資料夾並為每個檔案加入工作（已向量化且未變更的檔案略過，force=True 時全部加入）"""
+    runner = PipelineRunner(vector_store, stages=["discover"])
+    files = runner.discover()
+    counts = {"files": len(files), "enqueued": 0, "already_queued": 0, "indexed": 0, "duplicates": len(runner.duplicates)}
+    for item in files:
+        if item["indexed"] and not force:
+            counts["indexed"] += 1
+            continue
+        
+        payload = {key: item[key] for key in ("path", "company_name", "file_name", "year", "quarter", "sha256")}
+        if queue.enqueue(item["key"], job_version(item), payload, force=force):
+            counts["enqueued"] += 1
+        else:
+            counts["already_queued"] += 1
+    
+    logger.info(
+        f"檔案 {counts['files']} 個: 加入工作 {counts['enqueued']} 個，已在佇列 {counts['already_queued']} 個，"
+        f"已向量化略過 {counts['indexed']} 個，重複檔案略過 {counts['duplicates']} 個"
+    )
+    return counts
+
+class IngestWorker:
+    """領取工作並將財報檔案向量化的工作程序"""
+    def __init__(self, vector_store, queue: JobQueue, worker_id: str = None, summarizer=None,
+                 heartbeat_interval: float = None, poll_interval: float = None):
+        self.vector_store = vector_store
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.summarizer = summarizer
+        self.heartbeat_interval = heartbeat_interval or settings.get("ingest_queue.heartbeat_interval_seconds", 60)
+        self.poll_interval = settings.get("ingest_queue.poll_interval_seconds", 5) if poll_interval is None else poll_interval
+        self.chunk_max_tokens = settings.get("vector_search.chunk_max_tokens", 6000)
+        self.stats = {"jobs": 0, "failed": 0, "lost_leases": 0, "chunks": 0, "busy_seconds": 0.0}
+    
+    def extract(self, item: Dict) -> Dict:
+        """提取檔案文字與表格（自動判斷是否使用 OCR）"""
+        return self.vector_store.extract_file(item["path"], item["company_name"], sha256=item["sha256"])
+    
+    def process(self, item: Dict, still_owner=None) -> Dict:
+        """提取、分塊並向量化單一檔案（still_owner 在切換寫入版本前確認仍持有租約）"""
+        with metrics.labels(company=item["company_name"], file=item["file_name"]):
+            extracted = self.extract(item)
+            if not extracted["text"]:
+                raise ValueError("無法讀取檔案內容")
+            
+            chunks = split_text(extracted["text"], self.chunk_max_tokens)
+            if not chunks:
+                raise ValueError("分塊結果為空")
+            return ingest_extracted(self.vector_store, item, extracted, chunks, self.summarizer, still_owner=still_owner)
+    
+    def _keep_lease(self, job_id: str, stop: threading.Event, lost: threading.Event):
+        """處理期間定期延長租約，租約被收回時停止"""
+        while not stop.wait(self.heartbeat_interval):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                logger.warning(f"工作 {job_id} 的租約已被收回")
+                lost.set()
+                return
+    
+    def run_one(self) -> Optional[bool]:
+        """領取並處理一個工作，返回是否成功（沒有可領取的工作時返回 None）"""
+        job = self.queue.claim(self.worker_id)
+        if job is None:
+            return None
+        
+        job_id = job["_id"]
+        item = dict(job["payload"], key=job_id)
+        logger.info(f"[{self.worker_id}] 領取工作 {job_id}（第 {job['attempts']} 次嘗試）")
+        
+        stop, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=self._keep_lease, args=(job_id, stop, lost), daemon=True)
+        heartbeat.start()
+        
+        def still_owner() -> bool:
+            # 切換寫入版本前確認並延長租約，失去租約時放棄此次寫入，由接手的工作程序完成
+            if lost.is_set() or not self.queue.heartbeat(job_id, self.worker_id):
+                lost.set()
+                return False
+            return True
+        
+        start = time.perf_counter()
+        try:
+            result = self.process(item, still_owner)
+        except Exception as e:
+            if lost.is_set():
+                logger.warning(f"[{self.worker_id}] 工作 {job_id} 已失去租約，放棄寫入")
+                self.stats["lost_leases"] += 1
+                return False
+            seconds = time.perf_counter() - start
+            status = self.queue.fail(job_id, self.worker_id, str(e), seconds)
+            logger.error(f"[{self.worker_id}] 處理 {job_id} 時發生錯誤（{status or '租約已失效'}）: {e}")
+            self.stats["failed"] += 1
+            return False
+        finally:
+            stop.set()
+            heartbeat.join()
+        
+        seconds = time.perf_counter() - start
+        if not self.queue.complete(job_id, self.worker_id, seconds, **result) or lost.is_set():
+            # 切換寫入版本後才失去租約：接手的工作程序會以較晚開始、較新的寫入版本再次替換
+            logger.warning(f"[{self.worker_id}] 工作 {job_id} 已失去租約，結果不標記完成")
+            self.stats["lost_leases"] += 1
+            return False
+        
+        self.stats["jobs"] += 1
+        self.stats["chunks"] += result["chunks"]
+        self.stats["busy_seconds"] += seconds
+        logger.info(f"[{self.worker_id}] 完成工作 {job_id}: {result['chunks']} 個文檔塊，耗時 {seconds:.1f} 秒")
+        return True
+    
+    def run(self, exit_when_empty: bool = False, max_jobs: int = None) -> Dict:
+        """持續領取工作；exit_when_empty=True 時在佇列沒有等待或執行中的工作後結束"""
+        start = time.perf_counter()
+        logger.info(f"工作程序 {self.worker_id} 啟動")
+        while max_jobs is None or self.stats["jobs"] + self.stats["failed"] < max_jobs:
+            self.queue.requeue_expired()
+            if self.run_one() is not None:
+                continue
+            
+            if exit_when_empty and self.queue.active_count() == 0:
+                break
+            time.sleep(self.poll_interval)
+        
+        elapsed = time.perf_counter() - start
+        report = dict(self.stats, worker_id=self.worker_id, elapsed_seconds=round(elapsed, 2),
+                      busy_seconds=round(self.stats["busy_seconds"], 2),
+                      jobs_per_minute=round(self.stats["jobs"] * 60 / elapsed, 2) if elapsed > 0 else None)
+        logger.info(
+            f"工作程序 {self.worker_id} 結束: 完成 {report['jobs']} 個工作（{report['chunks']} 個文檔塊），"
+            f"失敗 {report['failed']} 個，{report['jobs_per_minute']} 個/分鐘"
+        )
+        return report
+
+def create_summarizer():
+    """依設定建立文檔塊摘要器（未啟用時返回 None）"""
+    if not settings.get("chunk_summary.enabled", False):
+        return None
+    from analyzers.chunk_summarizer import ChunkSummarizer
+    return ChunkSummarizer()
+
+def run_worker_process(exit_when_empty: bool, max_jobs: Optional[int], slot: int = 0):
+    """在子程序中建立獨立的資料庫連線與向量模型並執行工作程序（slot 為本機的工作程序編號）"""
+    setup_logger()
+    vector_store = EnhancedMongoDBVectorStore()
+    worker = IngestWorker(vector_store, create_job_queue(vector_store.db), summarizer=create_summarizer())
+    try:
+        worker.run(exit_when_empty, max_jobs)
+    except KeyboardInterrupt:
+        logger.info("工作程序中斷，未完成的工作將於租約到期後重新排入佇列")
+    finally:
+        vector_store.bulk_writer.close()
+        # 每個工作程序編號各自輸出指標檔案（textfile collector 會讀取目錄中所有 .prom 檔案），下次執行時覆寫
+        metrics.finish_run(
+            "ingest_worker", worker=f"{socket.gethostname()}_{slot}",
+            worker_stats=dict(worker.stats, worker_id=worker.worker_id)
+        )
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="分散式財報向量化工作程序")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    enqueue_parser = subparsers.add_parser("enqueue", help="掃描財報資料夾並加入工作")
+    enqueue_parser.add_argument("--force", action="store_true", help="已向量化且未變更的檔案也重新加入")
+    
+    work_parser = subparsers.add_parser("work", help="啟動工作程序")
+    work_parser.add_argument("--processes", type=int, default=1, help="在本機啟動的工作程序數量")
+    work_parser.add_argument("--exit-when-empty", action="store_true", help="佇列沒有等待或執行中的工作後結束")
+    work_parser.add_argument("--max-jobs", type=int, help="每個工作程序最多處理的工作數")
+    
+    status_parser = subparsers.add_parser("status", help="顯示佇列狀態與各工作程序的吞吐量")
+    status_parser.add_argument("--retry-failed", action="store_true", help="將失敗的工作重新排入佇列")
+    return parser.parse_args()
+
+def main():
+    """主程式"""
+    setup_logger()
+    args = parse_args()
+    
+    if not settings.validate_required_settings():
+        logger.error("設定驗證失敗，程式結束")
+        sys.exit(1)
+    
+    if args.command == "work":
+        started_at, start = JobQueue.now(), time.perf_counter()
+        if args.processes <= 1:
+            run_worker_process(args.exit_when_empty, args.max_jobs)
+        else:
+            context = multiprocessing.get_context("spawn")
+            processes = [
+                context.Process(target=run_worker_process, args=(args.exit_when_empty, args.max_jobs, slot))
+                for slot in range(args.processes)
+            ]
+            for process in processes:
+                process.start()
+            try:
+                for process in processes:
+                    process.join()
+            except KeyboardInterrupt:
+                for process in processes:
+                    process.join()
+        
+        # 本次執行的吞吐量（依工作程序數量比較時使用）
+        queue = create_job_queue()
+        elapsed = time.perf_counter() - start
+        workers = queue.worker_report(since=started_at)
+        jobs = sum(worker["jobs"] for worker in workers)
+        print(json.dumps({
+            "processes": args.processes,
+            "elapsed_seconds": round(elapsed, 2),
+            "jobs": jobs,
+            "chunks": sum(worker["chunks"] for worker in workers),
+            "jobs_per_minute": round(jobs * 60 / elapsed, 2) if elapsed > 0 else None,
+            "queue": queue.summary(),
+            "workers": workers
+        }, ensure_ascii=False, indent=2, default=str))
+        return
+    
+    if args.command == "enqueue":
+        # 掃描檔案只需要檔案清單，向量模型在第一次使用時才載入，此處不會載入
+        vector_store = EnhancedMongoDBVectorStore()
+        enqueue_files(vector_store, create_job_queue(vector_store.db), force=args.force)
+        vector_store.bulk_writer.close()
+    elif args.command == "status":
+        queue = create_job_queue()
+        if args.retry_failed:
+            logger.info(f"重新排入 {queue.retry_failed()} 個失敗的工作")
+        print(json.dumps({"queue": queue.summary(), "workers": queue.worker_report()}, ensure_ascii=False, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
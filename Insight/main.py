@@ -1,15 +1,18 @@
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
+import argparse
 
 from config.settings import settings
 from utils.logger import setup_logger, get_logger
+from utils.excel_exporter import StreamingExcelExporter, export_analysis_from_mongodb
 from utils.file_utils import (
-    find_report_folders, find_pdf_files, extract_company_name,
-    extract_year_and_quarter, create_output_directory, generate_excel_filename
+    find_report_folders, find_pdf_files, extract_company_name, extract_year_and_quarter,
+    classify_file, analysis_file_name, create_output_directory, generate_excel_filename
 )
+from utils.duplicate_detector import link_duplicates
+from utils.metrics import metrics
 from models.vector_store import EnhancedMongoDBVectorStore
 from analyzers.rag_analyzer import RAGAnalyzer
+from analyzers.chunk_summarizer import ChunkSummarizer
 
 # 設置日誌
 setup_logger()
@@ -20,7 +23,7 @@ def test_connections():
     try:
         # 測試OpenAI API
         from openai import OpenAI
-        client = OpenAI(api_key=settings.openai_api_key)
+        client = OpenAI(api_key=settings.openai_api_key, base_url=settings.get("openai_settings.base_url"))
         test_response = client.chat.completions.create(
             model=settings.llm_model,
             messages=[{"role": "user", "content": "測試連接"}],
@@ -41,29 +44,38 @@ def test_connections():
         return False
 
 def check_processed_files(vector_store):
-    """檢查哪些檔案已經處理過"""
-    pipeline = [
-        {
-            "$group": {
-                "_id": {
-                    "company": "$metadata.company_name",
-                    "file_name": "$metadata.file_name"
-                }
-            }
-        }
-    ]
-    
-    processed_files = list(vector_store.collection.aggregate(pipeline))
-    processed_set = set()
-    
-    for item in processed_files:
-        company = item['_id']['company']
-        file_name = item['_id']['file_name']
-        processed_set.add(f"{company}_{file_name}")
-    
-    return processed_set
+    """檢查哪些檔案已經處理過（讀取檔案清單，以 "公司_檔名" 為鍵）"""
+    return vector_store.get_file_manifest()
 
-def preprocess_all_companies(vector_store, force_reprocess=False):
+def find_duplicate_file_keys(vector_store, report_folders, manifest=None):
+    """找出重複的財報檔案並在檔案清單中連結至代表檔案，返回重複檔案的鍵（"公司_檔名"）"""
+    manifest = vector_store.get_file_manifest() if manifest is None else manifest
+    files = []
+    for folder in report_folders:
+        company_name = extract_company_name(folder)
+        for pdf_file in find_pdf_files(folder):
+            file_name = os.path.basename(pdf_file)
+            file_key = f"{company_name}_{file_name}"
+            status, sha256 = classify_file(pdf_file, manifest.get(file_key))
+            files.append({
+                "key": file_key,
+                "path": pdf_file,
+                "company_name": company_name,
+                "file_name": file_name,
+                "sha256": sha256,
+                "indexed": status == "unchanged"
+            })
+    
+    _, duplicates = link_duplicates(vector_store, files)
+    return set(duplicates)
+
+def create_chunk_summarizer():
+    """依設定建立文檔塊摘要器（未啟用時返回 None）"""
+    if not settings.get("chunk_summary.enabled", False):
+        return None
+    return ChunkSummarizer()
+
+def preprocess_all_companies(vector_store, force_reprocess=False, summarizer=None):
     """前處理：將所有公司的財報資料處理並存入MongoDB"""
     logger.info("=== 處理所有公司財報資料 ===")
     
@@ -72,17 +84,18 @@ def preprocess_all_companies(vector_store, force_reprocess=False):
     
     if existing_docs_count > 0 and not force_reprocess:
         logger.info(f"發現資料庫中已有 {existing_docs_count} 個文檔塊")
-        user_choice = input("是否要重新處理所有檔案？(y/N): ").lower()
+        user_choice = input(
+            "是否要重新處理內容或向量模型已變更的檔案？未變更的檔案會沿用現有向量資料，"
+            "需要全部重新向量化請執行 python pipeline.py --restart (y/N): "
+        ).lower()
         
         if user_choice != 'y':
             logger.info("跳過前處理階段，使用現有資料")
             return True
         else:
-            logger.info("清空向量資料庫，重新處理...")
-            vector_store.clear_collection()
+            logger.info("逐檔替換已變更檔案的向量資料...")
     elif force_reprocess:
-        logger.info("強制重新處理，清空向量資料庫...")
-        vector_store.clear_collection()
+        logger.info("強制重新處理，逐檔替換已變更檔案的向量資料...")
     
     # 尋找財報資料夾
     report_folders = find_report_folders(settings.base_directory)
@@ -92,9 +105,13 @@ def preprocess_all_companies(vector_store, force_reprocess=False):
         return False
     
     logger.info(f"找到 {len(report_folders)} 個財報資料夾")
+    manifest = vector_store.get_file_manifest()
+    duplicate_keys = find_duplicate_file_keys(vector_store, report_folders, manifest)
     
     total_processed = 0
     total_failed = 0
+    total_current = 0
+    current_file_keys = set()
     
     # 處理每個財報資料夾
     for folder in report_folders:
@@ -107,13 +124,26 @@ def preprocess_all_companies(vector_store, force_reprocess=False):
         
         for index, pdf_file in enumerate(pdf_files, 1):
             file_name = os.path.basename(pdf_file)
+            current_file_keys.add(f"{company_name}_{file_name}")
+            if f"{company_name}_{file_name}" in duplicate_keys:
+                logger.info(f"跳過重複檔案: {file_name}")
+                continue
+            
             year, quarter = extract_year_and_quarter(file_name)
             
             if not year or not quarter:
                 logger.warning(f"無法提取年份季度信息，跳過: {file_name}")
                 total_failed += 1
                 continue
-                
+            
+            # 內容與向量模型都未變更的檔案，現有的文檔塊已是最新，不重新向量化
+            manifest_entry = manifest.get(f"{company_name}_{file_name}")
+            status, sha256 = classify_file(pdf_file, manifest_entry)
+            if status == "unchanged" and manifest_entry.get("embedding_model", settings.embedding_model) == settings.embedding_model:
+                logger.info(f"內容與向量模型未變更，沿用現有向量資料: {file_name}")
+                total_current += 1
+                continue
+            
             logger.info(f"前處理第 {index}/{len(pdf_files)} 個檔案: {file_name}")
             
             # 智能處理流程
@@ -125,8 +155,8 @@ def preprocess_all_companies(vector_store, force_reprocess=False):
                 try:
                     logger.info(f"嘗試第 {current_attempt} 次處理: {file_name}")
                     
-                    # 使用智能PDF讀取
-                    pdf_text, total_pages = vector_store.read_pdf_enhanced(pdf_file, company_name)
+                    # 使用智能PDF讀取（內容未變更的檔案直接讀取提取結果快取）
+                    pdf_text, total_pages = vector_store.read_pdf_enhanced(pdf_file, company_name, sha256=sha256)
                     if not pdf_text:
                         logger.warning(f"無法讀取 {file_name}，跳過")
                         break
@@ -146,11 +176,19 @@ def preprocess_all_companies(vector_store, force_reprocess=False):
                         "attempt_number": current_attempt
                     }
                     
-                    doc_ids = vector_store.add_document_with_enhanced_chunking(pdf_text, metadata)
+                    # 以新版本替換該檔案的文檔塊、表格分區塊與財務數據
+                    doc_ids = vector_store.replace_file_chunks(pdf_text, metadata)
                     if not doc_ids:
                         logger.warning(f"無法處理 {file_name}，跳過")
                         break
                     
+                    vector_store.record_file_manifest(
+                        pdf_file, company_name, sha256, metadata, len(doc_ids),
+                        ingest_version=vector_store.last_ingest_version
+                    )
+                    if summarizer:
+                        summarizer.summarize_pending_chunks(vector_store, company_name, file_name)
+                    
                     if use_ocr:
                         logger.info(f"第{current_attempt}次嘗試 - OCR處理完成：提取了 {len(vector_store.current_images)} 個圖像頁面")
                     else:
@@ -171,17 +209,21 @@ def preprocess_all_companies(vector_store, force_reprocess=False):
         
         logger.info(f"{company_name} 前處理完成")
     
+    # 移除已不存在的檔案
+    vector_store.remove_stale_files(current_file_keys)
+    
     logger.info(f"\n=== 前處理完成 ===")
     logger.info(f"成功處理: {total_processed} 個檔案")
+    logger.info(f"未變更略過: {total_current} 個檔案")
     logger.info(f"處理失敗: {total_failed} 個檔案")
     
     # 檢查資料庫中的文檔數量
     total_docs = vector_store.collection.count_documents({})
     logger.info(f"向量資料庫中共有 {total_docs} 個文檔塊")
     
-    return total_processed > 0
+    return total_processed + total_current > 0
 
-def preprocess_new_files_only(vector_store):
+def preprocess_new_files_only(vector_store, summarizer=None):
     """只處理新增的檔案"""
     logger.info("=== 增量處理：只處理新檔案 ===")
     
@@ -189,10 +231,19 @@ def preprocess_new_files_only(vector_store):
     processed_files = check_processed_files(vector_store)
     logger.info(f"已處理檔案數量: {len(processed_files)}")
     
+    # 檔案清單建立前已處理的舊資料（有已啟用的文檔塊，但沒有檔案記錄或沒有內容雜湊），補登為未變更
+    legacy_files = set()
+    if vector_store.needs_legacy_backfill(processed_files):
+        legacy_files = vector_store.get_legacy_processed_files()
+        logger.info(f"發現 {len(legacy_files)} 個尚未記錄於檔案清單的已處理檔案")
+    
     # 尋找所有檔案
     report_folders = find_report_folders(settings.base_directory)
+    duplicate_keys = find_duplicate_file_keys(vector_store, report_folders, processed_files)
     
     new_files_processed = 0
+    changed_files_processed = 0
+    unchanged_files = 0
     
     for folder in report_folders:
         company_name = extract_company_name(folder)
@@ -201,13 +252,23 @@ def preprocess_new_files_only(vector_store):
         for pdf_file in pdf_files:
             file_name = os.path.basename(pdf_file)
             file_key = f"{company_name}_{file_name}"
+            if file_key in duplicate_keys:
+                logger.info(f"跳過重複檔案: {file_name}")
+                continue
+            
+            # 檢查檔案是否為新增或已變更
+            status, sha256 = classify_file(pdf_file, processed_files.get(file_key))
+            
+            if status == "new" and file_key in legacy_files:
+                vector_store.record_file_manifest(pdf_file, company_name, sha256)
+                status = "unchanged"
             
-            # 檢查是否已經處理過
-            if file_key in processed_files:
+            if status == "unchanged":
                 logger.info(f"跳過已處理檔案: {file_name}")
+                unchanged_files += 1
                 continue
             
-            logger.info(f"處理新檔案: {file_name}")
+            logger.info(f"處理{'新' if status == 'new' else '變更'}檔案: {file_name}")
             
             # 處理新檔案
             year, quarter = extract_year_and_quarter(file_name)
@@ -215,7 +276,7 @@ def preprocess_new_files_only(vector_store):
                 continue
             
             try:
-                pdf_text, total_pages = vector_store.read_pdf_enhanced(pdf_file, company_name)
+                pdf_text, total_pages = vector_store.read_pdf_enhanced(pdf_file, company_name, sha256=sha256)
                 if not pdf_text:
                     continue
                 
@@ -233,73 +294,100 @@ def preprocess_new_files_only(vector_store):
                     "attempt_number": 1
                 }
                 
-                doc_ids = vector_store.add_document_with_enhanced_chunking(pdf_text, metadata)
+                # 以新版本替換該檔案的文檔塊、表格分區塊與財務數據（變更檔案的舊塊在切換後才刪除）
+                doc_ids = vector_store.replace_file_chunks(pdf_text, metadata)
                 if doc_ids:
-                    new_files_processed += 1
-                    logger.info(f"成功處理新檔案: {file_name}")
+                    vector_store.record_file_manifest(
+                        pdf_file, company_name, sha256, metadata, len(doc_ids),
+                        ingest_version=vector_store.last_ingest_version
+                    )
+                    if summarizer:
+                        summarizer.summarize_pending_chunks(vector_store, company_name, file_name)
+                    if status == "new":
+                        new_files_processed += 1
+                    else:
+                        changed_files_processed += 1
+                    logger.info(f"成功處理{'新' if status == 'new' else '變更'}檔案: {file_name}")
                 
             except Exception as e:
                 logger.error(f"處理新檔案 {file_name} 時發生錯誤: {e}")
     
+    logger.info(f"未變更檔案: {unchanged_files} 個，變更檔案重新處理: {changed_files_processed} 個")
     logger.info(f"增量處理完成，新增 {new_files_processed} 個檔案")
-    return new_files_processed > 0
+    return new_files_processed + changed_files_processed > 0
 
-def analyze_companies_from_database(vector_store):
-    """從資料庫中分析各公司財報"""
+def flush_pending_analyses(vector_store, pending_analyses):
+    """批次保存累積的分析結果並清空暫存"""
+    if not pending_analyses:
+        return
+    
+    saved_docs = vector_store.save_analysis_batch_to_mongodb(pending_analyses)
+    
+    logger.info(f"批次保存 {len(pending_analyses)} 個公司-季度，共 {len(saved_docs)} 個分析結果到MongoDB")
+    for doc in saved_docs:
+        logger.info(f"  - {doc['action']}: {doc['company']} - {doc['title']} - {doc['quarter']}")
+    
+    pending_analyses.clear()
+
+def analyze_companies_from_database(vector_store, force=False, clear_existing=None):
+    """從資料庫中分析各公司財報，來源版本未變更的公司-季度將略過（force=True 時全部重新分析）
+    
+    clear_existing 為 None 時詢問是否清空舊的分析結果，True/False 時不詢問直接依設定處理。
+    """
     logger.info("\n=== 從資料庫分析各公司財報 ===")
     
     # 創建分析資料夾
     analysis_folder = create_output_directory(settings.base_directory)
     
-    # 創建Excel工作簿
-    excel_filename = generate_excel_filename()
-    combined_excel = os.path.join(analysis_folder, excel_filename)
-
-    wb_combined = Workbook()
-    wb_combined.remove(wb_combined.active)
+    # 創建串流Excel輸出（上次分析中斷時沿用其記錄檔續跑，force=True 時重新開始）
+    combined_excel = None if force else StreamingExcelExporter.find_interrupted(analysis_folder)
+    if combined_excel is None:
+        combined_excel = os.path.join(analysis_folder, generate_excel_filename())
+    exporter = StreamingExcelExporter(combined_excel, resume=not force)
+    if exporter.resumed:
+        logger.info(f"從中斷的分析記錄檔續跑，已完成 {len(exporter.resumed)} 個公司-季度: {exporter.journal_path}")
     
     # 選擇是否清空舊的分析結果
     existing_analysis_count = vector_store.analysis_collection.count_documents({})
     if existing_analysis_count > 0:
         logger.info(f"發現資料庫中已有 {existing_analysis_count} 筆分析結果")
-        clear_choice = input("是否要清空舊的分析結果？(y/N): ").lower()
+        # 指定 --mode 時已決定是否清空，不再詢問；互動模式清空前仍需再次確認
+        confirm = None if clear_existing is None else True
+        if clear_existing is None:
+            clear_existing = input("是否要清空舊的分析結果？(y/N): ").lower() == 'y'
         
-        if clear_choice == 'y':
+        if clear_existing:
             logger.info("清空舊的分析結果...")
-            vector_store.clear_analysis_collection()
+            vector_store.clear_analysis_collection(confirm=confirm)
         else:
             logger.info("保留現有分析結果，將使用upsert方式更新...")
     
-    # 從資料庫中獲取所有公司和季度信息
-    pipeline = [
-        {
-            "$group": {
-                "_id": {
-                    "company": "$metadata.company_name",
-                    "quarter": "$metadata.quarter"
-                }
-            }
-        },
-        {
-            "$sort": {
-                "_id.company": 1,
-                "_id.quarter": 1
-            }
-        }
-    ]
-    
-    company_quarters = list(vector_store.collection.aggregate(pipeline))
+    # 從資料庫中獲取所有公司和季度信息及來源版本指紋
+    company_quarters = vector_store.get_company_quarter_sources()
     logger.info(f"發現 {len(company_quarters)} 個公司-季度組合")
     
     # 按公司分組
     companies_data = {}
+    source_fingerprints = {}
     for item in company_quarters:
-        company = item['_id']['company']
-        quarter = item['_id']['quarter']
+        company = item['company']
+        quarter = item['quarter']
         
         if company not in companies_data:
             companies_data[company] = []
         companies_data[company].append(quarter)
+        source_fingerprints[(company, quarter)] = item['source_fingerprint']
+    
+    # 讀取已保存的分析結果，用於判斷來源是否有變更
+    saved_analyses = {} if force else vector_store.get_saved_analyses()
+    title_mapping = settings.get("analysis_settings.title_mapping", {})
+    analysis_types = settings.get("analysis_settings.analysis_types", ["company_overview", "business_strategy", "risks"])
+    expected_titles = {title_mapping.get(analysis_type, analysis_type) for analysis_type in analysis_types}
+    skipped_pairs = []
+    reanalyzed_pairs = []
+    resumed_pairs = []
+    pending_analyses = []
+    save_batch_size = settings.get("analysis_settings.save_batch_size", 10)
     
     logger.info(f"需要分析 {len(companies_data)} 家公司")
     
@@ -307,92 +395,76 @@ def analyze_companies_from_database(vector_store):
     rag_analyzer = RAGAnalyzer()
     
     # 為每家公司創建工作表並進行分析
-    headers = settings.get("excel_output.headers", ["年份_季度", "公司概況", "商業策略", "風險"])
-    column_widths = settings.get("excel_output.column_widths", {"A": 15, "B": 70, "C": 70, "D": 70})
-    row_height = settings.get("excel_output.row_height", 200)
-    
     for company_name, quarters in companies_data.items():
         logger.info(f"\n開始分析 {company_name} 的財報...")
         logger.info(f"找到季度: {quarters}")
         
         # 創建工作表
-        ws = wb_combined.create_sheet(title=company_name)
-        
-        # 設定樣式
-        header_font = Font(bold=True, size=12)
-        header_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-        header_alignment = Alignment(horizontal='center', vertical='center')
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        
-        # 設定列寬
-        for col_letter, width in column_widths.items():
-            ws.column_dimensions[col_letter].width = width
-        
-        row_index = 2
+        exporter.add_company(company_name)
         
         # 分析每個季度
         for quarter in sorted(quarters):
             try:
                 logger.info(f"分析 {company_name} - {quarter}")
                 
-                if "_" in quarter:
-                    year_part, quarter_part = quarter.split("_", 1)
-                    
-                    # 根據季度部分判斷報告類型並創建對應的虛擬檔名
-                    if quarter_part == "全年":
-                        dummy_file_name = f"{company_name}_{year_part}年報.pdf"
-                    elif quarter_part.startswith("Q"):
-                        dummy_file_name = f"{company_name}_{year_part}{quarter_part}季報.pdf"
-                    else:
-                        dummy_file_name = f"{company_name}_{quarter}.pdf"
-                else:
-                    dummy_file_name = f"{company_name}_{quarter}.pdf"
+                # 根據季度部分判斷報告類型並創建對應的虛擬檔名
+                dummy_file_name = analysis_file_name(company_name, quarter)
                 
                 logger.info(f"使用虛擬檔名: {dummy_file_name}")
                 
-                # 生成分析
-                analysis = rag_analyzer.generate_enhanced_business_analysis_with_fallback(
-                    vector_store, 
-                    dummy_file_name,  
-                    company_name, 
-                    quarter
-                )
+                source_fingerprint = source_fingerprints.get((company_name, quarter))
+                saved = saved_analyses.get((company_name, quarter))
+                resumed = exporter.resumed_analysis(company_name, quarter, source_fingerprint)
+                
+                # 來源版本未變更時沿用既有分析結果
+                if (saved and saved["fingerprints"] == {source_fingerprint}
+                        and expected_titles.issubset(saved["analyses"])):
+                    logger.info(f"來源未變更，略過重新分析: {company_name} - {quarter}")
+                    analysis = {
+                        analysis_type: saved["analyses"][title_mapping.get(analysis_type, analysis_type)]
+                        for analysis_type in analysis_types
+                    }
+                    skipped_pairs.append((company_name, quarter))
+                elif resumed:
+                    # 中斷的執行中已完成但可能尚未批次保存的分析，沿用記錄檔並補存到MongoDB
+                    logger.info(f"沿用中斷前的分析結果: {company_name} - {quarter}")
+                    analysis = resumed
+                    resumed_pairs.append((company_name, quarter))
+                    pending_analyses.append({
+                        "company": company_name,
+                        "quarter": quarter,
+                        "analysis_results": analysis,
+                        "source_fingerprint": source_fingerprint
+                    })
+                    if len(pending_analyses) >= save_batch_size:
+                        flush_pending_analyses(vector_store, pending_analyses)
+                else:
+                    # 生成分析
+                    analysis = rag_analyzer.generate_enhanced_business_analysis_with_fallback(
+                        vector_store, 
+                        dummy_file_name,  
+                        company_name, 
+                        quarter
+                    )
+                    if analysis:
+                        reanalyzed_pairs.append((company_name, quarter))
+                        
+                        # 累積分析結果，定期批次保存到MongoDB
+                        pending_analyses.append({
+                            "company": company_name,
+                            "quarter": quarter,
+                            "analysis_results": analysis,
+                            "source_fingerprint": source_fingerprint
+                        })
+                        if len(pending_analyses) >= save_batch_size:
+                            flush_pending_analyses(vector_store, pending_analyses)
                 
                 if analysis:
                     display_quarter = quarter.replace("_", "_")
                     
-                    # 填入Excel
-                    ws.cell(row=row_index, column=1).value = display_quarter
-                    ws.cell(row=row_index, column=2).value = analysis["company_overview"]
-                    ws.cell(row=row_index, column=3).value = analysis["business_strategy"]
-                    ws.cell(row=row_index, column=4).value = analysis["risks"]
+                    # 填入Excel（每完成一個公司-季度即寫入）
+                    exporter.add_analysis(company_name, display_quarter, analysis, source_fingerprint)
                     
-                    # 設定自動換行和行高
-                    for col in range(1, 5):
-                        cell = ws.cell(row=row_index, column=col)
-                        cell.alignment = Alignment(wrapText=True, vertical='top')
-                    
-                    # 設定行高
-                    ws.row_dimensions[row_index].height = row_height
-                    
-                    # 保存分析結果到MongoDB
-                    saved_docs = vector_store.save_analysis_to_mongodb(
-                        company=company_name,
-                        quarter=quarter,
-                        analysis_results=analysis
-                    )
-                    
-                    logger.info(f"成功保存 {len(saved_docs)} 個分析結果到MongoDB")
-                    for doc in saved_docs:
-                        logger.info(f"  - {doc['action']}: {doc['company']} - {doc['title']} - {doc['quarter']}")
-                    
-                    row_index += 1
                     logger.info(f"完成 {company_name} - {quarter} 的分析")
                     
                 else:
@@ -404,9 +476,19 @@ def analyze_companies_from_database(vector_store):
         
         logger.info(f"{company_name} 財報分析完成")
     
+    # 保存剩餘的分析結果
+    flush_pending_analyses(vector_store, pending_analyses)
+    
+    # 顯示略過與重新分析統計
+    logger.info(f"\n略過 {len(skipped_pairs)} 個來源未變更的公司-季度，重新分析 {len(reanalyzed_pairs)} 個")
+    if resumed_pairs:
+        logger.info(f"沿用中斷前的分析結果 {len(resumed_pairs)} 個")
+    for company, quarter in reanalyzed_pairs:
+        logger.info(f"  - 重新分析: {company} - {quarter}")
+    
     # 儲存Excel
     try:
-        wb_combined.save(combined_excel)
+        exporter.close()
         logger.info(f"\n財報分析完成！")
         logger.info(f"Excel結果已保存到: {combined_excel}")
         
@@ -423,8 +505,130 @@ def analyze_companies_from_database(vector_store):
     except Exception as e:
         logger.error(f"保存 Excel 時發生錯誤: {e}")
 
+# 非互動模式的處理模式對應選單選項
+MODE_CHOICES = {"full": "1", "incremental": "2", "analyze": "3", "export": "4"}
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="財報分析系統")
+    parser.add_argument("--force", action="store_true", help="忽略來源版本指紋，重新分析所有公司-季度")
+    parser.add_argument("--export-only", action="store_true", help="不重新分析，直接從資料庫匯出Excel")
+    parser.add_argument("--check-facts", action="store_true", help="比對 AutoML 實際營收與財報表格提取的營收數據")
+    parser.add_argument("--summarize", action="store_true", help="為尚未有摘要的文檔塊補產生摘要與關鍵數字")
+    parser.add_argument("--normalize-metadata", action="store_true", help="將文檔塊內嵌的檔案層級欄位移至檔案記錄，並回報前後的集合大小")
+    parser.add_argument("--compress-text", action="store_true", help="以共用 zstd 字典壓縮現有文檔塊的文字，並回報前後的集合大小")
+    parser.add_argument(
+        "--mode", choices=list(MODE_CHOICES),
+        help="直接執行指定的處理模式，不顯示選單也不詢問確認（full、incremental、analyze、export）"
+    )
+    parser.add_argument("--clear-analysis", action="store_true", help="搭配 --mode：分析前清空舊的分析結果（預設保留並以 upsert 更新）")
+    return parser.parse_args()
+
+def export_analysis_only(vector_store):
+    """不重新分析，從 financial_analysis 集合重建Excel"""
+    logger.info("\n=== 從資料庫匯出分析結果 ===")
+    
+    analysis_folder = create_output_directory(settings.base_directory)
+    combined_excel = os.path.join(analysis_folder, generate_excel_filename())
+    
+    try:
+        export_analysis_from_mongodb(vector_store.analysis_collection, combined_excel)
+        logger.info(f"Excel結果已保存到: {combined_excel}")
+    except Exception as e:
+        logger.error(f"匯出 Excel 時發生錯誤: {e}")
+
+def check_revenue_facts(vector_store):
+    """比對 AutoML 實際營收資料與財報表格提取的營收數據"""
+    logger.info("\n=== 比對 AutoML 實際營收與財報表格數據 ===")
+    
+    try:
+        results = vector_store.cross_check_automl_actuals("revenue")
+    except Exception as e:
+        logger.error(f"比對營收數據時發生錯誤: {e}")
+        return
+    
+    status_counts = {"matched": 0, "mismatch": 0, "missing": 0}
+    for result in results:
+        status_counts[result["status"]] += 1
+        if result["status"] == "mismatch":
+            logger.warning(
+                f"營收不一致: {result['company']} {result['year_quarter']} "
+                f"AutoML={result['actual_value']:,.2f} 財報={result['fact_value']:,.2f} "
+                f"(相對誤差 {result['relative_diff']:.2%}，來源: {result['source']})"
+            )
+    
+    logger.info(
+        f"比對完成：共 {len(results)} 筆，一致 {status_counts['matched']} 筆，"
+        f"不一致 {status_counts['mismatch']} 筆，財報中找不到 {status_counts['missing']} 筆"
+    )
+
+def summarize_all_chunks(vector_store):
+    """為資料庫中所有尚未有摘要的文檔塊產生摘要"""
+    logger.info("\n=== 產生文檔塊摘要 ===")
+    
+    try:
+        summarizer = ChunkSummarizer()
+        stats = summarizer.summarize_pending_chunks(vector_store)
+        logger.info(
+            f"摘要完成：{stats['chunks']} 個待處理塊，API 呼叫 {stats['llm_calls']} 次，"
+            f"新產生 {stats['summarized']} 個，快取命中 {stats['cached']} 個，失敗 {stats['failed']} 個"
+        )
+    except Exception as e:
+        logger.error(f"產生文檔塊摘要時發生錯誤: {e}")
+
+def log_storage_report(label, report):
+    """輸出集合大小與檢索傳輸量"""
+    for name, stats in report["collections"].items():
+        logger.info(
+            f"[{label}] {name}: {stats['count']} 筆，資料 {stats['size']:,} bytes "
+            f"(平均 {stats['avg_obj_size']:,.0f})，索引 {stats['total_index_size']:,} bytes"
+        )
+    for key in ("find_full", "find_search_projection", "find_search_without_text"):
+        logger.info(f"[{label}] {key}: {report[key]['documents']} 筆，傳輸 {report[key]['bytes']:,} bytes")
+
+def normalize_chunk_metadata(vector_store):
+    """正規化舊文檔塊的檔案層級欄位，並比較前後的集合大小與傳輸量"""
+    logger.info("\n=== 正規化文檔塊 metadata ===")
+    
+    try:
+        before = vector_store.get_storage_report()
+        log_storage_report("正規化前", before)
+        
+        vector_store.normalize_chunk_metadata()
+        
+        after = vector_store.get_storage_report()
+        log_storage_report("正規化後", after)
+        
+        before_bytes = before["find_search_projection"]["bytes"]
+        after_bytes = after["find_search_projection"]["bytes"]
+        if before_bytes:
+            logger.info(f"檢索傳輸量減少 {1 - after_bytes / before_bytes:.1%}")
+    except Exception as e:
+        logger.error(f"正規化文檔塊 metadata 時發生錯誤: {e}")
+
+def compress_chunk_texts(vector_store):
+    """壓縮現有文檔塊的文字，並比較前後的集合大小與傳輸量"""
+    logger.info("\n=== 壓縮文檔塊文字 ===")
+    
+    try:
+        before = vector_store.get_storage_report()
+        log_storage_report("壓縮前", before)
+        
+        vector_store.compress_chunk_texts()
+        
+        after = vector_store.get_storage_report()
+        log_storage_report("壓縮後", after)
+        
+        before_bytes = before["find_search_projection"]["bytes"]
+        after_bytes = after["find_search_projection"]["bytes"]
+        if before_bytes:
+            logger.info(f"檢索傳輸量減少 {1 - after_bytes / before_bytes:.1%}")
+    except Exception as e:
+        logger.error(f"壓縮文檔塊文字時發生錯誤: {e}")
+
 def main():
     """主程式"""
+    args = parse_args()
     logger.info("=== 財報分析系統啟動 ===")
     
     # 驗證設定
@@ -448,41 +652,77 @@ def main():
     logger.info(f"- 向量文檔: {existing_docs} 個")
     logger.info(f"- 分析結果: {existing_analysis} 個")
     
-    # 選擇處理模式
-    print("\n請選擇處理模式:")
-    print("1. 完整重新處理 (清空所有資料重新開始)")
-    print("2. 增量處理 (只處理新檔案)")
-    print("3. 只重新分析 (使用現有向量資料)")
-    print("4. 退出")
+    if args.export_only:
+        export_analysis_only(vector_store)
+        return
     
-    choice = input("請輸入選項 (1-4): ").strip()
+    if args.check_facts:
+        check_revenue_facts(vector_store)
+        return
+    
+    if args.summarize:
+        summarize_all_chunks(vector_store)
+        return
+    
+    if args.normalize_metadata:
+        normalize_chunk_metadata(vector_store)
+        return
+    
+    if args.compress_text:
+        compress_chunk_texts(vector_store)
+        return
+    
+    summarizer = create_chunk_summarizer()
+    
+    # 選擇處理模式（指定 --mode 時不顯示選單，也不詢問是否清空分析結果）
+    if args.mode:
+        choice = MODE_CHOICES[args.mode]
+        clear_existing = args.clear_analysis
+    else:
+        print("\n請選擇處理模式:")
+        print("1. 完整重新處理 (逐檔替換內容或向量模型已變更的檔案，並移除已不存在的檔案)")
+        print("2. 增量處理 (只處理新檔案)")
+        print("3. 只重新分析 (使用現有向量資料)")
+        print("4. 從資料庫匯出Excel (不重新分析)")
+        print("5. 退出")
+    
+        choice = input("請輸入選項 (1-5): ").strip()
+        clear_existing = None
     
     if choice == "1":
         # 完整重新處理
-        success = preprocess_all_companies(vector_store, force_reprocess=True)
+        success = preprocess_all_companies(vector_store, force_reprocess=True, summarizer=summarizer)
         if success:
-            analyze_companies_from_database(vector_store)
+            analyze_companies_from_database(vector_store, force=args.force, clear_existing=clear_existing)
     
     elif choice == "2":
         # 增量處理
-        success = preprocess_new_files_only(vector_store)
+        success = preprocess_new_files_only(vector_store, summarizer=summarizer)
         if success or existing_docs > 0:
-            analyze_companies_from_database(vector_store)
+            analyze_companies_from_database(vector_store, force=args.force, clear_existing=clear_existing)
     
     elif choice == "3":
         # 只重新分析
         if existing_docs > 0:
-            analyze_companies_from_database(vector_store)
+            analyze_companies_from_database(vector_store, force=args.force, clear_existing=clear_existing)
         else:
             logger.error("沒有找到現有的向量資料，請先進行檔案處理")
     
     elif choice == "4":
+        # 只匯出Excel
+        export_analysis_only(vector_store)
+    
+    elif choice == "5":
         logger.info("程式結束")
         return
     
     else:
         logger.error("無效選項，程式結束")
         return
+    
+    # 輸出本次執行的各階段耗時與計數（Prometheus textfile 與 JSON 摘要）
+    mode = next(name for name, value in MODE_CHOICES.items() if value == choice)
+    metrics.finish_run(f"main_{mode}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from config.settings import settings
+from utils.logger import get_logger
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+logger = get_logger(__name__)
+
+# 提取邏輯（PDFProcessor / OCRProcessor 的輸出格式）改變時遞增，舊的提取結果即不再使用
+EXTRACTOR_VERSION = "1"
+
+# 文字中的頁碼標記（含前一行的分隔線）：文字提取為 [PAGE n]，OCR 為 [PAGES n] 或 [PAGES n-m]
+PAGE_MARKER = re.compile(r"(?:=+\n)?\[PAGES? (\d+)(?:-(\d+))?\]")
+
+class ExtractionArtifactStore:
+    """以檔案內容定址的 PDF 提取結果快取
+
+    以 PDF 的 SHA-256 與提取器版本（模式、EXTRACTOR_VERSION、OCR 模型、頁數上限）為鍵，
+    保存全文與各頁位置、表格（安裝 pyarrow 時為 Arrow IPC 檔案，否則為 JSON）、圖像資訊與 OCR 結果。
+    讀取時以記憶體映射（mmap）載入，內容未變更的檔案不需重新執行 PyMuPDF、find_tables 或 OCR。
+
+    目錄結構：{directory}/{sha256 前兩碼}/{sha256}/{版本雜湊}/
+        meta.json      頁數、各頁文字位置、表格與圖像資訊
+        text.bin       UTF-8 全文（含頁碼標記與表格、圖像段落）
+        tables/N.arrow 第 N 個表格（欄位名稱保存於 meta.json，避免重複或空白欄名）
+    """
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.path.join(
+            settings.base_directory or ".", settings.get("artifact_store.directory", ".artifacts")
+        )
+        self.extractor_version = f"{EXTRACTOR_VERSION}:{settings.get('artifact_store.extractor_version', '1')}"
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+    
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+    
+    def version(self, use_ocr: bool, max_pages: Optional[int]) -> str:
+        """提取器版本：提取模式、版本號、OCR 模型與頁數上限任一改變時需要重新提取"""
+        if use_ocr:
+            max_pages = max_pages or settings.get("file_processing.max_pages_per_pdf", 50)
+            return f"ocr:{self.extractor_version}:{settings.vision_model}:{max_pages}"
+        return f"text:{self.extractor_version}:{max_pages or 'all'}"
+    
+    def artifact_path(self, sha256: str, use_ocr: bool, max_pages: Optional[int] = None) -> str:
+        version_hash = hashlib.sha256(self.version(use_ocr, max_pages).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, sha256[:2], sha256, version_hash)
+    
+    @staticmethod
+    def page_spans(text: str) -> List[List[int]]:
+        """各頁（或 OCR 批次）文字在 UTF-8 全文中的位置 [起始頁, 結束頁, 起始 byte, 結束 byte]"""
+        matches = list(PAGE_MARKER.finditer(text))
+        if not matches:
+            return []
+        
+        spans = []
+        start = len(text[:matches[0].start()].encode("utf-8"))
+        for index, match in enumerate(matches):
+            end_char = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+            end = start + len(text[match.start():end_char].encode("utf-8"))
+            first_page = int(match.group(1))
+            spans.append([first_page, int(match.group(2) or first_page), start, end])
+            start = end
+        return spans
+    
+    def _write_table(self, path: str, dataframe: pd.DataFrame) -> Dict:
+        """保存單一表格，返回 meta.json 中的表格記錄"""
+        columns = [None if column is None else str(column) for column in dataframe.columns]
+        values = dataframe.astype(str).values.tolist()
+        if pa is None:
+            return {"columns": columns, "rows": values}
+        
+        arrays = [pa.array([row[index] for row in values], type=pa.string()) for index in range(len(columns))]
+        table = pa.Table.from_arrays(arrays, names=[f"c{index}" for index in range(len(columns))])
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return {"columns": columns, "file": os.path.basename(path)}
+    
+    @staticmethod
+    def _read_table(table_directory: str, record: Dict) -> pd.DataFrame:
+        if "rows" in record:
+            return pd.DataFrame(record["rows"], columns=record["columns"])
+        
+        with pa.memory_map(os.path.join(table_directory, record["file"]), "r") as source:
+            dataframe = pa.ipc.open_file(source).read_all().to_pandas()
+        dataframe.columns = record["columns"]
+        return dataframe
+    
+    def put(self, sha256: str, use_ocr: bool, max_pages: Optional[int], result: Dict) -> Optional[str]:
+        """保存提取結果（先寫入暫存資料夾再改名，並行寫入或中斷時不會留下不完整的結果），返回保存路徑"""
+        if not result.get("text"):
+            return None
+        
+        path = self.artifact_path(sha256, use_ocr, max_pages)
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+        try:
+            os.makedirs(os.path.join(temp_path, "tables"))
+            text = result["text"]
+            with open(os.path.join(temp_path, "text.bin"), "wb") as file:
+                file.write(text.encode("utf-8"))
+            
+            tables = []
+            for index, table in enumerate(result.get("tables") or []):
+                record = {"page": table.get("page"), "text": table.get("text", ""), "type": table.get("type")}
+                if table.get("dataframe") is not None:
+                    record.update(self._write_table(os.path.join(temp_path, "tables", f"{index:04d}.arrow"), table["dataframe"]))
+                tables.append(record)
+            
+            meta = {
+                "sha256": sha256,
+                "version": self.version(use_ocr, max_pages),
+                "use_ocr": use_ocr,
+                "total_pages": result["total_pages"],
+                "pages": self.page_spans(text),
+                "tables": tables,
+                "images": result.get("images") or [],
+                "created_at": datetime.now().isoformat()
+            }
+            with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as file:
+                json.dump(meta, file, ensure_ascii=False, default=str)
+            
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(temp_path, path)
+            self._count("writes")
+            return path
+        except OSError as e:
+            logger.warning(f"保存提取結果快取時發生錯誤: {e}")
+            return None
+        finally:
+            if os.path.exists(temp_path):
+                shutil.rmtree(temp_path, ignore_errors=True)
+    
+    def _load_meta(self, path: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        
+        # 以 Arrow 保存的表格需要 pyarrow 才能讀取，視為未命中並重新提取
+        if pa is None and any("file" in table for table in meta["tables"]):
+            return None
+        return meta
+    
+    def get(self, sha256: str, use_ocr: bool, max_pages: Optional[int] = None) -> Optional[Dict]:
+        """讀取提取結果，格式與 extract_file 相同（另含 images），未命中時返回 None"""
+        path = self.artifact_path(sha256, use_ocr, max_pages)
+        meta = self._load_meta(path)
+        if meta is None:
+            self._count("misses")
+            return None
+        
+        try:
+            with open(os.path.join(path, "text.bin"), "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    text = mapped[:].decode("utf-8")
+            
+            table_directory = os.path.join(path, "tables")
+            tables = []
+            for record in meta["tables"]:
+                table = {key: record.get(key) for key in ("page", "text", "type")}
+                if "columns" in record:
+                    table["dataframe"] = self._read_table(table_directory, record)
+                tables.append(table)
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取提取結果快取時發生錯誤，將重新提取: {e}")
+            self._count("misses")
+            return None
+        
+        self._count("hits")
+        return {
+            "text": text,
+            "total_pages": meta["total_pages"],
+            "use_ocr": meta["use_ocr"],
+            "tables": tables,
+            "images": meta["images"],
+            "images_extracted": len(meta["images"])
+        }
+    
+    def read_page(self, sha256: str, use_ocr: bool, page: int, max_pages: Optional[int] = None) -> Optional[str]:
+        """只讀取單一頁（OCR 為包含該頁的批次）的文字，不載入全文"""
+        path = self.artifact_path(sha256, use_ocr, max_pages)
+        meta = self._load_meta(path)
+        if meta is None:
+            return None
+        
+        for first_page, last_page, start, end in meta["pages"]:
+            if first_page <= page <= last_page:
+                with open(os.path.join(path, "text.bin"), "rb") as file:
+                    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        return mapped[start:end].decode("utf-8")
+        return None
+    
+    def remove_unused(self, keep_sha256: set) -> int:
+        """刪除不在 keep_sha256 中的檔案（已刪除或內容已變更的 PDF）的提取結果，返回刪除的檔案數"""
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return removed
+        
+        for prefix in os.listdir(self.directory):
+            prefix_path = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+            for sha256 in os.listdir(prefix_path):
+                if sha256 not in keep_sha256:
+                    shutil.rmtree(os.path.join(prefix_path, sha256), ignore_errors=True)
+                    removed += 1
+        return removed
@@ -0,0 +1,173 @@
+import queue
+import threading
+import time
+from typing import Dict, List
+from pymongo.errors import BulkWriteError
+from config.settings import settings
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+class WriteTicket:
+    """單一呼叫端（例如一個檔案）的寫入追蹤，收集寫入錯誤與新增的ID"""
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.submitted = 0
+        self.completed = 0
+        self.errors: Dict[int, str] = {}
+        self.upserted_ids: Dict[int, object] = {}
+        self._condition = threading.Condition()
+    
+    def _next_index(self) -> int:
+        """登記一筆新的寫入操作，返回其在此追蹤中的序號"""
+        with self._condition:
+            index = self.submitted
+            self.submitted += 1
+            return index
+    
+    def _complete(self, index: int, error: str = None, upserted_id=None):
+        """記錄一筆寫入操作的結果"""
+        with self._condition:
+            if error:
+                self.errors[index] = error
+            if upserted_id is not None:
+                self.upserted_ids[index] = upserted_id
+            self.completed += 1
+            self._condition.notify_all()
+    
+    def wait(self, timeout: float = None) -> bool:
+        """等待所有已提交的操作完成，返回是否全部成功"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self.completed < self.submitted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return not self.errors
+    
+    @property
+    def failed(self) -> bool:
+        return bool(self.errors)
+
+class BulkWriter:
+    """背景批次寫入器：累積寫入操作並以 bulk_write 批次送出，佇列已滿時阻塞呼叫端"""
+    def __init__(self, batch_size: int = None, flush_interval: float = None, max_queue_size: int = None):
+        self.batch_size = batch_size or settings.get("mongodb_settings.bulk_write_batch_size", 200)
+        self.flush_interval = flush_interval or settings.get("mongodb_settings.bulk_write_flush_interval", 1.0)
+        max_queue_size = max_queue_size or settings.get("mongodb_settings.bulk_write_queue_size", 1000)
+        
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        
+        self.batches_written = 0
+        self.operations_written = 0
+    
+    def start(self):
+        """啟動背景寫入執行緒"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="bulk-writer", daemon=True)
+                self._thread.start()
+    
+    def submit(self, collection, operation, ticket: WriteTicket):
+        """提交寫入操作；佇列已滿時阻塞，形成背壓"""
+        self.start()
+        index = ticket._next_index()
+        self._queue.put((collection, operation, ticket, index))
+    
+    def flush(self):
+        """送出目前累積的所有操作並等待完成"""
+        self.start()
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+    
+    def wait(self, ticket: WriteTicket, timeout: float = None) -> bool:
+        """立即送出累積的操作並等待指定追蹤的操作完成"""
+        self.flush()
+        return ticket.wait(timeout)
+    
+    def close(self):
+        """送出剩餘操作並停止背景執行緒"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        """背景執行緒：依批次大小或時間間隔送出累積的操作"""
+        buffer = []
+        last_flush = time.monotonic()
+        
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            
+            if item is None:
+                self._write_batch(buffer)
+                return
+            
+            if isinstance(item, threading.Event):
+                self._write_batch(buffer)
+                buffer = []
+                last_flush = time.monotonic()
+                item.set()
+                continue
+            
+            if item:
+                buffer.append(item)
+            
+            if len(buffer) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self._write_batch(buffer)
+                buffer = []
+                last_flush = time.monotonic()
+    
+    def _write_batch(self, buffer: List):
+        """依集合分組送出一批操作，並將結果回報給各自的追蹤"""
+        if not buffer:
+            return
+        
+        groups = {}
+        for item in buffer:
+            groups.setdefault(item[0].full_name, []).append(item)
+        
+        for items in groups.values():
+            collection = items[0][0]
+            errors: Dict[int, str] = {}
+            upserted: Dict[int, object] = {}
+            
+            try:
+                with metrics.timer("mongo_write", collection=collection.name):
+                    result = collection.bulk_write([item[1] for item in items], ordered=False)
+                upserted = dict(result.upserted_ids or {})
+            except BulkWriteError as e:
+                details = e.details or {}
+                for write_error in details.get("writeErrors", []):
+                    errors[write_error["index"]] = write_error.get("errmsg", "write error")
+                for upserted_item in details.get("upserted", []):
+                    upserted[upserted_item["index"]] = upserted_item["_id"]
+                logger.error(f"批次寫入 {collection.name} 時有 {len(errors)} 筆失敗")
+            except Exception as e:
+                errors = {i: str(e) for i in range(len(items))}
+                logger.error(f"批次寫入 {collection.name} 時發生錯誤: {e}")
+            
+            for batch_index, (_, _, ticket, index) in enumerate(items):
+                ticket._complete(index, errors.get(batch_index), upserted.get(batch_index))
+            
+            self.batches_written += 1
+            self.operations_written += len(items) - len(errors)
+            metrics.increment("documents_written", len(items) - len(errors), collection=collection.name)
+    
+    def stats(self) -> Dict:
+        """寫入統計"""
+        return {
+            "batches_written": self.batches_written,
+            "operations_written": self.operations_written,
+            "queued": self._queue.qsize()
+        }
@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+class JobQueue:
+    """以 MongoDB 集合實作的工作佇列：每個財報檔案一個工作，工作程序以租約領取
+
+    領取以 find_one_and_update 原子地將工作由 queued 改為 running 並寫入租約到期時間，
+    處理期間以心跳延長租約；工作程序中斷時租約到期，工作重新排入佇列由其他工作程序領取。
+    所有時間皆為 UTC，不同時區的主機比較租約到期時間時結果一致。
+    """
+    def __init__(self, collection, lease_seconds: float = 300, max_attempts: int = 3):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        try:
+            self.collection.create_index([("status", 1), ("enqueued_at", 1)], name="status_enqueued_index")
+            self.collection.create_index([("status", 1), ("lease_expires_at", 1)], name="status_lease_index")
+        except Exception as e:
+            logger.warning(f"創建工作佇列索引時發生錯誤: {e}")
+    
+    @staticmethod
+    def now() -> datetime:
+        """目前的 UTC 時間（MongoDB 以 UTC 保存日期）"""
+        return datetime.now(timezone.utc)
+    
+    def _lease_expires_at(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.lease_seconds)
+    
+    def enqueue(self, key: str, version: str, payload: Dict, force: bool = False) -> bool:
+        """加入工作；相同版本的工作已在佇列中或已完成時不重複加入（force=True 時已完成的工作也重新加入），返回是否加入"""
+        existing = self.collection.find_one({"_id": key}, {"version": 1, "status": 1})
+        if existing and existing.get("status") in (QUEUED, RUNNING) and existing.get("version") == version:
+            return False
+        if existing and existing.get("status") == DONE and existing.get("version") == version and not force:
+            return False
+        
+        current_time = self.now()
+        self.collection.update_one(
+            {"_id": key},
+            {
+                "$set": {
+                    "version": version,
+                    "payload": payload,
+                    "status": QUEUED,
+                    "attempts": 0,
+                    "worker_id": None,
+                    "lease_expires_at": None,
+                    "error": None,
+                    "enqueued_at": current_time
+                },
+                "$setOnInsert": {"created_at": current_time}
+            },
+            upsert=True
+        )
+        return True
+    
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """原子地領取最早加入的工作並取得租約，沒有可領取的工作時返回 None"""
+        current_time = self.now()
+        return self.collection.find_one_and_update(
+            {"status": QUEUED},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "claimed_at": current_time,
+                    "heartbeat_at": current_time,
+                    "lease_expires_at": self._lease_expires_at(current_time)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("enqueued_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """延長租約，返回是否仍持有此工作（租約已被收回時返回 False）"""
+        current_time = self.now()
+        result = self.collection.update_one(
+            {"_id": job_id, "status": RUNNING, "worker_id": worker_id},
+            {"$set": {"heartbeat_at": current_time, "lease_expires_at": self._lease_expires_at(current_time)}}
+        )
+        return result.matched_count == 1
+    
+    def complete(self, job_id: str, worker_id: str, seconds: float, **result) -> bool:
+        """標記工作完成，返回是否仍持有此工作"""
+        update = self.collection.update_one(
+            {"_id": job_id, "status": RUNNING, "worker_id": worker_id},
+            {"$set": {
+                "status": DONE,
+                "lease_expires_at": None,
+                "finished_at": self.now(),
+                "seconds": round(seconds, 3),
+                "result": result,
+                "error": None
+            }}
+        )
+        return update.matched_count == 1
+    
+    def fail(self, job_id: str, worker_id: str, error: str, seconds: float = 0.0) -> Optional[str]:
+        """記錄工作失敗：未達重試上限時重新排入佇列，否則標記為 failed；返回新狀態（已失去租約時返回 None）"""
+        job = self.collection.find_one({"_id": job_id, "status": RUNNING, "worker_id": worker_id}, {"attempts": 1})
+        if not job:
+            return None
+        
+        status = FAILED if job.get("attempts", 0) >= self.max_attempts else QUEUED
+        update = self.collection.update_one(
+            {"_id": job_id, "status": RUNNING, "worker_id": worker_id},
+            {"$set": {
+                "status": status,
+                "worker_id": worker_id if status == FAILED else None,
+                "lease_expires_at": None,
+                "finished_at": self.now(),
+                "seconds": round(seconds, 3),
+                "error": error
+            }}
+        )
+        return status if update.matched_count == 1 else None
+    
+    def requeue_expired(self) -> int:
+        """將租約已到期的工作重新排入佇列（超過重試上限時標記為 failed），返回處理的工作數"""
+        current_time = self.now()
+        expired = {"status": RUNNING, "lease_expires_at": {"$lt": current_time}}
+        failed = self.collection.update_many(
+            dict(expired, attempts={"$gte": self.max_attempts}),
+            {"$set": {"status": FAILED, "lease_expires_at": None, "error": "租約到期（工作程序中斷）且已達重試上限"}}
+        ).modified_count
+        requeued = self.collection.update_many(
+            expired,
+            {"$set": {"status": QUEUED, "worker_id": None, "lease_expires_at": None, "error": "租約到期，重新排入佇列"}}
+        ).modified_count
+        
+        if failed or requeued:
+            logger.warning(f"租約到期的工作: 重新排入 {requeued} 個，標記失敗 {failed} 個")
+        return failed + requeued
+    
+    def retry_failed(self) -> int:
+        """將失敗的工作重新排入佇列並重設嘗試次數，返回處理的工作數"""
+        return self.collection.update_many(
+            {"status": FAILED},
+            {"$set": {"status": QUEUED, "attempts": 0, "worker_id": None, "enqueued_at": self.now()}}
+        ).modified_count
+    
+    def active_count(self) -> int:
+        """等待或執行中的工作數量"""
+        return self.collection.count_documents({"status": {"$in": [QUEUED, RUNNING]}})
+    
+    def summary(self) -> Dict[str, int]:
+        """各狀態的工作數量"""
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        for item in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[item["_id"]] = item["count"]
+        return counts
+    
+    def worker_report(self, since: datetime = None) -> List[Dict]:
+        """各工作程序完成的工作數、文檔塊數、處理耗時與期間吞吐量（since 指定時只計算之後完成的工作）"""
+        match = {"status": DONE}
+        if since:
+            match["finished_at"] = {"$gte": since}
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": "$worker_id",
+                "jobs": {"$sum": 1},
+                "chunks": {"$sum": "$result.chunks"},
+                "busy_seconds": {"$sum": "$seconds"},
+                "first_claimed_at": {"$min": "$claimed_at"},
+                "last_finished_at": {"$max": "$finished_at"}
+            }},
+            {"$sort": {"_id": 1}}
+        ]
+        report = []
+        for item in self.collection.aggregate(pipeline):
+            elapsed = (item["last_finished_at"] - item["first_claimed_at"]).total_seconds()
+            report.append({
+                "worker_id": item["_id"],
+                "jobs": item["jobs"],
+                "chunks": item["chunks"],
+                "busy_seconds": round(item["busy_seconds"], 2),
+                "elapsed_seconds": round(elapsed, 2),
+                "jobs_per_minute": round(item["jobs"] * 60 / elapsed, 2) if elapsed > 0 else None
+            })
+        return report
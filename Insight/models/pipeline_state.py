@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DONE = "done"
+FAILED = "failed"
+
+class PipelineState:
+    """流程執行狀態：每個階段對每個檔案或公司-季度的完成標記
+
+    標記記錄該階段的輸入版本（例如檔案 SHA-256、來源版本指紋），
+    版本相同的完成標記視為已完成；中斷後重新執行時只處理沒有完成標記或版本已變更的項目。
+    """
+    def __init__(self, collection):
+        self.collection = collection
+        try:
+            self.collection.create_index([("stage", 1), ("status", 1)], name="stage_status_index")
+        except Exception as e:
+            logger.warning(f"創建流程狀態索引時發生錯誤: {e}")
+    
+    @staticmethod
+    def _marker_id(stage: str, key: str) -> str:
+        return f"{stage}:{key}"
+    
+    def get(self, stage: str, key: str) -> Optional[Dict]:
+        return self.collection.find_one({"_id": self._marker_id(stage, key)})
+    
+    def is_done(self, stage: str, key: str, version: str) -> bool:
+        marker = self.get(stage, key)
+        return bool(marker) and marker.get("status") == DONE and marker.get("version") == version
+    
+    def _save(self, stage: str, key: str, version: str, status: str, fields: Dict):
+        current_time = datetime.now()
+        self.collection.update_one(
+            {"_id": self._marker_id(stage, key)},
+            {
+                "$set": dict(fields, stage=stage, key=key, version=version, status=status, updated_at=current_time),
+                "$setOnInsert": {"created_at": current_time}
+            },
+            upsert=True
+        )
+    
+    def mark_done(self, stage: str, key: str, version: str, **details):
+        """記錄項目已完成此階段"""
+        self._save(stage, key, version, DONE, {"details": details, "error": None})
+    
+    def mark_failed(self, stage: str, key: str, version: str, error: str):
+        """記錄項目在此階段失敗（下次執行時重試）"""
+        self._save(stage, key, version, FAILED, {"error": error})
+    
+    def reset(self, stages: Iterable[str] = None) -> int:
+        """清除指定階段（預設全部）的標記，返回刪除的標記數"""
+        query = {"stage": {"$in": list(stages)}} if stages else {}
+        return self.collection.delete_many(query).deleted_count
+    
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """各階段的完成與失敗數量"""
+        pipeline = [{"$group": {"_id": {"stage": "$stage", "status": "$status"}, "count": {"$sum": 1}}}]
+        counts = {}
+        for item in self.collection.aggregate(pipeline):
+            counts.setdefault(item["_id"]["stage"], {})[item["_id"]["status"]] = item["count"]
+        return counts
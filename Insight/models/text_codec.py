@@ -0,0 +1,129 @@
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import Binary
+from config.settings import settings
+from utils.logger import get_logger
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+logger = get_logger(__name__)
+
+class ChunkTextCodec:
+    """文檔塊文字的 zstd 壓縮：以所有文檔塊共用的訓練字典壓縮，字典依 dict_id 保存，解壓時依壓縮幀記錄的 dict_id 選用字典"""
+    def __init__(self, dictionary_collection=None, enabled: bool = None):
+        self.dictionary_collection = dictionary_collection
+        
+        enabled = settings.get("vector_search.text_compression.enabled", False) if enabled is None else enabled
+        if enabled and zstd is None:
+            logger.warning("未安裝 zstandard，停用文檔塊文字壓縮")
+            enabled = False
+        self.enabled = enabled
+        
+        self.level = settings.get("vector_search.text_compression.level", 9)
+        self.dictionary_size = settings.get("vector_search.text_compression.dictionary_size", 112640)
+        self.sample_chars = settings.get("vector_search.text_compression.sample_chars", 1024)
+        
+        # dict_id -> ZstdCompressionDict；dict_id 0 表示未使用字典
+        self._dictionaries = {}
+        self._active_dict_id = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    @property
+    def available(self) -> bool:
+        return zstd is not None
+    
+    def _get_dictionary(self, dict_id: int):
+        """依 dict_id 讀取字典（先查記憶體，再查資料庫）"""
+        if not dict_id:
+            return None
+        
+        with self._lock:
+            if dict_id not in self._dictionaries:
+                entry = self.dictionary_collection.find_one({"_id": dict_id}) if self.dictionary_collection is not None else None
+                if entry is None:
+                    raise KeyError(f"找不到 zstd 字典 {dict_id}")
+                self._dictionaries[dict_id] = zstd.ZstdCompressionDict(bytes(entry["data"]))
+            return self._dictionaries[dict_id]
+    
+    def active_dict_id(self) -> int:
+        """目前用於壓縮的字典（最新訓練者），尚未訓練時為 0"""
+        if self._active_dict_id is None:
+            latest = None
+            if self.dictionary_collection is not None:
+                latest = next(iter(self.dictionary_collection.find({}, {"_id": 1}).sort("created_at", -1).limit(1)), None)
+            self._active_dict_id = latest["_id"] if latest else 0
+        return self._active_dict_id
+    
+    def train_dictionary(self, texts: List[str]) -> int:
+        """以文檔塊文字訓練共用字典並保存，返回 dict_id（樣本不足或訓練失敗時返回 0）"""
+        if not self.available:
+            return 0
+        
+        # 切成較小的片段作為樣本，少量長文檔塊也能訓練出字典
+        samples = []
+        for text in texts:
+            data = text.encode("utf-8")
+            samples.extend(data[i:i + self.sample_chars] for i in range(0, len(data), self.sample_chars))
+        
+        try:
+            dictionary = zstd.train_dictionary(self.dictionary_size, samples, level=self.level)
+        except zstd.ZstdError as e:
+            logger.warning(f"訓練 zstd 字典失敗（{len(samples)} 個樣本）: {e}")
+            return 0
+        
+        dict_id = dictionary.dict_id()
+        if self.dictionary_collection is not None:
+            self.dictionary_collection.update_one(
+                {"_id": dict_id},
+                {
+                    "$set": {"data": Binary(dictionary.as_bytes()), "samples": len(samples)},
+                    "$setOnInsert": {"created_at": datetime.now()}
+                },
+                upsert=True
+            )
+        
+        with self._lock:
+            self._dictionaries[dict_id] = dictionary
+        self._active_dict_id = dict_id
+        logger.info(f"以 {len(samples)} 個樣本訓練 zstd 字典 {dict_id}（{len(dictionary.as_bytes())} bytes）")
+        return dict_id
+    
+    def _compressor(self, dict_id: int):
+        """每個執行緒各自的壓縮器（zstd 壓縮器不可跨執行緒共用）"""
+        compressors = self._local.__dict__.setdefault("compressors", {})
+        if dict_id not in compressors:
+            compressors[dict_id] = zstd.ZstdCompressor(level=self.level, dict_data=self._get_dictionary(dict_id))
+        return compressors[dict_id]
+    
+    def _decompressor(self, dict_id: int):
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if dict_id not in decompressors:
+            decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=self._get_dictionary(dict_id))
+        return decompressors[dict_id]
+    
+    def compress(self, text: str) -> Binary:
+        """以目前的字典壓縮文字"""
+        return Binary(self._compressor(self.active_dict_id()).compress(text.encode("utf-8")))
+    
+    def decompress(self, data: bytes) -> str:
+        """依壓縮幀記錄的 dict_id 解壓文字"""
+        data = bytes(data)
+        dict_id = zstd.get_frame_parameters(data).dict_id
+        return self._decompressor(dict_id).decompress(data).decode("utf-8")
+    
+    def text_fields(self, text: str) -> Dict:
+        """文檔塊寫入時的文字欄位：啟用壓縮時寫入 text_zstd，否則寫入 text"""
+        if self.enabled:
+            return {"text_zstd": self.compress(text)}
+        return {"text": text}
+    
+    def text_of(self, doc: Dict) -> Optional[str]:
+        """讀取文檔塊文字，壓縮的文字自動解壓"""
+        if doc.get("text_zstd") is not None:
+            return self.decompress(doc["text_zstd"])
+        return doc.get("text")
@@ -1,40 +1,130 @@
 import re
 import os
+import hashlib
+import time
+import uuid
+import threading
 import numpy as np
-from pymongo import MongoClient
+import bson
+from bson import ObjectId, Binary
+from pymongo import MongoClient, InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import PyMongoError
+from collections import OrderedDict
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
 from config.settings import settings
 from utils.logger import get_logger
+from utils.metrics import metrics
 from processors.pdf_processor import PDFProcessor
-from processors.ocr_processor import OCRProcessor
+from processors.ocr_processor import OCRProcessor, OCR_ERROR_MARKER
+from processors.chunker import split_text, sentence_windows
+from processors.fact_extractor import extract_facts_from_tables, format_fact_value
+from models.bulk_writer import BulkWriter, WriteTicket
+from models.text_codec import ChunkTextCodec
+from models.artifact_store import ExtractionArtifactStore
+from utils.file_utils import compute_file_sha256
 
 logger = get_logger(__name__)
 
+# 尚未完成替換的文檔塊狀態，讀取時一律排除
+PENDING_STATE = "pending"
+ACTIVE_FILTER = {"metadata.ingest_state": {"$ne": PENDING_STATE}}
+
+# 檔案層級的欄位：保存於 files 集合的 file_metadata，文檔塊只以 metadata.file_id 參照
+FILE_LEVEL_FIELDS = (
+    "year", "total_pages", "processing_mode", "extraction_method", "tables_extracted",
+    "images_extracted", "attempt_number", "embedding_model", "embedding_dimensions"
+)
+
+# 檢索時讀取的欄位（不含 created_at 與檔案層級欄位）
+SEARCH_PROJECTION = {"text": 1, "text_zstd": 1, "embedding": 1, "metadata": 1, "summary": 1, "key_figures": 1}
+TEXT_FIELDS = ("text", "text_zstd")
+
 class EnhancedMongoDBVectorStore:
-    """MongoDB向量資料庫"""
-    def __init__(self):
-        self.client = MongoClient(settings.mongodb_uri)
+    """MongoDB向量資料庫（可注入資料庫連線與向量模型，例如以本地測試替身執行查詢服務）"""
+    def __init__(self, client: MongoClient = None, embedding_model=None):
+        self.client = client if client is not None else MongoClient(settings.mongodb_uri)
         self.db = self.client[settings.database_name]
         self.collection = self.db[settings.collection_name]
         self.analysis_collection = self.db[settings.analysis_collection_name]
+        self.files_collection = self.db[settings.files_collection_name]
+        self.facts_collection = self.db[settings.facts_collection_name]
+        self.table_collection = self.db[settings.table_collection_name]
+        self.summary_cache_collection = self.db[settings.summary_cache_collection_name]
+        
+        # 文檔塊文字壓縮（共用 zstd 字典），讀取時自動解壓
+        self.text_codec = ChunkTextCodec(self.db[settings.text_dictionary_collection_name])
         
         # 初始化處理器
         self.pdf_processor = PDFProcessor()
         self.ocr_processor = OCRProcessor()
         
-        # 初始化向量模型
-        self.embedding_model = SentenceTransformer(settings.embedding_model)
+        # PDF 提取結果快取（以檔案 SHA-256 與提取器版本為鍵），內容未變更的檔案不重新提取
+        self.artifact_store = ExtractionArtifactStore() if settings.get("artifact_store.enabled", True) else None
+        
+        # 向量模型在第一次使用時才載入（例如只掃描檔案清單的 ingest_worker.py enqueue 不需要載入）
+        self._embedding_model = embedding_model
+        self._embedding_model_lock = threading.Lock()
+        
+        # 常駐程序的熱快取：查詢向量（依查詢文字）與候選塊向量矩陣（依公司-季度篩選條件）
+        self._query_embedding_cache = OrderedDict()
+        self._query_embedding_cache_size = settings.get("vector_search.query_embedding_cache_size", 1024)
+        self._candidate_cache = OrderedDict()
+        self._candidate_cache_enabled = settings.get("vector_search.candidate_cache.enabled", True)
+        self._candidate_cache_entries = settings.get("vector_search.candidate_cache.max_entries", 16)
+        self._candidate_cache_ttl = settings.get("vector_search.candidate_cache.ttl_seconds", 300)
+        self._cache_lock = threading.Lock()
+        self.candidate_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        
+        # 背景批次寫入器，讓向量計算與資料庫寫入重疊進行
+        self.bulk_writer = BulkWriter()
         
         # Netmarble特殊處理標記
         self.netmarble_failed_files = set()
         
+        # 新增文檔塊時的通知回呼（例如答案快取失效）
+        self.ingest_listeners = []
+        
+        # 最近一次替換檔案時使用的寫入版本，以及最近一次檢索的耗時與表格佔比
+        # （每個執行緒各自記錄，供並行處理檔案與並行查詢使用）
+        self._local = threading.local()
+        
         # 創建索引
         self._create_vector_index()
         self._create_analysis_index()
+        self._create_files_index()
+        self._create_facts_index()
+        self._create_table_index()
+    
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            with self._embedding_model_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = SentenceTransformer(settings.embedding_model)
+        return self._embedding_model
+    
+    @embedding_model.setter
+    def embedding_model(self, model):
+        self._embedding_model = model
+    
+    @property
+    def last_ingest_version(self) -> Optional[str]:
+        return getattr(self._local, "ingest_version", None)
+    
+    @last_ingest_version.setter
+    def last_ingest_version(self, value: Optional[str]):
+        self._local.ingest_version = value
+    
+    @property
+    def last_search_stats(self) -> Dict:
+        return getattr(self._local, "search_stats", {})
+    
+    @last_search_stats.setter
+    def last_search_stats(self, value: Dict):
+        self._local.search_stats = value
     
     def _create_vector_index(self):
         """創建向量搜索索引"""
@@ -48,6 +138,23 @@ class EnhancedMongoDBVectorStore:
                 ("metadata.file_name", 1)
             ], name="file_name_index")
             
+            self.collection.create_index([
+                ("metadata.company_name", 1),
+                ("metadata.file_name", 1),
+                ("metadata.ingest_version", 1)
+            ], name="file_ingest_version_index")
+            
+            # 檢索篩選條件（公司、季度、寫入狀態）的複合索引
+            self.collection.create_index([
+                ("metadata.company_name", 1),
+                ("metadata.quarter", 1),
+                ("metadata.ingest_state", 1)
+            ], name="company_quarter_state_index")
+            
+            self.collection.create_index([
+                ("metadata.file_id", 1)
+            ], name="file_id_index")
+            
             logger.info("成功創建基本查詢索引")
         except Exception as e:
             logger.warning(f"創建索引時發生錯誤: {e}")
@@ -69,6 +176,76 @@ class EnhancedMongoDBVectorStore:
         except Exception as e:
             logger.warning(f"創建分析結果索引時發生錯誤: {e}")
     
+    def _create_files_index(self):
+        """創建檔案清單索引"""
+        try:
+            self.files_collection.create_index([
+                ("company_name", 1),
+                ("file_name", 1)
+            ], name="company_file_index", unique=True)
+            
+            logger.info("成功創建檔案清單索引")
+        except Exception as e:
+            logger.warning(f"創建檔案清單索引時發生錯誤: {e}")
+    
+    def _create_facts_index(self):
+        """創建財務數據索引"""
+        try:
+            self.facts_collection.create_index([
+                ("company_name", 1),
+                ("quarter", 1),
+                ("metric", 1)
+            ], name="company_quarter_metric_index")
+            
+            self.facts_collection.create_index([
+                ("metric", 1),
+                ("period", 1)
+            ], name="metric_period_index")
+            
+            self.facts_collection.create_index([
+                ("company_name", 1),
+                ("file_name", 1)
+            ], name="company_file_index")
+            
+            logger.info("成功創建財務數據索引")
+        except Exception as e:
+            logger.warning(f"創建財務數據索引時發生錯誤: {e}")
+    
+    def _create_table_index(self):
+        """創建表格塊索引"""
+        try:
+            self.table_collection.create_index([
+                ("metadata.company_name", 1),
+                ("metadata.quarter", 1)
+            ], name="company_quarter_index")
+            
+            self.table_collection.create_index([
+                ("metadata.company_name", 1),
+                ("metadata.file_name", 1)
+            ], name="company_file_index")
+            
+            logger.info("成功創建表格塊索引")
+        except Exception as e:
+            logger.warning(f"創建表格塊索引時發生錯誤: {e}")
+    
+    def register_ingest_listener(self, listener):
+        """註冊新增文檔塊時的回呼，回呼參數為 (company_name, quarter)"""
+        if listener not in self.ingest_listeners:
+            self.ingest_listeners.append(listener)
+    
+    def _notify_ingest(self, metadata: Dict):
+        """通知已註冊的回呼有新文檔塊寫入"""
+        if not metadata:
+            return
+        
+        self.invalidate_candidate_cache(metadata.get("company_name"))
+        
+        for listener in self.ingest_listeners:
+            try:
+                listener(metadata.get("company_name"), metadata.get("quarter"))
+            except Exception as e:
+                logger.warning(f"執行新增文檔回呼時發生錯誤: {e}")
+    
     def is_netmarble_company(self, company_name: str) -> bool:
         """檢查是否為Netmarble公司"""
         netmarble_indicators = ["netmarble", "넷마블", "네트마블"]
@@ -92,20 +269,101 @@ class EnhancedMongoDBVectorStore:
         
         return False
     
-    def read_pdf_enhanced(self, file_path: str, company_name: str, max_pages: int = None) -> Tuple[str, int]:
-        """智能PDF讀取：自動選擇文字提取或OCR"""
+    def _load_extraction(self, file_path: str, use_ocr: bool, max_pages: Optional[int], sha256: Optional[str]) -> Tuple[Optional[str], Optional[Dict]]:
+        """查詢提取結果快取，返回 (檔案 SHA-256, 快取的提取結果)；停用快取時返回 (None, None)"""
+        if self.artifact_store is None:
+            return None, None
+        
+        sha256 = sha256 or compute_file_sha256(file_path)
+        cached = self.artifact_store.get(sha256, use_ocr, max_pages)
+        if cached and OCR_ERROR_MARKER in cached["text"]:
+            # 舊版本寫入的不完整 OCR 結果
+            cached = None
+        metrics.increment("artifact_cache_hits" if cached else "artifact_cache_misses")
+        if cached:
+            logger.info(f"使用提取結果快取: {os.path.basename(file_path)}（{cached['total_pages']} 頁，{len(cached['tables'])} 個表格）")
+        return sha256, cached
+    
+    def _store_extraction(self, file_name: str, sha256: str, use_ocr: bool, max_pages: Optional[int], result: Dict):
+        """寫入提取結果快取；OCR 有批次失敗（文字含錯誤標記）時不快取，下次處理會重新 OCR"""
+        if OCR_ERROR_MARKER in result["text"]:
+            logger.warning(f"{file_name} 有頁面 OCR 失敗，不寫入提取結果快取")
+            metrics.increment("artifact_cache_skipped_incomplete")
+            return
+        self.artifact_store.put(sha256, use_ocr, max_pages, result)
+    
+    def read_pdf_enhanced(self, file_path: str, company_name: str, max_pages: int = None, sha256: str = None) -> Tuple[str, int]:
+        """智能PDF讀取：自動選擇文字提取或OCR（內容未變更的檔案直接讀取提取結果快取）"""
         file_name = os.path.basename(file_path)
+        use_ocr = self.should_use_ocr_processing(file_name, company_name)
         
-        if self.should_use_ocr_processing(file_name, company_name):
-            logger.info(f"使用OCR模式處理: {company_name} - {file_name}")
-            return self.ocr_processor.read_pdf_with_ocr(file_path, max_pages)
-        else:
-            logger.info(f"使用文字提取模式處理: {company_name} - {file_name}")
-            text, pages = self.pdf_processor.read_pdf_text_extraction(file_path, max_pages)
-            # 同步表格和圖像信息
-            self.current_tables = self.pdf_processor.current_tables
-            self.current_images = self.pdf_processor.current_images
-            return text, pages
+        sha256, cached = self._load_extraction(file_path, use_ocr, max_pages, sha256)
+        if cached:
+            self.current_tables = cached["tables"]
+            self.current_images = cached["images"]
+            return cached["text"], cached["total_pages"]
+        
+        with metrics.labels(company=company_name, file=file_name):
+            if use_ocr:
+                logger.info(f"使用OCR模式處理: {company_name} - {file_name}")
+                # OCR模式不提取結構化表格，避免沿用上一個檔案的表格
+                self.current_tables = []
+                text, pages = self.ocr_processor.read_pdf_with_ocr(file_path, max_pages)
+                images = self.ocr_processor.current_images
+            else:
+                logger.info(f"使用文字提取模式處理: {company_name} - {file_name}")
+                text, pages = self.pdf_processor.read_pdf_text_extraction(file_path, max_pages)
+                # 同步表格和圖像信息
+                self.current_tables = self.pdf_processor.current_tables
+                self.current_images = self.pdf_processor.current_images
+                images = self.pdf_processor.current_images
+        
+        if sha256 and text:
+            self._store_extraction(file_name, sha256, use_ocr, max_pages, {
+                "text": text, "total_pages": pages, "tables": self.current_tables, "images": images
+            })
+        return text, pages
+    
+    def _thread_processors(self) -> Tuple[PDFProcessor, OCRProcessor]:
+        """每個執行緒各自的 PDF 與 OCR 處理器（處理器保存目前檔案的表格與圖像，不可跨執行緒共用）"""
+        if not hasattr(self._local, "pdf_processor"):
+            self._local.pdf_processor = PDFProcessor()
+            self._local.ocr_processor = OCRProcessor()
+        return self._local.pdf_processor, self._local.ocr_processor
+    
+    def extract_file(self, file_path: str, company_name: str, max_pages: int = None, sha256: str = None) -> Dict:
+        """提取單一檔案的文字與表格，可由多個執行緒並行呼叫（不影響 current_tables / current_images）
+
+        內容未變更的檔案直接讀取提取結果快取；sha256 未提供時由檔案內容計算。
+        """
+        file_name = os.path.basename(file_path)
+        use_ocr = self.should_use_ocr_processing(file_name, company_name)
+        sha256, cached = self._load_extraction(file_path, use_ocr, max_pages, sha256)
+        if cached:
+            return cached
+        
+        pdf_processor, ocr_processor = self._thread_processors()
+        with metrics.labels(company=company_name, file=file_name):
+            if use_ocr:
+                logger.info(f"使用OCR模式處理: {company_name} - {file_name}")
+                text, total_pages = ocr_processor.read_pdf_with_ocr(file_path, max_pages)
+                tables, images = [], ocr_processor.current_images
+            else:
+                logger.info(f"使用文字提取模式處理: {company_name} - {file_name}")
+                text, total_pages = pdf_processor.read_pdf_text_extraction(file_path, max_pages)
+                tables, images = pdf_processor.current_tables, pdf_processor.current_images
+        
+        result = {
+            "text": text,
+            "total_pages": total_pages,
+            "use_ocr": use_ocr,
+            "tables": tables,
+            "images": images,
+            "images_extracted": len(images)
+        }
+        if sha256 and text:
+            self._store_extraction(file_name, sha256, use_ocr, max_pages, result)
+        return result
     
     @property
     def current_tables(self):
@@ -177,11 +435,20 @@ class EnhancedMongoDBVectorStore:
         
         return failure_rate > 0.5
     
-    def add_document_with_enhanced_chunking(self, text: str, metadata: Dict = None) -> List[str]:
-        """使用分塊添加文檔"""
+    def add_document_with_enhanced_chunking(self, text: str, metadata: Dict = None, ingest_version: str = None, text_chunks: List[Dict] = None) -> List[str]:
+        """使用分塊添加文檔，指定 ingest_version 時寫入為待替換狀態，讀取端不可見；text_chunks 為預先分好的塊"""
         try:
-            text_chunks = self._intelligent_split_text_enhanced(text)
+            if text_chunks is None:
+                text_chunks = self._intelligent_split_text_enhanced(text)
             document_ids = []
+            ticket = WriteTicket((metadata or {}).get("file_name", ""))
+            
+            # 檔案層級欄位只保存一次於檔案記錄，文檔塊僅保留塊層級欄位
+            base_metadata = self._chunk_base_metadata(metadata)
+            
+            # 啟用文字壓縮但尚未有字典時，以現有文檔塊與此檔案的塊訓練
+            if self.text_codec.enabled and not self.text_codec.active_dict_id():
+                self._train_text_dictionary([chunk['text'] for chunk in text_chunks])
             
             logger.info(f"準備處理 {len(text_chunks)} 個分割塊")
             
@@ -195,12 +462,14 @@ class EnhancedMongoDBVectorStore:
                     logger.info(f"處理塊 {i+1}/{len(text_chunks)}，長度：{len(chunk_text)} 字符")
                     
                     # 生成embedding
-                    embedding = self.embedding_model.encode(chunk_text, convert_to_tensor=False)
+                    with metrics.timer("embedding"):
+                        embedding = self.embedding_model.encode(chunk_text, convert_to_tensor=False)
+                    metrics.increment("chunks_embedded")
                     if isinstance(embedding, np.ndarray):
                         embedding = embedding.tolist()
                     
                     # 設置metadata
-                    chunk_metadata = metadata.copy() if metadata else {}
+                    chunk_metadata = base_metadata.copy()
                     chunk_metadata.update({
                         "chunk_index": i,
                         "total_chunks": len(text_chunks),
@@ -210,28 +479,45 @@ class EnhancedMongoDBVectorStore:
                         "pages_covered": chunk_info['pages'],
                         "is_partial_page": chunk_info.get('is_partial_page', False),
                         "has_structured_data": chunk_info.get('has_structured_data', False),
-                        "is_ocr_content": chunk_info.get('is_ocr_content', False),
-                        "embedding_model": settings.embedding_model,
-                        "embedding_dimensions": settings.get("vector_search.embedding_dimensions", 384)
+                        "is_ocr_content": chunk_info.get('is_ocr_content', False)
                     })
+                    if ingest_version:
+                        chunk_metadata["ingest_version"] = ingest_version
+                        chunk_metadata["ingest_state"] = PENDING_STATE
                     
                     document = {
-                        "text": chunk_text,
+                        "_id": ObjectId(),
+                        **self.text_codec.text_fields(chunk_text),
                         "embedding": embedding,
                         "metadata": chunk_metadata,
                         "created_at": datetime.now()
                     }
                     
-                    result = self.collection.insert_one(document)
-                    document_ids.append(str(result.inserted_id))
+                    # 多向量模式：另存句子視窗向量，涵蓋分塊中超出模型長度限制的內容
+                    if settings.get("vector_search.multi_vector.enabled", False):
+                        window_embeddings = self._encode_windows(chunk_text)
+                        if window_embeddings is not None:
+                            document["window_embeddings"] = self._pack_windows(window_embeddings)
+                            chunk_metadata["window_count"] = len(window_embeddings)
                     
-                    logger.info(f"成功處理文檔塊 {i+1}，ID: {result.inserted_id}")
+                    # 交由背景寫入器批次寫入
+                    self.bulk_writer.submit(self.collection, InsertOne(document), ticket)
+                    document_ids.append(str(document["_id"]))
                     
+                    logger.info(f"已提交文檔塊 {i+1}，ID: {document['_id']}")
+                
                 except Exception as chunk_error:
                     logger.error(f"處理文檔塊 {i+1} 時發生錯誤: {chunk_error}")
                     continue
             
+            # 等待此檔案的寫入完成，寫入錯誤視為此檔案處理失敗
+            if not self.bulk_writer.wait(ticket):
+                logger.error(f"寫入 {len(ticket.errors)} 個文檔塊時發生錯誤: {next(iter(ticket.errors.values()))}")
+                return []
+            
             if document_ids:
+                if not ingest_version:
+                    self._notify_ingest(metadata)
                 logger.info(f"成功分割為 {len(document_ids)} 個塊")
                 table_count = sum(1 for chunk in text_chunks if chunk.get('has_structured_data', False))
                 ocr_count = sum(1 for chunk in text_chunks if chunk.get('is_ocr_content', False))
@@ -244,349 +530,1241 @@ class EnhancedMongoDBVectorStore:
             return []
     
     def _intelligent_split_text_enhanced(self, text: str) -> List[Dict]:
-        """智能文本分割"""
+        """智能文本分割（依內容選擇分塊策略）"""
         max_tokens = settings.get("vector_search.chunk_max_tokens", 6000)
-        chunks = []
+        return split_text(text, max_tokens)
+    
+    def search_similar_enhanced(self, query_text: str, company_filter: str = None, quarter_filter: str = None, limit: int = 5, prioritize_tables: bool = False) -> List[Dict]:
+        """相似文檔搜索"""
+        results = self.search_similar_multi(
+            [query_text], [limit],
+            company_filter=company_filter,
+            quarter_filter=quarter_filter,
+            prioritize_tables=prioritize_tables,
+            max_results=limit
+        )
         
-        # 檢查是否為OCR內容
-        is_ocr_content = "[PAGES " in text and "=" * 50 in text
+        logger.info(f"返回 {len(results)} 個相關塊")
+        if results:
+            logger.info(f"相似度範圍: {min(r['score'] for r in results):.3f} - {max(r['score'] for r in results):.3f}")
         
-        if is_ocr_content:
-            return self._split_ocr_content(text, max_tokens)
-        else:
-            return self._split_regular_content(text, max_tokens)
+        return results
     
-    def _split_ocr_content(self, text: str, max_tokens: int) -> List[Dict]:
-        """處理OCR提取的文本分割"""
-        chunks = []
-        
+    def search_similar_multi(self, query_texts: List[str], limits: List[int], company_filter: str = None, quarter_filter: str = None, prioritize_tables: bool = False, max_results: int = 30) -> List[Dict]:
+        """多查詢單次檢索：批次編碼所有子查詢，一次矩陣運算評分，以RRF融合排序；表格優先時另從表格分區選取保留名額"""
         try:
-            # 按OCR的頁面標記分割
-            page_pattern = r'\n={50}\n\[PAGES (\d+(?:-\d+)?)\]\n={50}\n'
-            page_splits = re.split(page_pattern, text)
-            
-            current_chunk = ""
-            current_page_info = []
-            
-            i = 0
-            while i < len(page_splits):
-                if i == 0:
-                    if page_splits[i].strip():
-                        content = page_splits[i].strip()
-                        if len(content) < max_tokens:
-                            current_chunk = content
-                    i += 1
-                    continue
-                
-                if i < len(page_splits):
-                    page_info = page_splits[i]
-                    i += 1
-                    
-                    if i < len(page_splits):
-                        page_content = page_splits[i].strip()
-                        
-                        # 解析頁碼範圍
-                        if '-' in page_info:
-                            start_page, end_page = page_info.split('-')
-                            pages_list = list(range(int(start_page), int(end_page) + 1))
-                        else:
-                            pages_list = [int(page_info)]
-                        
-                        test_content = current_chunk + f"\n[PAGES {page_info}]\n" + page_content
-                        
-                        if len(test_content) > max_tokens and current_chunk.strip():
-                            chunks.append({
-                                'text': current_chunk.strip(),
-                                'pages': current_page_info.copy(),
-                                'start_page': str(current_page_info[0]) if current_page_info else None,
-                                'end_page': str(current_page_info[-1]) if current_page_info else None,
-                                'has_structured_data': "=== 表格" in current_chunk,
-                                'is_ocr_content': True
-                            })
-                            
-                            current_chunk = f"[PAGES {page_info}]\n" + page_content
-                            current_page_info = pages_list.copy()
-                        else:
-                            if current_chunk:
-                                current_chunk += f"\n[PAGES {page_info}]\n" + page_content
-                            else:
-                                current_chunk = f"[PAGES {page_info}]\n" + page_content
-                            current_page_info.extend(pages_list)
-                    
-                    i += 1
-            
-            # 添加最後一個塊
-            if current_chunk.strip():
-                chunks.append({
-                    'text': current_chunk.strip(),
-                    'pages': current_page_info,
-                    'start_page': str(current_page_info[0]) if current_page_info else None,
-                    'end_page': str(current_page_info[-1]) if current_page_info else None,
-                    'has_structured_data': "=== 表格" in current_chunk,
-                    'is_ocr_content': True
-                })
+            if not query_texts:
+                return []
             
-            logger.info(f"OCR內容分割完成：{len(chunks)} 塊")
-            return chunks
+            start_time = time.perf_counter()
+            query_embeddings = self._encode_queries(query_texts)
             
-        except Exception as e:
-            logger.error(f"OCR內容分割時發生錯誤: {e}")
-            return self._fallback_split(text, max_tokens, is_ocr=True)
-    
-    def _split_regular_content(self, text: str, max_tokens: int) -> List[Dict]:
-        """處理常規PDF文本分割"""
-        chunks = []
-        
-        try:
-            pages = text.split('[PAGE ')
-            current_chunk = ""
-            current_page_info = []
+            # 只讀取最終結果的文字：評分時不傳輸候選塊的文字
+            fetch_text_top_k = settings.get("vector_search.fetch_text_top_k", True)
+            doc_info, doc_embeddings, doc_segments = self._load_candidates(company_filter, quarter_filter, include_text=not fetch_text_top_k)
+            table_info, table_embeddings = [], None
+            if prioritize_tables:
+                table_info, table_embeddings, _ = self._load_candidates(company_filter, quarter_filter, self.table_collection)
             
-            for i, page in enumerate(pages):
-                if not page.strip():
-                    continue
-                
-                if i > 0 or page.startswith('[PAGE'):
-                    page_content = '[PAGE ' + page if not page.startswith('[PAGE') else page
-                else:
-                    page_content = page
-                
-                # 提取頁碼信息
-                page_match = re.search(r'\[PAGE (\d+)\]', page_content)
-                page_num = page_match.group(1) if page_match else str(i)
-                
-                has_table = "=== 表格" in page_content or "結構化表格資料" in page_content
-                effective_max_tokens = max_tokens * 1.5 if has_table else max_tokens
-                
-                if len(current_chunk + page_content) > effective_max_tokens:
-                    if current_chunk.strip():
-                        chunks.append({
-                            'text': current_chunk.strip(),
-                            'pages': current_page_info.copy(),
-                            'start_page': current_page_info[0] if current_page_info else None,
-                            'end_page': current_page_info[-1] if current_page_info else None,
-                            'has_structured_data': "=== 表格" in current_chunk,
-                            'is_ocr_content': False
-                        })
-                    
-                    current_chunk = page_content
-                    current_page_info = [page_num]
-                else:
-                    current_chunk += page_content
-                    current_page_info.append(page_num)
-            
-            # 添加最後一個塊
-            if current_chunk.strip():
-                chunks.append({
-                    'text': current_chunk.strip(),
-                    'pages': current_page_info,
-                    'start_page': current_page_info[0] if current_page_info else None,
-                    'end_page': current_page_info[-1] if current_page_info else None,
-                    'has_structured_data': "=== 表格" in current_chunk,
-                    'is_ocr_content': False
-                })
+            if not doc_info and not table_info:
+                return []
             
-            logger.info(f"常規內容分割完成：{len(chunks)} 塊")
-            return chunks
+            # 一次矩陣乘法計算所有子查詢的相似度 (查詢數 x 候選數)，多向量模式取各分塊視窗的最大值
+            similarities = self._score_candidates(query_embeddings, doc_embeddings, doc_segments) if doc_info else None
+            table_similarities = self._cosine_scores(query_embeddings, table_embeddings) if table_info else None
             
-        except Exception as e:
-            logger.error(f"常規內容分割時發生錯誤: {e}")
-            return self._fallback_split(text, max_tokens, is_ocr=False)
-    
-    def _fallback_split(self, text: str, max_tokens: int, is_ocr: bool = False) -> List[Dict]:
-        """簡單的文本分割"""
-        chunks = []
-        
-        try:
-            text_length = len(text)
-            chunk_size = max_tokens
+            rrf_k = settings.get("vector_search.rrf_k", 60)
+            fused = {}
             
-            for i in range(0, text_length, chunk_size):
-                chunk_text = text[i:i + chunk_size]
+            for query_index, limit in enumerate(limits):
+                if table_info:
+                    ranked = self._merge_partitions(
+                        similarities[query_index] if doc_info else None, doc_info,
+                        table_similarities[query_index], table_info,
+                        limit
+                    )
+                else:
+                    # 尚未建立表格分區的資料，沿用文檔塊中的表格標記
+                    ranked = self._select_top(similarities[query_index], doc_info, limit, prioritize_tables)
                 
-                if chunk_text.strip():
-                    chunks.append({
-                        'text': chunk_text.strip(),
-                        'pages': ['unknown'],
-                        'start_page': 'unknown',
-                        'end_page': 'unknown',
-                        'has_structured_data': False,
-                        'is_fallback': True,
-                        'is_ocr_content': is_ocr
-                    })
+                for rank, result in enumerate(ranked):
+                    chunk_id = result['_id']
+                    if chunk_id not in fused:
+                        fused[chunk_id] = dict(result, rrf_score=0.0)
+                    entry = fused[chunk_id]
+                    entry['rrf_score'] += 1.0 / (rrf_k + rank + 1)
+                    entry['score'] = max(entry['score'], result['score'])
             
-            logger.info(f"降級分割完成：{len(chunks)} 塊")
-            return chunks
+            results = sorted(fused.values(), key=lambda x: x['rrf_score'], reverse=True)[:max_results]
+            if fetch_text_top_k:
+                self._fetch_texts(results)
             
+            table_results = sum(1 for r in results if r.get('metadata', {}).get('has_structured_data', False))
+            elapsed = time.perf_counter() - start_time
+            metrics.observe("retrieval", elapsed, company=company_filter)
+            self.last_search_stats = {
+                "latency_ms": round(elapsed * 1000, 2),
+                "candidates": len(doc_info),
+                "table_candidates": len(table_info),
+                "results": len(results),
+                "table_results": table_results,
+                "table_share": round(table_results / len(results), 3) if results else 0.0
+            }
+            
+            logger.info(
+                f"多查詢檢索：{len(query_texts)} 個子查詢，融合後返回 {len(results)} 個相關塊"
+                f"（表格 {table_results} 個，耗時 {self.last_search_stats['latency_ms']} ms）"
+            )
+            return results
+        
         except Exception as e:
-            logger.error(f"降級分割時發生錯誤: {e}")
+            logger.error(f"多查詢搜索時發生錯誤: {e}")
             return []
     
-    def search_similar_enhanced(self, query_text: str, company_filter: str = None, quarter_filter: str = None, limit: int = 5, prioritize_tables: bool = False) -> List[Dict]:
-        """相似文檔搜索"""
-        try:
-            query_embedding = self.embedding_model.encode(query_text, convert_to_tensor=False)
-            if isinstance(query_embedding, np.ndarray):
-                query_embedding = query_embedding.reshape(1, -1)
-            
-            # 構建查詢條件
-            query_conditions = {}
-            if company_filter:
-                query_conditions["metadata.company_name"] = company_filter
-            if quarter_filter:
-                query_conditions["metadata.quarter"] = quarter_filter
-            
-            logger.info(f"查詢條件: {query_conditions}")
-            documents = list(self.collection.find(query_conditions))
-            
-            if not documents:
-                logger.warning("沒有找到符合條件的文檔")
-                return []
-            
-            logger.info(f"找到 {len(documents)} 個候選文檔")
-            
-            # 提取所有文檔的embedding
-            doc_embeddings = []
-            doc_info = []
-            
-            for doc in documents:
-                embedding = doc.get('embedding')
-                if embedding:
-                    doc_embeddings.append(embedding)
-                    doc_info.append({
-                        'text': doc.get('text', ''),
-                        'metadata': doc.get('metadata', {}),
-                        '_id': doc.get('_id')
-                    })
-            
-            if not doc_embeddings:
-                logger.warning("沒有找到有效的 embedding")
-                return []
-            
-            # 計算相似度
-            doc_embeddings = np.array(doc_embeddings)
-            similarities = cosine_similarity(query_embedding, doc_embeddings)[0]
-            
-            # 創建結果列表
-            results_with_scores = []
-            for i, similarity_score in enumerate(similarities):
-                result = {
-                    'text': doc_info[i]['text'],
-                    'metadata': doc_info[i]['metadata'],
-                    'score': float(similarity_score),
-                    '_id': doc_info[i]['_id']
-                }
-                results_with_scores.append(result)
+    def _encode_queries(self, query_texts: List[str]) -> np.ndarray:
+        """批次編碼查詢文字，重複的查詢（例如每次分析共用的通用查詢）直接使用快取的向量"""
+        cached = {}
+        if self._query_embedding_cache_size:
+            with self._cache_lock:
+                for text in query_texts:
+                    if text in self._query_embedding_cache:
+                        self._query_embedding_cache.move_to_end(text)
+                        cached[text] = self._query_embedding_cache[text]
+        
+        missing = list(dict.fromkeys(text for text in query_texts if text not in cached))
+        if missing:
+            encoded = self.embedding_model.encode(missing, convert_to_tensor=False)
+            encoded = np.asarray(encoded, dtype=np.float32).reshape(len(missing), -1)
+            cached.update(zip(missing, encoded))
             
-            # 按相似度排序
-            results_with_scores.sort(key=lambda x: x['score'], reverse=True)
+            if self._query_embedding_cache_size:
+                with self._cache_lock:
+                    for text, embedding in zip(missing, encoded):
+                        self._query_embedding_cache[text] = embedding
+                    while len(self._query_embedding_cache) > self._query_embedding_cache_size:
+                        self._query_embedding_cache.popitem(last=False)
+        
+        return np.stack([cached[text] for text in query_texts])
+    
+    def invalidate_candidate_cache(self, company_name: str = None):
+        """寫入或刪除文檔塊後清除候選塊快取（指定公司時只清除該公司與未篩選公司的項目）"""
+        with self._cache_lock:
+            keys = [
+                key for key in self._candidate_cache
+                if company_name is None or key[1] in (company_name, None)
+            ]
+            for key in keys:
+                del self._candidate_cache[key]
+            if keys:
+                self.candidate_cache_stats["invalidations"] += len(keys)
+    
+    def warm_candidate_cache(self, company_filter: str = None, quarter_filter: str = None) -> int:
+        """預先載入公司-季度的候選塊（文檔塊與表格分區）至快取，返回載入的候選塊數"""
+        fetch_text_top_k = settings.get("vector_search.fetch_text_top_k", True)
+        doc_info, _, _ = self._load_candidates(company_filter, quarter_filter, include_text=not fetch_text_top_k)
+        table_info, _, _ = self._load_candidates(company_filter, quarter_filter, self.table_collection)
+        return len(doc_info) + len(table_info)
+    
+    def _load_candidates(self, company_filter: str = None, quarter_filter: str = None, collection=None, include_text: bool = True) -> Tuple[List[Dict], Optional[np.ndarray], Optional[np.ndarray]]:
+        """讀取候選塊，相同篩選條件在有效期間內重複使用記憶體中的向量矩陣
+        
+        快取的項目在本程序寫入文檔塊時失效；其他程序的寫入在 ttl_seconds 後生效。
+        """
+        collection = self.collection if collection is None else collection
+        if not self._candidate_cache_enabled:
+            return self._query_candidates(company_filter, quarter_filter, collection, include_text)
+        
+        multi_vector = settings.get("vector_search.multi_vector.enabled", False)
+        key = (collection.name, company_filter, quarter_filter, include_text, multi_vector)
+        now = time.monotonic()
+        with self._cache_lock:
+            entry = self._candidate_cache.get(key)
+            if entry and now - entry[0] < self._candidate_cache_ttl:
+                self._candidate_cache.move_to_end(key)
+                self.candidate_cache_stats["hits"] += 1
+                return entry[1]
+            self.candidate_cache_stats["misses"] += 1
+        
+        # 沒有候選塊的結果也快取（例如尚未建立表格分區的公司-季度）
+        candidates = self._query_candidates(company_filter, quarter_filter, collection, include_text)
+        with self._cache_lock:
+            self._candidate_cache[key] = (now, candidates)
+            while len(self._candidate_cache) > self._candidate_cache_entries:
+                self._candidate_cache.popitem(last=False)
+        return candidates
+    
+    def _query_candidates(self, company_filter: str = None, quarter_filter: str = None, collection=None, include_text: bool = True) -> Tuple[List[Dict], Optional[np.ndarray], Optional[np.ndarray]]:
+        """從資料庫讀取符合篩選條件的候選塊及其向量矩陣（預設為文檔塊集合）
+        
+        多向量模式下矩陣的每一列為一個句子視窗，並返回各候選塊第一個視窗的列索引；
+        沒有視窗向量的候選塊以其單一向量作為唯一視窗。
+        include_text 為 False 時不讀取文字（text 為 None），由 _fetch_texts 補上最終結果的文字。
+        """
+        collection = self.collection if collection is None else collection
+        multi_vector = settings.get("vector_search.multi_vector.enabled", False) and collection is self.collection
+        
+        # 構建查詢條件
+        query_conditions = dict(ACTIVE_FILTER)
+        if company_filter:
+            query_conditions["metadata.company_name"] = company_filter
+        if quarter_filter:
+            query_conditions["metadata.quarter"] = quarter_filter
+        
+        logger.info(f"查詢條件 ({collection.name}): {query_conditions}")
+        projection = {key: value for key, value in SEARCH_PROJECTION.items() if include_text or key not in TEXT_FIELDS}
+        if multi_vector:
+            projection["window_embeddings"] = 1
+        documents = list(collection.find(query_conditions, projection))
+        
+        if not documents:
+            logger.warning(f"{collection.name} 中沒有找到符合條件的文檔")
+            return [], None, None
+        
+        logger.info(f"找到 {len(documents)} 個候選文檔")
+        
+        # 提取所有文檔的embedding
+        doc_embeddings = []
+        doc_info = []
+        segment_starts = []
+        row_count = 0
+        
+        for doc in documents:
+            embedding = doc.get('embedding')
+            if not embedding:
+                continue
             
-            # 如果需要優先表格內容
-            if prioritize_tables:
-                table_results = [r for r in results_with_scores if r.get('metadata', {}).get('has_structured_data', False)]
-                non_table_results = [r for r in results_with_scores if not r.get('metadata', {}).get('has_structured_data', False)]
-                
-                final_results = []
-                table_limit = min(len(table_results), limit // 2)
-                final_results.extend(table_results[:table_limit])
-                remaining_limit = limit - len(final_results)
-                final_results.extend(non_table_results[:remaining_limit])
-                
-                results = final_results
+            if multi_vector:
+                vectors = self._unpack_windows(doc['window_embeddings'], len(embedding)) if doc.get('window_embeddings') else None
+                if vectors is None:
+                    vectors = np.asarray([embedding], dtype=np.float32)
+                doc_embeddings.append(vectors)
+                segment_starts.append(row_count)
+                row_count += len(vectors)
             else:
-                results = results_with_scores[:limit]
-            
-            logger.info(f"返回 {len(results)} 個相關塊")
-            if results:
-                logger.info(f"相似度範圍: {results[-1]['score']:.3f} - {results[0]['score']:.3f}")
-            
-            return results
+                doc_embeddings.append(embedding)
+            doc_info.append({
+                'text': (self.text_codec.text_of(doc) or '') if include_text else None,
+                'metadata': doc.get('metadata', {}),
+                '_id': doc.get('_id'),
+                'summary': doc.get('summary'),
+                'key_figures': doc.get('key_figures', [])
+            })
+        
+        if not doc_embeddings:
+            logger.warning("沒有找到有效的 embedding")
+            return [], None, None
+        
+        if multi_vector:
+            return doc_info, np.vstack(doc_embeddings).astype(np.float32, copy=False), np.asarray(segment_starts, dtype=np.int64)
+        return doc_info, np.asarray(doc_embeddings, dtype=np.float32), None
+    
+    def _fetch_texts(self, results: List[Dict]):
+        """讀取並解壓尚未載入文字的檢索結果"""
+        missing_ids = [result['_id'] for result in results if result.get('text') is None]
+        if not missing_ids:
+            return
         
+        texts = {
+            doc['_id']: self.text_codec.text_of(doc) or ''
+            for doc in self.collection.find({"_id": {"$in": missing_ids}}, {field: 1 for field in TEXT_FIELDS})
+        }
+        for result in results:
+            if result.get('text') is None:
+                result['text'] = texts.get(result['_id'], '')
+    
+    def _train_text_dictionary(self, extra_texts: List[str] = None) -> int:
+        """以現有文檔塊的隨機樣本（及額外文字）訓練共用的文字壓縮字典"""
+        sample_size = settings.get("vector_search.text_compression.training_chunks", 2000)
+        texts = list(extra_texts or [])
+        try:
+            for doc in self.collection.aggregate([
+                {"$sample": {"size": sample_size}},
+                {"$project": {field: 1 for field in TEXT_FIELDS}}
+            ]):
+                text = self.text_codec.text_of(doc)
+                if text:
+                    texts.append(text)
         except Exception as e:
-            logger.error(f"搜索時發生錯誤: {e}")
+            logger.warning(f"讀取字典訓練樣本時發生錯誤: {e}")
+        
+        return self.text_codec.train_dictionary(texts)
+    
+    def compress_chunk_texts(self, batch_size: int = 500) -> Dict[str, int]:
+        """將現有文檔塊與表格塊的 text 改以共用字典壓縮為 text_zstd"""
+        if not self.text_codec.available:
+            logger.error("未安裝 zstandard，無法壓縮文檔塊文字")
+            return {}
+        
+        dict_id = self._train_text_dictionary()
+        counts = {"dict_id": dict_id, "chunks": 0, "table_chunks": 0}
+        
+        for collection, count_key in ((self.collection, "chunks"), (self.table_collection, "table_chunks")):
+            ticket = WriteTicket(f"compress_{collection.name}")
+            cursor = collection.find({"text": {"$exists": True}}, {"text": 1}).batch_size(batch_size)
+            for doc in cursor:
+                self.bulk_writer.submit(
+                    collection,
+                    UpdateOne(
+                        {"_id": doc["_id"]},
+                        {"$set": {"text_zstd": self.text_codec.compress(doc["text"])}, "$unset": {"text": ""}}
+                    ),
+                    ticket
+                )
+                counts[count_key] += 1
+            
+            if not self.bulk_writer.wait(ticket):
+                logger.error(f"壓縮 {collection.name} 的 {len(ticket.errors)} 個塊時發生錯誤: {next(iter(ticket.errors.values()))}")
+        
+        self.invalidate_candidate_cache()
+        logger.info(f"以字典 {dict_id} 壓縮 {counts['chunks']} 個文檔塊與 {counts['table_chunks']} 個表格塊的文字")
+        return counts
+    
+    def _encode_windows(self, chunk_text: str) -> Optional[np.ndarray]:
+        """編碼分塊的句子視窗"""
+        windows = sentence_windows(chunk_text)
+        if not windows:
+            return None
+        
+        with metrics.timer("embedding"):
+            window_embeddings = self.embedding_model.encode(windows, convert_to_tensor=False)
+        return np.asarray(window_embeddings, dtype=np.float32).reshape(len(windows), -1)
+    
+    @staticmethod
+    def _pack_windows(window_embeddings: np.ndarray) -> Binary:
+        """將視窗向量正規化後以 float16 緊湊儲存"""
+        norms = np.linalg.norm(window_embeddings, axis=1, keepdims=True)
+        normalized = window_embeddings / np.where(norms == 0, 1, norms)
+        return Binary(normalized.astype(np.float16).tobytes())
+    
+    @staticmethod
+    def _unpack_windows(data: bytes, dimensions: int) -> Optional[np.ndarray]:
+        """還原 float16 視窗向量"""
+        windows = np.frombuffer(bytes(data), dtype=np.float16)
+        if dimensions <= 0 or windows.size == 0 or windows.size % dimensions:
+            return None
+        return windows.reshape(-1, dimensions).astype(np.float32)
+    
+    @staticmethod
+    def _score_candidates(query_embeddings: np.ndarray, embeddings: np.ndarray, segment_starts: Optional[np.ndarray] = None) -> np.ndarray:
+        """計算查詢與候選塊的相似度；有視窗分段時以各候選塊視窗的最大相似度為分數"""
+        similarities = EnhancedMongoDBVectorStore._cosine_scores(query_embeddings, embeddings)
+        if segment_starts is None:
+            return similarities
+        return np.maximum.reduceat(similarities, segment_starts, axis=1)
+    
+    @staticmethod
+    def _cosine_scores(query_embeddings: np.ndarray, doc_embeddings: np.ndarray) -> np.ndarray:
+        """計算查詢與候選塊之間的餘弦相似度矩陣"""
+        query_norms = np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+        doc_norms = np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
+        query_normalized = query_embeddings / np.where(query_norms == 0, 1, query_norms)
+        doc_normalized = doc_embeddings / np.where(doc_norms == 0, 1, doc_norms)
+        return query_normalized @ doc_normalized.T
+    
+    @staticmethod
+    def _result(similarities: np.ndarray, doc_info: List[Dict], index: int) -> Dict:
+        """建立單一檢索結果（含候選塊的摘要等欄位）"""
+        result = dict(doc_info[index])
+        result['score'] = float(similarities[index])
+        return result
+    
+    @staticmethod
+    def _select_top(similarities: np.ndarray, doc_info: List[Dict], limit: int, prioritize_tables: bool) -> List[Dict]:
+        """依相似度排序並選取結果，支援表格優先（以文檔塊中的表格標記區分）"""
+        # 按相似度排序
+        order = np.argsort(-similarities, kind='stable')
+        
+        if not prioritize_tables:
+            return [EnhancedMongoDBVectorStore._result(similarities, doc_info, i) for i in order[:limit]]
+        
+        # 如果需要優先表格內容：表格最多佔一半，其餘依序補上非表格內容
+        table_indices = []
+        non_table_indices = []
+        for i in order:
+            if doc_info[i]['metadata'].get('has_structured_data', False):
+                if len(table_indices) < limit // 2:
+                    table_indices.append(i)
+            elif len(non_table_indices) < limit:
+                non_table_indices.append(i)
+            if len(table_indices) >= limit // 2 and len(non_table_indices) >= limit:
+                break
+        
+        final_indices = table_indices + non_table_indices[:limit - len(table_indices)]
+        return [EnhancedMongoDBVectorStore._result(similarities, doc_info, i) for i in final_indices]
+    
+    @staticmethod
+    def _top_results(similarities: Optional[np.ndarray], doc_info: List[Dict], k: int) -> List[Dict]:
+        """選取相似度最高的 k 個結果（部分排序，不需排序全部候選）"""
+        if similarities is None or not doc_info or k <= 0:
             return []
+        
+        if k < len(similarities):
+            candidates = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            candidates = np.arange(len(similarities))
+        
+        # 相似度相同時依原始順序排列
+        order = candidates[np.lexsort((candidates, -similarities[candidates]))]
+        return [EnhancedMongoDBVectorStore._result(similarities, doc_info, i) for i in order]
+    
+    @staticmethod
+    def _merge_partitions(text_similarities: Optional[np.ndarray], text_info: List[Dict], table_similarities: np.ndarray, table_info: List[Dict], limit: int, table_quota_ratio: float = None) -> List[Dict]:
+        """分別從文檔塊與表格分區選取結果，保證表格名額後依相似度合併"""
+        if table_quota_ratio is None:
+            table_quota_ratio = settings.get("vector_search.table_quota_ratio", 0.5)
+        table_quota = int(limit * table_quota_ratio)
+        
+        table_top = EnhancedMongoDBVectorStore._top_results(table_similarities, table_info, limit)
+        text_top = EnhancedMongoDBVectorStore._top_results(text_similarities, text_info, limit)
+        
+        # 頁面文字已包含該頁的表格：所在頁面已由選取的文檔塊涵蓋的表格不再重複選取
+        text_count = limit - min(table_quota, len(table_top))
+        selected_text = text_top[:text_count]
+        covered = EnhancedMongoDBVectorStore._covered_pages(selected_text)
+        table_top = [table for table in table_top if not EnhancedMongoDBVectorStore._page_covered(table, covered)]
+        
+        selected = table_top[:table_quota] + selected_text
+        
+        # 名額不足時先以其餘文檔塊、再以其餘表格補足
+        if len(selected) < limit:
+            selected += text_top[text_count:text_count + limit - len(selected)]
+        if len(selected) < limit:
+            selected += table_top[table_quota:table_quota + limit - len(selected)]
+        
+        # 補足的文檔塊可能涵蓋已選取表格的頁面
+        covered = EnhancedMongoDBVectorStore._covered_pages([result for result in selected if result['metadata'].get('chunk_type') != 'table'])
+        selected = [
+            result for result in selected
+            if result['metadata'].get('chunk_type') != 'table' or not EnhancedMongoDBVectorStore._page_covered(result, covered)
+        ]
+        return sorted(selected, key=lambda x: x['score'], reverse=True)
+    
+    @staticmethod
+    def _covered_pages(results: List[Dict]) -> set:
+        """結果涵蓋的 (檔名, 頁碼) 集合（OCR 分塊的頁碼可能為 "3-4" 範圍）"""
+        covered = set()
+        for result in results:
+            metadata = result['metadata']
+            for page in metadata.get('pages_covered') or []:
+                start, _, end = str(page).partition("-")
+                if start.isdigit() and end.isdigit():
+                    covered.update((metadata.get('file_name'), str(number)) for number in range(int(start), int(end) + 1))
+                else:
+                    covered.add((metadata.get('file_name'), str(page)))
+        return covered
+    
+    @staticmethod
+    def _page_covered(table: Dict, covered: set) -> bool:
+        pages = EnhancedMongoDBVectorStore._covered_pages([table])
+        return bool(pages) and pages <= covered
+    
+    @staticmethod
+    def compute_source_fingerprint(chunk_ids: List, embedding_model: str = None) -> str:
+        """以文檔塊ID與向量模型計算公司-季度的來源版本指紋"""
+        hasher = hashlib.sha256()
+        hasher.update((embedding_model or settings.embedding_model).encode("utf-8"))
+        for chunk_id in sorted(str(chunk_id) for chunk_id in chunk_ids):
+            hasher.update(b"|")
+            hasher.update(chunk_id.encode("utf-8"))
+        return hasher.hexdigest()
+    
+    def get_company_quarter_sources(self, company_name: str = None, quarter: str = None) -> List[Dict]:
+        """獲取所有（或指定的）公司-季度組合及其來源版本指紋"""
+        match = dict(ACTIVE_FILTER)
+        if company_name:
+            match["metadata.company_name"] = company_name
+        if quarter:
+            match["metadata.quarter"] = quarter
+        
+        pipeline = [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": {
+                        "company": "$metadata.company_name",
+                        "quarter": "$metadata.quarter"
+                    },
+                    "chunk_ids": {"$push": "$_id"},
+                    "embedding_models": {"$addToSet": "$metadata.embedding_model"},
+                    "file_ids": {"$addToSet": "$metadata.file_id"}
+                }
+            },
+            {
+                "$sort": {
+                    "_id.company": 1,
+                    "_id.quarter": 1
+                }
+            }
+        ]
+        
+        groups = list(self.collection.aggregate(pipeline))
+        
+        # 正規化後的文檔塊不再內嵌向量模型，改由檔案記錄取得（只讀取這些公司-季度引用的檔案記錄）
+        file_ids = list({file_id for item in groups for file_id in item.get("file_ids", []) if file_id is not None})
+        file_models = {
+            doc["_id"]: doc.get("file_metadata", {}).get("embedding_model")
+            for doc in self.files_collection.find({"_id": {"$in": file_ids}}, {"file_metadata.embedding_model": 1})
+        } if file_ids else {}
+        
+        sources = []
+        for item in groups:
+            models = set(item.get("embedding_models", []))
+            models.update(file_models.get(file_id) for file_id in item.get("file_ids", []))
+            embedding_models = sorted(model for model in models if model)
+            sources.append({
+                "company": item['_id']['company'],
+                "quarter": item['_id']['quarter'],
+                "source_fingerprint": self.compute_source_fingerprint(
+                    item.get("chunk_ids", []),
+                    ",".join(embedding_models) or settings.embedding_model
+                )
+            })
+        
+        return sources
+    
+    def get_ingest_fingerprint(self, company_name: str, quarter: str) -> str:
+        """以檔案清單記錄的寫入版本計算公司-季度的資料版本
+
+        只讀取該公司-季度的檔案記錄，可在每次查詢時呼叫；任何程序替換、新增或移除該公司-季度的檔案後隨之改變。
+        """
+        hasher = hashlib.sha256()
+        query = {"company_name": company_name, "quarter": quarter}
+        for doc in self.files_collection.find(query, {"_id": 0, "file_name": 1, "ingest_version": 1}).sort("file_name", 1):
+            hasher.update(f"{doc['file_name']}:{doc.get('ingest_version')}|".encode("utf-8"))
+        return hasher.hexdigest()
     
-    def save_analysis_to_mongodb(self, company: str, quarter: str, analysis_results: Dict) -> List[Dict]:
+    def get_saved_analyses(self) -> Dict[Tuple[str, str], Dict]:
+        """讀取已保存的分析結果，依 (公司, 季度) 分組"""
+        saved = {}
+        projection = {"_id": 0, "company": 1, "quarter": 1, "title": 1, "analysis": 1, "source_fingerprint": 1}
+        
+        for doc in self.analysis_collection.find({}, projection):
+            key = (doc.get("company"), doc.get("quarter"))
+            entry = saved.setdefault(key, {"fingerprints": set(), "analyses": {}})
+            entry["fingerprints"].add(doc.get("source_fingerprint"))
+            entry["analyses"][doc.get("title")] = doc.get("analysis", "")
+        
+        return saved
+    
+    def save_analysis_to_mongodb(self, company: str, quarter: str, analysis_results: Dict, source_fingerprint: str = None) -> List[Dict]:
         """將分析結果保存到MongoDB"""
+        return self.save_analysis_batch_to_mongodb([{
+            "company": company,
+            "quarter": quarter,
+            "analysis_results": analysis_results,
+            "source_fingerprint": source_fingerprint
+        }])
+    
+    def save_analysis_batch_to_mongodb(self, batch: List[Dict]) -> List[Dict]:
+        """批次保存多個公司-季度的分析結果，以一次無序 bulk_write 送出所有 upsert"""
         try:
             current_time = datetime.now()
             title_mapping = settings.get("analysis_settings.title_mapping", {})
             
             saved_docs = []
+            ticket = WriteTicket(f"analysis_batch_{len(batch)}")
             
-            for analysis_type, analysis_content in analysis_results.items():
-                if analysis_type == "year_quarter":
-                    continue
-                
-                title = title_mapping.get(analysis_type, analysis_type)
+            for item in batch:
+                company = item["company"]
+                quarter = item["quarter"]
                 
-                filter_criteria = {
-                    "company": company,
-                    "title": title,
-                    "quarter": quarter
-                }
-                
-                update_data = {
-                    "$set": {
-                        "analysis": analysis_content,
-                        "updated_at": current_time
-                    },
-                    "$setOnInsert": {
+                for analysis_type, analysis_content in item["analysis_results"].items():
+                    if analysis_type == "year_quarter":
+                        continue
+                    
+                    title = title_mapping.get(analysis_type, analysis_type)
+                    
+                    filter_criteria = {
                         "company": company,
                         "title": title,
-                        "quarter": quarter,
-                        "created_at": current_time
+                        "quarter": quarter
                     }
-                }
-                
-                result = self.analysis_collection.update_one(
-                    filter_criteria,
-                    update_data,
-                    upsert=True
-                )
-                
-                if result.upserted_id:
-                    logger.info(f"新增分析記錄: {company} - {title} - {quarter}")
-                    saved_docs.append({
-                        "action": "inserted",
-                        "company": company,
-                        "title": title,
-                        "quarter": quarter,
-                        "id": str(result.upserted_id)
-                    })
-                elif result.modified_count > 0:
-                    logger.info(f"更新分析記錄: {company} - {title} - {quarter}")
+                    
+                    update_data = {
+                        "$set": {
+                            "analysis": analysis_content,
+                            "source_fingerprint": item.get("source_fingerprint"),
+                            "updated_at": current_time
+                        },
+                        "$setOnInsert": {
+                            "company": company,
+                            "title": title,
+                            "quarter": quarter,
+                            "created_at": current_time
+                        }
+                    }
+                    
+                    self.bulk_writer.submit(self.analysis_collection, UpdateOne(filter_criteria, update_data, upsert=True), ticket)
                     saved_docs.append({
-                        "action": "updated",
                         "company": company,
                         "title": title,
                         "quarter": quarter
                     })
+            
+            self.bulk_writer.wait(ticket)
+            
+            # updated_at 每次都會變更，未新增且未失敗的記錄即為更新
+            for index, doc in enumerate(saved_docs):
+                if index in ticket.errors:
+                    logger.error(f"保存分析記錄失敗: {doc['company']} - {doc['title']} - {doc['quarter']}: {ticket.errors[index]}")
+                    doc["action"] = "failed"
+                elif index in ticket.upserted_ids:
+                    logger.info(f"新增分析記錄: {doc['company']} - {doc['title']} - {doc['quarter']}")
+                    doc["action"] = "inserted"
+                    doc["id"] = str(ticket.upserted_ids[index])
                 else:
-                    logger.info(f"分析記錄無變更: {company} - {title} - {quarter}")
-                    saved_docs.append({
-                        "action": "no_change",
-                        "company": company,
-                        "title": title,
-                        "quarter": quarter
-                    })
+                    logger.info(f"更新分析記錄: {doc['company']} - {doc['title']} - {doc['quarter']}")
+                    doc["action"] = "updated"
             
             return saved_docs
-            
+        
         except Exception as e:
             logger.error(f"保存分析結果到MongoDB時發生錯誤: {e}")
             return []
     
+    def get_file_manifest(self) -> Dict[str, Dict]:
+        """讀取檔案清單，以 "公司_檔名" 為鍵
+
+        只包含已記錄內容雜湊的檔案；upsert_file_metadata 或 normalize_chunk_metadata 為舊資料建立、
+        只有 file_metadata 的檔案記錄不屬於清單，仍視為舊資料補登。
+        """
+        manifest = {}
+        for doc in self.files_collection.find({"sha256": {"$exists": True}}, {"_id": 0}):
+            manifest[f"{doc['company_name']}_{doc['file_name']}"] = doc
+        return manifest
+    
+    def needs_legacy_backfill(self, manifest: Dict[str, Dict]) -> bool:
+        """是否有已向量化但尚未記錄內容雜湊的舊資料檔案需要補登至檔案清單
+
+        只計入仍有已啟用文檔塊的檔案記錄；寫入中斷的檔案只有 upsert_file_metadata 建立的記錄與待替換的文檔塊，應重新處理而非補登。
+        """
+        if self.collection.count_documents(ACTIVE_FILTER, limit=1) == 0:
+            return False
+        if not manifest:
+            return True
+        for entry in self.files_collection.find({"sha256": {"$exists": False}}, {"_id": 0, "company_name": 1, "file_name": 1}):
+            active_chunks = dict(ACTIVE_FILTER, **{
+                "metadata.company_name": entry["company_name"],
+                "metadata.file_name": entry["file_name"]
+            })
+            if self.collection.count_documents(active_chunks, limit=1) > 0:
+                return True
+        return False
+    
+    def get_legacy_processed_files(self) -> set:
+        """列出已有啟用文檔塊但尚未記錄於檔案清單的舊資料檔案（僅在檔案清單建立前的資料需要）"""
+        pipeline = [
+            {"$match": ACTIVE_FILTER},
+            {
+                "$group": {
+                    "_id": {
+                        "company": "$metadata.company_name",
+                        "file_name": "$metadata.file_name"
+                    }
+                }
+            }
+        ]
+        
+        legacy_set = set()
+        for item in self.collection.aggregate(pipeline):
+            legacy_set.add(f"{item['_id']['company']}_{item['_id']['file_name']}")
+        return legacy_set
+    
+    def record_file_manifest(self, file_path: str, company_name: str, sha256: str, metadata: Dict = None, chunk_count: int = None, ingest_version: str = None):
+        """新增或更新單一檔案的清單記錄"""
+        try:
+            metadata = metadata or {}
+            file_stat = os.stat(file_path)
+            file_name = os.path.basename(file_path)
+            current_time = datetime.now()
+            
+            manifest_fields = {
+                "file_path": file_path,
+                "sha256": sha256,
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime,
+                "updated_at": current_time
+            }
+            if metadata:
+                manifest_fields.update({
+                    "year": metadata.get("year"),
+                    "quarter": metadata.get("quarter"),
+                    "page_count": metadata.get("total_pages"),
+                    "processing_mode": metadata.get("processing_mode"),
+                    "embedding_model": settings.embedding_model
+                })
+            if chunk_count is not None:
+                manifest_fields["chunk_count"] = chunk_count
+            
+            file_filter = {"company_name": company_name, "file_name": file_name}
+            if ingest_version:
+                # 只在此寫入版本仍是檔案登記的版本時更新，較新的寫入版本已切換時不覆寫其清單記錄
+                file_filter["ingest_version"] = ingest_version
+            
+            result = self.files_collection.update_one(
+                file_filter,
+                {
+                    "$set": manifest_fields,
+                    "$unset": {"duplicate_of": "", "duplicate_reason": ""},
+                    "$setOnInsert": {"created_at": current_time}
+                },
+                upsert=not ingest_version
+            )
+            if ingest_version and result.matched_count == 0:
+                logger.warning(f"{company_name} - {file_name} 已有較新的寫入版本，不更新檔案清單")
+        except Exception as e:
+            logger.error(f"記錄檔案清單時發生錯誤: {e}")
+    
+    def record_duplicate_file(self, file_path: str, company_name: str, sha256: str, duplicate_of: str, reason: str):
+        """將重複檔案記錄於檔案清單並連結至代表檔案（先前單獨處理過的重複檔案移除其文檔塊）"""
+        file_name = os.path.basename(file_path)
+        existing = self.files_collection.find_one({"company_name": company_name, "file_name": file_name}, {"duplicate_of": 1})
+        if existing and not existing.get("duplicate_of"):
+            self.delete_file_chunks(company_name, file_name)
+        
+        file_stat = os.stat(file_path)
+        current_time = datetime.now()
+        self.files_collection.update_one(
+            {"company_name": company_name, "file_name": file_name},
+            {
+                "$set": {
+                    "file_path": file_path,
+                    "sha256": sha256,
+                    "size": file_stat.st_size,
+                    "mtime": file_stat.st_mtime,
+                    "duplicate_of": duplicate_of,
+                    "duplicate_reason": reason,
+                    "updated_at": current_time
+                },
+                "$unset": {"chunk_count": "", "ingest_version": "", "embedding_model": ""},
+                "$setOnInsert": {"created_at": current_time}
+            },
+            upsert=True
+        )
+    
+    def upsert_file_metadata(self, metadata: Dict) -> Optional[ObjectId]:
+        """將檔案層級欄位保存於檔案記錄的 file_metadata，返回檔案記錄的ID"""
+        company_name = metadata.get("company_name")
+        file_name = metadata.get("file_name")
+        if not company_name or not file_name:
+            return None
+        
+        file_metadata = {field: metadata[field] for field in FILE_LEVEL_FIELDS if field in metadata}
+        file_metadata.setdefault("embedding_model", settings.embedding_model)
+        file_metadata.setdefault("embedding_dimensions", settings.get("vector_search.embedding_dimensions", 384))
+        current_time = datetime.now()
+        
+        try:
+            file_doc = self.files_collection.find_one_and_update(
+                {"company_name": company_name, "file_name": file_name},
+                {
+                    "$set": {"file_metadata": file_metadata, "updated_at": current_time},
+                    "$setOnInsert": {"created_at": current_time}
+                },
+                projection={"_id": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            return file_doc["_id"]
+        except Exception as e:
+            logger.error(f"保存 {company_name} - {file_name} 的檔案資訊時發生錯誤: {e}")
+            return None
+    
+    def _chunk_base_metadata(self, metadata: Dict) -> Dict:
+        """移除檔案層級欄位並加入檔案記錄ID，作為各文檔塊共用的 metadata"""
+        if not metadata:
+            return {}
+        
+        base_metadata = {key: value for key, value in metadata.items() if key not in FILE_LEVEL_FIELDS}
+        file_id = self.upsert_file_metadata(metadata)
+        if file_id is not None:
+            base_metadata["file_id"] = file_id
+        return base_metadata
+    
+    def normalize_chunk_metadata(self) -> Dict[str, int]:
+        """將舊文檔塊內嵌的檔案層級欄位移至檔案記錄，改以 metadata.file_id 參照"""
+        legacy_filter = {"$or": [{f"metadata.{field}": {"$exists": True}} for field in FILE_LEVEL_FIELDS]}
+        unset_fields = {f"metadata.{field}": "" for field in FILE_LEVEL_FIELDS}
+        counts = {"files": 0, "chunks": 0, "table_chunks": 0}
+        
+        for collection, count_key in ((self.collection, "chunks"), (self.table_collection, "table_chunks")):
+            pipeline = [
+                {"$match": legacy_filter},
+                {
+                    "$group": {
+                        "_id": {
+                            "company": "$metadata.company_name",
+                            "file_name": "$metadata.file_name"
+                        },
+                        "metadata": {"$first": "$metadata"}
+                    }
+                }
+            ]
+            
+            for item in collection.aggregate(pipeline):
+                file_id = self.upsert_file_metadata(item["metadata"])
+                if file_id is None:
+                    continue
+                
+                result = collection.update_many(
+                    dict(legacy_filter, **{
+                        "metadata.company_name": item["_id"]["company"],
+                        "metadata.file_name": item["_id"]["file_name"]
+                    }),
+                    {"$set": {"metadata.file_id": file_id}, "$unset": unset_fields}
+                )
+                counts[count_key] += result.modified_count
+                if collection is self.collection:
+                    counts["files"] += 1
+        
+        self.invalidate_candidate_cache()
+        logger.info(f"正規化 {counts['files']} 個檔案的 {counts['chunks']} 個文檔塊與 {counts['table_chunks']} 個表格塊")
+        return counts
+    
+    def get_storage_report(self, company_filter: str = None, quarter_filter: str = None) -> Dict:
+        """回報各集合的資料與索引大小，以及檢索查詢實際傳輸的位元組數"""
+        report = {"collections": {}}
+        for collection in (self.collection, self.table_collection, self.files_collection):
+            try:
+                stats = self.db.command("collStats", collection.name)
+                report["collections"][collection.name] = {
+                    "count": stats.get("count", 0),
+                    "size": stats.get("size", 0),
+                    "avg_obj_size": stats.get("avgObjSize", 0),
+                    "storage_size": stats.get("storageSize", 0),
+                    "total_index_size": stats.get("totalIndexSize", 0),
+                    "index_sizes": stats.get("indexSizes", {})
+                }
+            except Exception as e:
+                logger.warning(f"無法取得 {collection.name} 的集合統計: {e}")
+        
+        query = dict(ACTIVE_FILTER)
+        if company_filter:
+            query["metadata.company_name"] = company_filter
+        if quarter_filter:
+            query["metadata.quarter"] = quarter_filter
+        
+        # 完整文檔、檢索欄位與不含文字的檢索欄位（只讀取最終結果的文字時）三種讀取方式的傳輸量（以 BSON 編碼大小計算）
+        projection_without_text = {key: value for key, value in SEARCH_PROJECTION.items() if key not in TEXT_FIELDS}
+        for key, projection in (
+            ("find_full", None),
+            ("find_search_projection", SEARCH_PROJECTION),
+            ("find_search_without_text", projection_without_text)
+        ):
+            documents = 0
+            transfer_bytes = 0
+            for doc in self.collection.find(query, projection):
+                documents += 1
+                transfer_bytes += len(bson.encode(doc))
+            report[key] = {"documents": documents, "bytes": transfer_bytes}
+        
+        return report
+    
+    @staticmethod
+    def new_ingest_version() -> str:
+        """產生依建立時間排序的寫入版本
+
+        以 "t" 開頭，字串排序在舊資料的 UUID 寫入版本（只含十六進位字元）之後；同一檔案較晚開始的寫入版本較大。
+        """
+        return f"t{time.time_ns():020d}{uuid.uuid4().hex[:8]}"
+    
+    def replace_file_chunks(self, text: str, metadata: Dict, text_chunks: List[Dict] = None, tables: List[Dict] = None, still_owner=None) -> List[str]:
+        """以新的寫入版本替換單一檔案的文檔塊、表格分區塊與財務數據
+
+        三者先以同一寫入版本寫入為待替換狀態，再一起切換並刪除該檔案較舊的版本；tables 未指定時使用 current_tables。
+        still_owner 為切換前呼叫的檢查（例如工作程序是否仍持有租約），返回 False 時放棄此寫入版本。
+        同一檔案有較新的寫入版本已切換時，此版本同樣放棄並返回空列表。
+        """
+        company_name = metadata["company_name"]
+        file_name = metadata["file_name"]
+        tables = self.current_tables if tables is None else tables
+        ingest_version = self.new_ingest_version()
+        
+        with metrics.labels(company=company_name, file=file_name):
+            document_ids = self.add_document_with_enhanced_chunking(text, metadata, ingest_version=ingest_version, text_chunks=text_chunks)
+        
+        if not document_ids:
+            self._discard_ingest_version(company_name, file_name, ingest_version)
+            return []
+        
+        try:
+            self._add_file_tables(metadata, tables, ingest_version)
+            if still_owner is not None and not still_owner():
+                logger.warning(f"{company_name} - {file_name} 已由其他程序接手，放棄寫入版本 {ingest_version}")
+                self._discard_ingest_version(company_name, file_name, ingest_version)
+                return []
+            if not self._swap_ingest_version(company_name, file_name, ingest_version):
+                logger.warning(f"{company_name} - {file_name} 已有較新的寫入版本，放棄寫入版本 {ingest_version}")
+                self._discard_ingest_version(company_name, file_name, ingest_version)
+                return []
+        except Exception as e:
+            logger.error(f"切換 {company_name} - {file_name} 的寫入版本時發生錯誤: {e}")
+            self._discard_ingest_version(company_name, file_name, ingest_version)
+            return []
+        
+        self.last_ingest_version = ingest_version
+        self._notify_ingest(metadata)
+        logger.info(f"完成替換 {company_name} - {file_name}，寫入版本 {ingest_version}，共 {len(document_ids)} 個塊")
+        return document_ids
+    
+    def _claim_ingest_version(self, company_name: str, file_name: str, ingest_version: str, session=None) -> bool:
+        """在檔案記錄登記目前的寫入版本，只有沒有較新的版本登記時成功"""
+        file_doc = self.files_collection.find_one_and_update(
+            {
+                "company_name": company_name,
+                "file_name": file_name,
+                "$or": [
+                    {"ingest_version": {"$exists": False}},
+                    {"ingest_version": {"$lt": ingest_version}}
+                ]
+            },
+            {"$set": {"ingest_version": ingest_version, "updated_at": datetime.now()}},
+            projection={"_id": 1},
+            session=session
+        )
+        return file_doc is not None
+    
+    def _swap_ingest_version(self, company_name: str, file_name: str, ingest_version: str) -> bool:
+        """登記並啟用新的寫入版本，刪除同一檔案較舊的版本，返回是否切換成功
+
+        同一檔案同時有多個程序寫入時（租約到期但原工作程序仍在執行，或 main.py、pipeline.py 與工作程序並行），
+        只有最晚開始的寫入版本能登記於檔案記錄；刪除只針對比此版本舊的版本（含已放棄、尚未切換的版本），
+        因此較舊的寫入者無法刪除較新的版本。
+        """
+        chunk_filter = {
+            "metadata.company_name": company_name,
+            "metadata.file_name": file_name
+        }
+        fact_filter = {"company_name": company_name, "file_name": file_name}
+        
+        def swap(session=None):
+            if not self._claim_ingest_version(company_name, file_name, ingest_version, session=session):
+                return False
+            for collection in (self.collection, self.table_collection):
+                collection.update_many(
+                    dict(chunk_filter, **{"metadata.ingest_version": ingest_version}),
+                    {"$set": {"metadata.ingest_state": "active"}},
+                    session=session
+                )
+            self.facts_collection.update_many(
+                dict(fact_filter, ingest_version=ingest_version),
+                {"$set": {"ingest_state": "active"}},
+                session=session
+            )
+            # 沒有寫入版本的舊資料同樣視為較舊的版本
+            older_chunks = dict(chunk_filter, **{"$or": [
+                {"metadata.ingest_version": {"$lt": ingest_version}},
+                {"metadata.ingest_version": {"$exists": False}}
+            ]})
+            for collection in (self.collection, self.table_collection):
+                collection.delete_many(older_chunks, session=session)
+            self.facts_collection.delete_many(
+                dict(fact_filter, **{"$or": [
+                    {"ingest_version": {"$lt": ingest_version}},
+                    {"ingest_version": {"$exists": False}}
+                ]}),
+                session=session
+            )
+            return True
+        
+        # 登記寫入版本的檔案記錄需先存在（通常已由 upsert_file_metadata 建立）
+        self.files_collection.update_one(
+            fact_filter,
+            {"$setOnInsert": {"created_at": datetime.now()}},
+            upsert=True
+        )
+        
+        try:
+            # 以交易切換，讀取端只會看到完整的舊版本或新版本
+            with self.client.start_session() as session:
+                return session.with_transaction(lambda s: swap(s))
+        except (PyMongoError, NotImplementedError) as e:
+            # 單機 MongoDB 或本地替代資料庫不支援交易：依序登記、啟用新版本再刪除舊版本。
+            # update_many 逐筆啟用文檔塊，且文檔塊、表格分區塊與財務數據三個集合依序處理，
+            # 因此在刪除舊版本前，讀取端可能讀到部分已啟用的新版本與完整的舊版本並存
+            logger.warning(f"無法使用交易切換寫入版本，改為依序切換: {e}")
+            return swap()
+    
+    def _discard_ingest_version(self, company_name: str, file_name: str, ingest_version: str):
+        """刪除未完成的寫入版本（文檔塊、表格分區塊與財務數據）"""
+        chunk_filter = {
+            "metadata.company_name": company_name,
+            "metadata.file_name": file_name,
+            "metadata.ingest_version": ingest_version
+        }
+        try:
+            self.collection.delete_many(chunk_filter)
+            self.table_collection.delete_many(chunk_filter)
+            self.facts_collection.delete_many({"company_name": company_name, "file_name": file_name, "ingest_version": ingest_version})
+        except Exception as e:
+            logger.error(f"清除未完成的寫入版本時發生錯誤: {e}")
+    
+    def remove_stale_files(self, current_file_keys: set) -> int:
+        """刪除已不存在於財報資料夾的檔案之文檔塊與清單記錄"""
+        removed = 0
+        for entry in self.files_collection.find({}, {"_id": 0, "company_name": 1, "file_name": 1}):
+            if f"{entry['company_name']}_{entry['file_name']}" in current_file_keys:
+                continue
+            
+            self.delete_file_chunks(entry["company_name"], entry["file_name"])
+            self.files_collection.delete_one({"company_name": entry["company_name"], "file_name": entry["file_name"]})
+            removed += 1
+        
+        if removed:
+            logger.info(f"移除 {removed} 個已不存在的檔案")
+        return removed
+    
+    def delete_file_chunks(self, company_name: str, file_name: str) -> int:
+        """刪除單一檔案的所有文檔塊與財務數據"""
+        result = self.collection.delete_many({
+            "metadata.company_name": company_name,
+            "metadata.file_name": file_name
+        })
+        self.facts_collection.delete_many({"company_name": company_name, "file_name": file_name})
+        self.table_collection.delete_many({
+            "metadata.company_name": company_name,
+            "metadata.file_name": file_name
+        })
+        self.invalidate_candidate_cache(company_name)
+        logger.info(f"刪除 {company_name} - {file_name} 的 {result.deleted_count} 個舊文檔塊")
+        return result.deleted_count
+    
+    def _add_file_tables(self, metadata: Dict, tables: List[Dict], ingest_version: str) -> Dict[str, int]:
+        """將檔案的表格分區塊與財務數據以待替換狀態寫入（由 _swap_ingest_version 啟用），寫入失敗時拋出例外"""
+        company_name = metadata["company_name"]
+        file_name = metadata["file_name"]
+        ticket = WriteTicket(file_name)
+        
+        table_chunks = self._table_chunk_documents(metadata, tables, ingest_version)
+        facts = self._fact_documents(metadata, tables, ingest_version)
+        for collection, documents in ((self.table_collection, table_chunks), (self.facts_collection, facts)):
+            for document in documents:
+                self.bulk_writer.submit(collection, InsertOne(document), ticket)
+        
+        if not self.bulk_writer.wait(ticket):
+            raise RuntimeError(f"寫入 {len(ticket.errors)} 筆表格塊或財務數據時發生錯誤: {next(iter(ticket.errors.values()))}")
+        
+        metric_count = sum(1 for fact in facts if fact["metric"])
+        logger.info(
+            f"{company_name} - {file_name} 建立 {len(table_chunks)} 個表格塊，"
+            f"提取 {len(facts)} 筆表格數據（{metric_count} 筆對應財務指標）"
+        )
+        return {"table_chunks": len(table_chunks), "facts": len(facts)}
+    
+    def _table_chunk_documents(self, metadata: Dict, tables: List[Dict], ingest_version: str) -> List[Dict]:
+        """將檔案的每個結構化表格各自向量化為表格分區塊"""
+        tables = [table for table in tables if table.get("text", "").strip()]
+        if not tables:
+            return []
+        
+        embeddings = self.embedding_model.encode([table["text"] for table in tables], convert_to_tensor=False)
+        current_time = datetime.now()
+        base_metadata = self._chunk_base_metadata(metadata)
+        
+        documents = []
+        for table_index, (table, embedding) in enumerate(zip(tables, embeddings)):
+            if isinstance(embedding, np.ndarray):
+                embedding = embedding.tolist()
+            
+            page = str(table.get("page"))
+            table_metadata = base_metadata.copy()
+            table_metadata.update({
+                "chunk_type": "table",
+                "table_index": table_index,
+                "chunk_length": len(table["text"]),
+                "start_page": page,
+                "end_page": page,
+                "pages_covered": [page],
+                "has_structured_data": True,
+                "is_ocr_content": False,
+                "ingest_version": ingest_version,
+                "ingest_state": PENDING_STATE
+            })
+            
+            documents.append({
+                **self.text_codec.text_fields(table["text"]),
+                "embedding": embedding,
+                "metadata": table_metadata,
+                "created_at": current_time
+            })
+        return documents
+    
+    def _fact_documents(self, metadata: Dict, tables: List[Dict], ingest_version: str) -> List[Dict]:
+        """從檔案的結構化表格提取財務數據"""
+        facts = extract_facts_from_tables(tables)
+        current_time = datetime.now()
+        for fact in facts:
+            fact.update({
+                "company_name": metadata["company_name"],
+                "quarter": metadata.get("quarter"),
+                "file_name": metadata["file_name"],
+                "ingest_version": ingest_version,
+                "ingest_state": PENDING_STATE,
+                "created_at": current_time
+            })
+        return facts
+    
+    def get_financial_facts(self, company_name: str, quarter: str, metrics: List[str] = None) -> List[Dict]:
+        """查詢公司-季度的財務指標數據；優先返回欄位期間與季度相符的數據"""
+        query = {"company_name": company_name, "quarter": quarter, "ingest_state": {"$ne": PENDING_STATE}}
+        query["metric"] = {"$in": metrics} if metrics else {"$ne": None}
+        
+        try:
+            facts = list(self.facts_collection.find(query, {"_id": 0}).sort([("metric", 1), ("page", 1)]))
+        except Exception as e:
+            logger.error(f"查詢財務數據時發生錯誤: {e}")
+            return []
+        
+        # 欄位期間與季度相符者優先，其次為無法判斷期間者，其他期間（如去年同期）最後
+        def period_rank(fact):
+            if fact.get("period") == quarter:
+                return 0
+            return 1 if fact.get("period") is None else 2
+        
+        facts.sort(key=period_rank)
+        return facts
+    
+    def format_financial_facts(self, company_name: str, quarter: str, metrics: List[str] = None, max_facts: int = None) -> str:
+        """將財務指標數據格式化為提示中的條列文字"""
+        max_facts = max_facts or settings.get("financial_facts.max_prompt_facts", 12)
+        facts = self.get_financial_facts(company_name, quarter, metrics)
+        
+        lines = []
+        seen = set()
+        for fact in facts:
+            key = (fact["metric"], fact["column_header"], fact["value"])
+            if key in seen:
+                continue
+            seen.add(key)
+            
+            lines.append(f"- {fact['row_label']}（{fact['column_header']}，第 {fact['page']} 頁）: {format_fact_value(fact)}")
+            if len(lines) >= max_facts:
+                break
+        
+        return "\n".join(lines)
+    
+    def cross_check_automl_actuals(self, metric: str = "revenue", tolerance: float = None) -> List[Dict]:
+        """比對 AutoML 實際營收資料 (data_type='actual') 與財報表格中提取的數據"""
+        tolerance = tolerance if tolerance is not None else settings.get("financial_facts.cross_check_tolerance", 0.02)
+        automl_scale = settings.get("financial_facts.automl_value_scale", 1e6)
+        automl_collection = self.db[settings.get("financial_facts.automl_collection_name", "financial_revenue")]
+        
+        def company_key(name):
+            return re.sub(r"[^\w]", "_", str(name)).lower()
+        
+        # 依公司與期間彙整候選數據：欄位期間明確者依期間，否則依檔案季度
+        candidates: Dict[Tuple[str, str], List[Dict]] = {}
+        for fact in self.facts_collection.find({"metric": metric, "ingest_state": {"$ne": PENDING_STATE}}, {"_id": 0}):
+            period = fact.get("period") or fact.get("quarter")
+            candidates.setdefault((company_key(fact["company_name"]), period), []).append(fact)
+        
+        results = []
+        for actual in automl_collection.find({"data_type": "actual"}, {"_id": 0, "company": 1, "year_quarter": 1, "value": 1}):
+            key = (company_key(actual["company"]), actual["year_quarter"])
+            actual_value = float(actual["value"])
+            result = {
+                "company": actual["company"],
+                "year_quarter": actual["year_quarter"],
+                "actual_value": actual_value,
+                "fact_value": None,
+                "relative_diff": None,
+                "source": None,
+                "status": "missing"
+            }
+            
+            best = None
+            for fact in candidates.get(key, []):
+                values = [fact["value"] * fact.get("scale", 1.0) / automl_scale]
+                if not fact.get("unit"):
+                    # 表格內未標示單位時，也以原始數值比對
+                    values.append(fact["value"])
+                for value in values:
+                    diff = abs(value - actual_value) / abs(actual_value) if actual_value else abs(value)
+                    if best is None or diff < best[0]:
+                        best = (diff, value, fact)
+            
+            if best:
+                diff, value, fact = best
+                result.update({
+                    "fact_value": value,
+                    "relative_diff": round(diff, 6),
+                    "source": f"{fact['file_name']} 第 {fact['page']} 頁 {fact['row_label']} / {fact['column_header']}",
+                    "status": "matched" if diff <= tolerance else "mismatch"
+                })
+            results.append(result)
+        
+        return results
+    
+    def find_chunks_without_summary(self, company_name: str = None, file_name: str = None) -> List[Dict]:
+        """查詢尚未產生摘要的文檔塊"""
+        query = dict(ACTIVE_FILTER)
+        query["summary"] = {"$exists": False}
+        if company_name:
+            query["metadata.company_name"] = company_name
+        if file_name:
+            query["metadata.file_name"] = file_name
+        return [
+            {"_id": doc["_id"], "text": self.text_codec.text_of(doc) or ""}
+            for doc in self.collection.find(query, {field: 1 for field in TEXT_FIELDS})
+        ]
+    
+    def get_cached_summaries(self, keys: List[str]) -> Dict[str, Dict]:
+        """依內容雜湊讀取已快取的摘要"""
+        if not keys:
+            return {}
+        cached = self.summary_cache_collection.find({"_id": {"$in": list(set(keys))}})
+        return {
+            entry["_id"]: {"summary": entry.get("summary", ""), "key_figures": entry.get("key_figures", [])}
+            for entry in cached
+        }
+    
+    def save_chunk_summaries(self, updates: List[Dict], model: str) -> int:
+        """將摘要寫回文檔塊，並以內容雜湊保存至摘要快取"""
+        if not updates:
+            return 0
+        
+        current_time = datetime.now()
+        ticket = WriteTicket("chunk_summaries")
+        for update in updates:
+            summary_fields = {"summary": update["summary"], "key_figures": update["key_figures"]}
+            self.bulk_writer.submit(
+                self.collection,
+                UpdateOne({"_id": update["_id"]}, {"$set": dict(summary_fields, **{"metadata.summary_model": model})}),
+                ticket
+            )
+            self.bulk_writer.submit(
+                self.summary_cache_collection,
+                UpdateOne(
+                    {"_id": update["key"]},
+                    {"$set": dict(summary_fields, model=model, updated_at=current_time)},
+                    upsert=True
+                ),
+                ticket
+            )
+        
+        if not self.bulk_writer.wait(ticket):
+            logger.error(f"保存 {len(ticket.errors)} 筆文檔塊摘要時發生錯誤: {next(iter(ticket.errors.values()))}")
+            return 0
+        
+        self.invalidate_candidate_cache()
+        logger.info(f"保存 {len(updates)} 個文檔塊摘要")
+        return len(updates)
+    
     def clear_collection(self):
         """清空集合"""
         try:
             self.collection.delete_many({})
+            self.files_collection.delete_many({})
+            self.facts_collection.delete_many({})
+            self.table_collection.delete_many({})
+            self.summary_cache_collection.delete_many({})
+            self.invalidate_candidate_cache()
             logger.info("成功清空集合")
         except Exception as e:
             logger.error(f"清空集合時發生錯誤: {e}")
     
-    def clear_analysis_collection(self, company: str = None, quarter: str = None):
-        """清空分析結果集合"""
+    def clear_analysis_collection(self, company: str = None, quarter: str = None, confirm: bool = None):
+        """清空分析結果集合（清空全部時 confirm 為 None 則詢問確認）"""
         try:
             if company or quarter:
                 query = {}
@@ -604,9 +1782,10 @@ class EnhancedMongoDBVectorStore:
                     logger.info(f"沒有找到符合條件的分析結果: {query}")
             else:
                 total_count = self.analysis_collection.count_documents({})
-                confirmation = input(f"確定要刪除所有 {total_count} 筆分析結果嗎？(y/N): ").lower()
+                if confirm is None:
+                    confirm = input(f"確定要刪除所有 {total_count} 筆分析結果嗎？(y/N): ").lower() == 'y'
                 
-                if confirmation == 'y':
+                if confirm:
                     self.analysis_collection.delete_many({})
                     logger.info(f"清空所有分析結果，共刪除 {total_count} 筆記錄")
                 else:
@@ -0,0 +1,483 @@
+"""
+非互動財報處理流程
+
+以明確的階段執行完整流程，不需任何互動輸入，可由排程器執行：
+
+    discover → extract → chunk → embed   （每個檔案）
+                                   ↓
+                               analyze    （每個公司-季度，該季度的檔案都完成 embed 後即開始）
+                                   ↓
+                                export    （所有分析完成後）
+
+每個階段完成時於 pipeline_state 集合記錄完成標記（檔案階段以檔案 SHA-256 為版本，
+分析階段以來源版本指紋為版本），提取與分塊結果保存於 pipeline.work_directory。
+中斷後重新執行會從各項目尚未完成的階段繼續；不同檔案的提取、向量化與各公司-季度的分析並行執行。
+
+執行方式（於 Insight 目錄）：
+    python pipeline.py                                  # 執行所有階段
+    python pipeline.py --stages discover extract chunk  # 只提取與分塊
+    python pipeline.py --stages analyze export --force  # 以現有向量資料重新分析並匯出
+    python pipeline.py --status                         # 顯示各階段的完成標記數量
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from config.settings import settings
+from utils.logger import setup_logger, get_logger
+from utils.excel_exporter import export_analysis_from_mongodb
+from utils.file_utils import (
+    find_report_folders, find_pdf_files, extract_company_name, extract_year_and_quarter,
+    classify_file, analysis_file_name, create_output_directory, generate_excel_filename
+)
+from utils.duplicate_detector import link_duplicates
+from utils.metrics import metrics
+from processors.chunker import split_text
+from models.vector_store import EnhancedMongoDBVectorStore
+from models.pipeline_state import PipelineState
+
+logger = get_logger(__name__)
+
+STAGES = ("discover", "extract", "chunk", "embed", "analyze", "export")
+FILE_STAGES = ("extract", "chunk", "embed")
+
+def serialize_table(table: Dict) -> Dict:
+    """將表格（含 DataFrame）轉為可保存為 JSON 的格式"""
+    dataframe = table.get("dataframe")
+    return {
+        "page": table.get("page"),
+        "text": table.get("text", ""),
+        "type": table.get("type"),
+        "columns": [None if column is None else str(column) for column in dataframe.columns] if dataframe is not None else None,
+        "rows": dataframe.astype(str).values.tolist() if dataframe is not None else None
+    }
+
+def deserialize_table(data: Dict) -> Dict:
+    """還原 serialize_table 保存的表格"""
+    table = {key: data.get(key) for key in ("page", "text", "type")}
+    if data.get("rows") is not None:
+        table["dataframe"] = pd.DataFrame(data["rows"], columns=data["columns"])
+    return table
+
+def ingest_extracted(vector_store, item: Dict, extracted: Dict, chunks: List[Dict], summarizer=None, still_owner=None) -> Dict:
+    """將檔案的提取與分塊結果（含表格分區塊與財務數據）向量化寫入資料庫，並更新檔案清單
+
+    item 為 discover 產生的檔案資訊，extracted 為 extract_file 的結果（tables 含 DataFrame）。
+    still_owner 在切換寫入版本前呼叫，返回 False 時放棄寫入（工作程序已失去租約）。
+    """
+    tables = extracted["tables"]
+    use_ocr = extracted["use_ocr"]
+    metadata = {
+        "file_name": item["file_name"],
+        "company_name": item["company_name"],
+        "year": item["year"],
+        "quarter": item["quarter"],
+        "total_pages": extracted["total_pages"],
+        "processing_mode": "ocr_enhanced" if use_ocr else "pymupdf_enhanced_chunking",
+        "extraction_method": "gpt-4-vision_ocr" if use_ocr else "pymupdf_text_extraction",
+        "tables_extracted": len(tables),
+        "images_extracted": extracted["images_extracted"],
+        "attempt_number": 1
+    }
+    
+    doc_ids = vector_store.replace_file_chunks(extracted["text"], metadata, text_chunks=chunks, tables=tables, still_owner=still_owner)
+    if not doc_ids:
+        raise ValueError("寫入文檔塊失敗")
+    
+    ingest_version = vector_store.last_ingest_version
+    vector_store.record_file_manifest(
+        item["path"], item["company_name"], item["sha256"], metadata, len(doc_ids), ingest_version=ingest_version
+    )
+    if summarizer:
+        summarizer.summarize_pending_chunks(vector_store, item["company_name"], item["file_name"])
+    return {"chunks": len(doc_ids), "ingest_version": ingest_version}
+
+class PipelineRunner:
+    """依階段執行財報處理流程，並以完成標記支援中斷後續跑"""
+    def __init__(self, vector_store, stages=STAGES, force: bool = False, restart: bool = False, analyzer=None, summarizer=None,
+                 extract_workers: int = None, embed_workers: int = None, analyze_workers: int = None):
+        self.vector_store = vector_store
+        self.stages = set(stages)
+        self.force = force
+        self.restart = restart
+        self.analyzer = analyzer
+        self.summarizer = summarizer
+        self.state = PipelineState(vector_store.db[settings.pipeline_state_collection_name])
+        
+        self.work_directory = os.path.join(settings.base_directory, settings.get("pipeline.work_directory", ".pipeline"))
+        self.chunk_max_tokens = settings.get("vector_search.chunk_max_tokens", 6000)
+        self.extract_workers = extract_workers or settings.get("pipeline.extract_workers", 2)
+        self.embed_workers = embed_workers or settings.get("pipeline.embed_workers", 1)
+        self.analyze_workers = analyze_workers or settings.get("pipeline.analyze_workers", 2)
+        
+        self.counts = {stage: {"done": 0, "skipped": 0, "failed": 0} for stage in STAGES}
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self._lock = threading.Lock()
+        self._saved_analyses = {}
+        self.duplicates = {}
+    
+    def _versions(self, item: Dict) -> Dict[str, str]:
+        """檔案各階段的輸入版本：內容或設定改變時版本隨之改變"""
+        chunk_version = f"{item['sha256']}:{self.chunk_max_tokens}"
+        return {
+            "extract": item["sha256"],
+            "chunk": chunk_version,
+            "embed": f"{chunk_version}:{settings.embedding_model}"
+        }
+    
+    def _artifact_path(self, stage: str, version: str) -> str:
+        return os.path.join(self.work_directory, stage, hashlib.sha256(version.encode("utf-8")).hexdigest()[:32] + ".json")
+    
+    @staticmethod
+    def _write_json(path: str, data: Dict):
+        """先寫入暫存檔再改名，中斷時不會留下不完整的中間結果"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+    
+    def _load_artifact(self, stage: str, item: Dict) -> Dict:
+        """讀取前一個階段保存的中間結果"""
+        path = self._artifact_path(stage, self._versions(item)[stage])
+        if not os.path.exists(path):
+            raise ValueError(f"缺少 {stage} 階段的結果，請一併執行 {stage} 階段")
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    
+    def _is_complete(self, stage: str, item: Dict) -> bool:
+        """完成標記版本相同，且後續階段需要的中間結果仍存在"""
+        version = self._versions(item)[stage]
+        if not self.state.is_done(stage, item["key"], version):
+            return False
+        return stage == "embed" or os.path.exists(self._artifact_path(stage, version))
+    
+    def _count(self, stage: str, outcome: str, seconds: float = 0.0):
+        with self._lock:
+            self.counts[stage][outcome] += 1
+            self.seconds[stage] += seconds
+    
+    def _count_seconds(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] += seconds
+    
+    def discover(self) -> List[Dict]:
+        """列出所有財報檔案並計算內容雜湊（大小與修改時間未變時沿用檔案清單的雜湊）"""
+        start = time.perf_counter()
+        manifest = self.vector_store.get_file_manifest()
+        legacy_files = set()
+        if self.vector_store.needs_legacy_backfill(manifest):
+            legacy_files = self.vector_store.get_legacy_processed_files()
+        
+        files = []
+        for folder in find_report_folders(settings.base_directory):
+            company_name = extract_company_name(folder)
+            for pdf_file in find_pdf_files(folder):
+                file_name = os.path.basename(pdf_file)
+                file_key = f"{company_name}_{file_name}"
+                year, quarter = extract_year_and_quarter(file_name)
+                if not year or not quarter:
+                    logger.warning(f"無法提取年份季度信息，跳過: {file_name}")
+                    continue
+                
+                manifest_entry = manifest.get(file_key)
+                status, sha256 = classify_file(pdf_file, manifest_entry)
+                if status == "new" and file_key in legacy_files:
+                    self.vector_store.record_file_manifest(pdf_file, company_name, sha256)
+                    status, manifest_entry = "unchanged", {"sha256": sha256, "embedding_model": settings.embedding_model}
+                
+                item = {
+                    "key": file_key,
+                    "path": pdf_file,
+                    "company_name": company_name,
+                    "file_name": file_name,
+                    "year": year,
+                    "quarter": f"{year}_{quarter}",
+                    "sha256": sha256,
+                    # 已由 main.py 處理且內容未變更的檔案，不需重新提取與向量化
+                    "indexed": status == "unchanged" and (manifest_entry or {}).get("embedding_model", settings.embedding_model) == settings.embedding_model
+                }
+                self.state.mark_done("discover", file_key, sha256, path=pdf_file, quarter=item["quarter"], status=status)
+                self._count("discover", "done")
+                files.append(item)
+        
+        # 重複檔案連結至代表檔案，不再提取、向量化與分析
+        all_files = files
+        files, self.duplicates = link_duplicates(self.vector_store, all_files)
+        for item in all_files:
+            if item["key"] in self.duplicates:
+                duplicate = self.duplicates[item["key"]]
+                self.state.mark_done("discover", item["key"], item["sha256"], path=item["path"], quarter=item["quarter"],
+                                     status="duplicate", duplicate_of=duplicate["duplicate_of"], reason=duplicate["reason"])
+        
+        self._count_seconds("discover", time.perf_counter() - start)
+        logger.info(f"找到 {len(files) + len(self.duplicates)} 個財報檔案，其中重複檔案 {len(self.duplicates)} 個")
+        return files
+    
+    def _extract(self, item: Dict) -> Dict:
+        result = self.vector_store.extract_file(item["path"], item["company_name"], sha256=item["sha256"])
+        if not result["text"]:
+            raise ValueError("無法讀取檔案內容")
+        
+        version = self._versions(item)["extract"]
+        self._write_json(self._artifact_path("extract", version), {
+            "text": result["text"],
+            "total_pages": result["total_pages"],
+            "use_ocr": result["use_ocr"],
+            "images_extracted": result["images_extracted"],
+            "tables": [serialize_table(table) for table in result["tables"]]
+        })
+        return {"total_pages": result["total_pages"], "tables": len(result["tables"])}
+    
+    def _chunk(self, item: Dict) -> Dict:
+        extracted = self._load_artifact("extract", item)
+        chunks = split_text(extracted["text"], self.chunk_max_tokens)
+        if not chunks:
+            raise ValueError("分塊結果為空")
+        
+        self._write_json(self._artifact_path("chunk", self._versions(item)["chunk"]), {"chunks": chunks})
+        return {"chunks": len(chunks)}
+    
+    def _embed(self, item: Dict) -> Dict:
+        extracted = self._load_artifact("extract", item)
+        chunks = self._load_artifact("chunk", item)["chunks"]
+        extracted["tables"] = [deserialize_table(table) for table in extracted["tables"]]
+        return ingest_extracted(self.vector_store, item, extracted, chunks, self.summarizer)
+    
+    def _analyze(self, company: str, quarter: str) -> Optional[Dict]:
+        """分析單一公司-季度，來源版本未變更時略過（返回 None）"""
+        key = f"{company}_{quarter}"
+        sources = self.vector_store.get_company_quarter_sources(company, quarter)
+        if not sources:
+            raise ValueError("資料庫中沒有此公司-季度的文檔塊")
+        fingerprint = sources[0]["source_fingerprint"]
+        
+        if not self.force:
+            if self.state.is_done("analyze", key, fingerprint):
+                return None
+            
+            # 由 main.py 完成且來源未變更的分析結果（--restart 時不沿用）
+            saved = self._saved_analyses.get((company, quarter))
+            title_mapping = settings.get("analysis_settings.title_mapping", {})
+            analysis_types = settings.get("analysis_settings.analysis_types", ["company_overview", "business_strategy", "risks"])
+            expected_titles = {title_mapping.get(analysis_type, analysis_type) for analysis_type in analysis_types}
+            if saved and saved["fingerprints"] == {fingerprint} and expected_titles.issubset(saved["analyses"]):
+                self.state.mark_done("analyze", key, fingerprint, source="saved_analysis")
+                return None
+        
+        analysis = self.analyzer.generate_enhanced_business_analysis_with_fallback(
+            self.vector_store, analysis_file_name(company, quarter), company, quarter
+        )
+        if not analysis:
+            raise ValueError("無法生成有效分析")
+        
+        self.vector_store.save_analysis_to_mongodb(company, quarter, analysis, fingerprint)
+        self.state.mark_done("analyze", key, fingerprint)
+        return {"source_fingerprint": fingerprint}
+    
+    def _export(self) -> Optional[Dict]:
+        """所有分析結果的指紋未變更且 Excel 仍存在時略過（返回 None）"""
+        saved = self.vector_store.get_saved_analyses()
+        version = hashlib.sha256(json.dumps(
+            sorted([company, quarter, sorted(filter(None, entry["fingerprints"]))] for (company, quarter), entry in saved.items()),
+            ensure_ascii=False
+        ).encode("utf-8")).hexdigest()
+        
+        marker = self.state.get("export", "all")
+        if (not self.force and marker and marker.get("status") == "done" and marker.get("version") == version
+                and os.path.exists(marker.get("details", {}).get("path", ""))):
+            return None
+        
+        output_path = os.path.join(create_output_directory(settings.base_directory), generate_excel_filename())
+        export_analysis_from_mongodb(self.vector_store.analysis_collection, output_path)
+        self.state.mark_done("export", "all", version, path=output_path)
+        logger.info(f"Excel結果已保存到: {output_path}")
+        return {"path": output_path}
+    
+    def _run_stage(self, stage: str, item=None) -> bool:
+        """執行單一項目的單一階段並記錄標記，返回是否可繼續後續階段"""
+        if stage not in self.stages:
+            return True
+        
+        if stage in FILE_STAGES:
+            key, version = item["key"], self._versions(item)[stage]
+        elif stage == "analyze":
+            key, version = f"{item[0]}_{item[1]}", None
+        else:
+            key, version = "all", None
+        
+        start = time.perf_counter()
+        try:
+            if stage in FILE_STAGES:
+                with metrics.labels(company=item["company_name"], file=item["file_name"]):
+                    details = getattr(self, f"_{stage}")(item)
+                self.state.mark_done(stage, key, version, **details)
+            elif stage == "analyze":
+                details = self._analyze(*item)
+            else:
+                details = self._export()
+        except Exception as e:
+            logger.error(f"{stage} 階段處理 {key} 時發生錯誤: {e}")
+            self.state.mark_failed(stage, key, version, str(e))
+            self._count(stage, "failed", time.perf_counter() - start)
+            return False
+        
+        self._count(stage, "skipped" if details is None else "done", time.perf_counter() - start)
+        logger.info(f"{stage} 階段{'略過（未變更）' if details is None else '完成'}: {key}")
+        return True
+    
+    def _first_pending_stage(self, item: Dict) -> Optional[str]:
+        """從最後一個階段往前找出已完成的階段，返回第一個需要執行的檔案階段（全部完成時返回 None）"""
+        if not self.restart and item["indexed"] and not self.state.is_done("embed", item["key"], self._versions(item)["embed"]):
+            self.state.mark_done("embed", item["key"], self._versions(item)["embed"], source="file_manifest")
+        
+        for index in range(len(FILE_STAGES) - 1, -1, -1):
+            if self._is_complete(FILE_STAGES[index], item):
+                next_index = index + 1
+                for stage in FILE_STAGES[:next_index]:
+                    self._count(stage, "skipped")
+                return FILE_STAGES[next_index] if next_index < len(FILE_STAGES) else None
+        return FILE_STAGES[0]
+    
+    def run(self) -> bool:
+        """執行選定的階段，返回是否全部成功"""
+        start = time.perf_counter()
+        if self.restart:
+            removed = self.state.reset(self.stages)
+            logger.info(f"清除 {removed} 個完成標記，重新執行: {', '.join(sorted(self.stages))}")
+        
+        file_stages_selected = bool(self.stages & set(FILE_STAGES)) or "discover" in self.stages
+        files = self.discover() if file_stages_selected else []
+        if "analyze" in self.stages:
+            self._saved_analyses = {} if self.force or self.restart else self.vector_store.get_saved_analyses()
+        
+        # 每個公司-季度等待其所有檔案完成 embed 後才分析
+        waiting: Dict[Tuple[str, str], set] = {}
+        blocked = set()
+        next_stage = {"extract": "chunk", "chunk": "embed"}
+        
+        with ThreadPoolExecutor(self.extract_workers, thread_name_prefix="extract") as extract_pool, \
+                ThreadPoolExecutor(self.embed_workers, thread_name_prefix="embed") as embed_pool, \
+                ThreadPoolExecutor(self.analyze_workers, thread_name_prefix="analyze") as analyze_pool:
+            pools = {"extract": extract_pool, "chunk": extract_pool, "embed": embed_pool, "analyze": analyze_pool}
+            pending = {}
+            
+            def submit(stage, item):
+                pending[pools[stage].submit(self._run_stage, stage, item)] = (stage, item)
+            
+            def file_finished(item, ok):
+                company_quarter = (item["company_name"], item["quarter"])
+                waiting[company_quarter].discard(item["key"])
+                if not ok:
+                    blocked.add(company_quarter)
+                if not waiting[company_quarter] and company_quarter not in blocked:
+                    submit("analyze", company_quarter)
+            
+            for item in files:
+                waiting.setdefault((item["company_name"], item["quarter"]), set()).add(item["key"])
+            
+            if files:
+                for item in files:
+                    stage = self._first_pending_stage(item)
+                    if stage:
+                        submit(stage, item)
+                    else:
+                        file_finished(item, True)
+            elif "analyze" in self.stages:
+                for source in self.vector_store.get_company_quarter_sources():
+                    submit("analyze", (source["company"], source["quarter"]))
+            
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, item = pending.pop(future)
+                    ok = future.result()
+                    if stage in next_stage and ok:
+                        submit(next_stage[stage], item)
+                    elif stage in FILE_STAGES:
+                        file_finished(item, ok)
+        
+        for company, quarter in sorted(blocked):
+            logger.warning(f"{company} - {quarter} 有檔案處理失敗，未進行分析")
+        
+        if "embed" in self.stages and files:
+            self.vector_store.remove_stale_files({item["key"] for item in files} | set(self.duplicates))
+        if "extract" in self.stages and files and self.vector_store.artifact_store:
+            removed = self.vector_store.artifact_store.remove_unused({item["sha256"] for item in files})
+            if removed:
+                logger.info(f"刪除 {removed} 個已不存在或已變更檔案的提取結果快取")
+        
+        failed = sum(counts["failed"] for counts in self.counts.values()) + len(blocked)
+        if "export" in self.stages:
+            self._run_stage("export")
+        
+        logger.info(f"\n=== 流程完成，耗時 {time.perf_counter() - start:.1f} 秒 ===")
+        for stage in STAGES:
+            if stage in self.stages:
+                counts = self.counts[stage]
+                logger.info(
+                    f"{stage}: 完成 {counts['done']}，略過 {counts['skipped']}，失敗 {counts['failed']}"
+                    f"（累計 {self.seconds[stage]:.1f} 秒）"
+                )
+        if blocked:
+            logger.info(f"因檔案失敗未分析的公司-季度: {len(blocked)} 個")
+        
+        return failed == 0 and self.counts["export"]["failed"] == 0
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="非互動財報處理流程")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="要執行的階段（預設全部）")
+    parser.add_argument("--restart", action="store_true", help="清除選定階段的完成標記並重新執行（不沿用檔案清單）")
+    parser.add_argument("--force", action="store_true", help="忽略來源版本指紋，重新分析並匯出")
+    parser.add_argument("--extract-workers", type=int, help="並行提取與分塊的檔案數（預設 pipeline.extract_workers）")
+    parser.add_argument("--embed-workers", type=int, help="並行向量化的檔案數（預設 pipeline.embed_workers）")
+    parser.add_argument("--analyze-workers", type=int, help="並行分析的公司-季度數（預設 pipeline.analyze_workers）")
+    parser.add_argument("--status", action="store_true", help="顯示各階段的完成標記數量後結束")
+    return parser.parse_args()
+
+def main():
+    """主程式"""
+    setup_logger()
+    args = parse_args()
+    
+    if not settings.validate_required_settings():
+        logger.error("設定驗證失敗，程式結束")
+        sys.exit(1)
+    
+    vector_store = EnhancedMongoDBVectorStore()
+    if args.status:
+        state = PipelineState(vector_store.db[settings.pipeline_state_collection_name])
+        print(json.dumps(state.summary(), ensure_ascii=False, indent=2))
+        return
+    
+    analyzer = None
+    if "analyze" in args.stages:
+        from analyzers.rag_analyzer import RAGAnalyzer
+        analyzer = RAGAnalyzer()
+    
+    summarizer = None
+    if "embed" in args.stages and settings.get("chunk_summary.enabled", False):
+        from analyzers.chunk_summarizer import ChunkSummarizer
+        summarizer = ChunkSummarizer()
+    
+    runner = PipelineRunner(
+        vector_store, args.stages, force=args.force, restart=args.restart, analyzer=analyzer, summarizer=summarizer,
+        extract_workers=args.extract_workers, embed_workers=args.embed_workers, analyze_workers=args.analyze_workers
+    )
+    success = runner.run()
+    vector_store.bulk_writer.close()
+    metrics.finish_run("pipeline", stages=args.stages, success=success)
+    if not success:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
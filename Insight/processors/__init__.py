@@ -1,4 +1,14 @@
 from .pdf_processor import PDFProcessor
 from .ocr_processor import OCRProcessor
+from .chunker import (
+    ChunkingStrategy, PageChunkingStrategy, OCRMarkerChunkingStrategy,
+    FixedWindowChunkingStrategy, select_chunking_strategy, split_text
+)
+from .fact_extractor import extract_facts_from_tables
 
-__all__ = ['PDFProcessor', 'OCRProcessor']
\ No newline at end of file
+__all__ = [
+    'PDFProcessor', 'OCRProcessor',
+    'ChunkingStrategy', 'PageChunkingStrategy', 'OCRMarkerChunkingStrategy',
+    'FixedWindowChunkingStrategy', 'select_chunking_strategy', 'split_text',
+    'extract_facts_from_tables'
+]
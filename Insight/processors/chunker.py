@@ -0,0 +1,247 @@
+import re
+from typing import List, Dict
+from config.settings import settings
+from utils.logger import get_logger
+from utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+# OCR頁面標記與常規頁碼標記
+OCR_PAGE_PATTERN = r'\n={50}\n\[PAGES (\d+(?:-\d+)?)\]\n={50}\n'
+PAGE_NUMBER_PATTERN = re.compile(r'\[PAGE (\d+)\]')
+
+class ChunkingStrategy:
+    """分塊策略介面：以累計長度與片段列表建立分塊，避免重複複製字串"""
+    name = "base"
+    
+    def split(self, text: str, max_tokens: int) -> List[Dict]:
+        raise NotImplementedError
+    
+    @staticmethod
+    def _build_chunk(parts: List[str], pages: List, start_page, end_page, is_ocr: bool) -> Dict:
+        """合併片段為分塊"""
+        chunk_text = "".join(parts)
+        return {
+            'text': chunk_text.strip(),
+            'pages': pages,
+            'start_page': start_page,
+            'end_page': end_page,
+            'has_structured_data': "=== 表格" in chunk_text,
+            'is_ocr_content': is_ocr
+        }
+
+class PageChunkingStrategy(ChunkingStrategy):
+    """常規PDF文本：依 [PAGE n] 標記合併頁面，含表格的頁面允許較大的分塊"""
+    name = "page"
+    
+    def split(self, text: str, max_tokens: int) -> List[Dict]:
+        chunks = []
+        pages = text.split('[PAGE ')
+        
+        current_parts = []
+        current_length = 0
+        current_page_info = []
+        
+        for i, page in enumerate(pages):
+            if not page.strip():
+                continue
+            
+            if i > 0 or page.startswith('[PAGE'):
+                page_content = '[PAGE ' + page if not page.startswith('[PAGE') else page
+            else:
+                page_content = page
+            
+            # 提取頁碼信息（頁面內容通常以頁碼標記開頭）
+            page_match = PAGE_NUMBER_PATTERN.match(page_content) or PAGE_NUMBER_PATTERN.search(page_content)
+            page_num = page_match.group(1) if page_match else str(i)
+            
+            has_table = "=== 表格" in page_content or "結構化表格資料" in page_content
+            effective_max_tokens = max_tokens * 1.5 if has_table else max_tokens
+            
+            if current_length + len(page_content) > effective_max_tokens:
+                # 每個頁面片段都含非空白內容，累計長度大於0即代表分塊非空
+                if current_length:
+                    chunks.append(self._build_chunk(
+                        current_parts,
+                        current_page_info.copy(),
+                        current_page_info[0] if current_page_info else None,
+                        current_page_info[-1] if current_page_info else None,
+                        is_ocr=False
+                    ))
+                
+                current_parts = [page_content]
+                current_length = len(page_content)
+                current_page_info = [page_num]
+            else:
+                current_parts.append(page_content)
+                current_length += len(page_content)
+                current_page_info.append(page_num)
+        
+        # 添加最後一個塊
+        if current_length:
+            chunks.append(self._build_chunk(
+                current_parts,
+                current_page_info,
+                current_page_info[0] if current_page_info else None,
+                current_page_info[-1] if current_page_info else None,
+                is_ocr=False
+            ))
+        
+        logger.info(f"常規內容分割完成：{len(chunks)} 塊")
+        return chunks
+
+class OCRMarkerChunkingStrategy(ChunkingStrategy):
+    """OCR提取文本：依 [PAGES n-m] 批次標記合併頁面"""
+    name = "ocr_marker"
+    
+    def split(self, text: str, max_tokens: int) -> List[Dict]:
+        chunks = []
+        page_splits = re.split(OCR_PAGE_PATTERN, text)
+        
+        current_parts = []
+        current_length = 0
+        current_page_info = []
+        
+        i = 0
+        while i < len(page_splits):
+            if i == 0:
+                if page_splits[i].strip():
+                    content = page_splits[i].strip()
+                    if len(content) < max_tokens:
+                        current_parts = [content]
+                        current_length = len(content)
+                i += 1
+                continue
+            
+            page_info = page_splits[i]
+            i += 1
+            
+            if i < len(page_splits):
+                page_content = page_splits[i].strip()
+                
+                # 解析頁碼範圍
+                if '-' in page_info:
+                    start_page, end_page = page_info.split('-')
+                    pages_list = list(range(int(start_page), int(end_page) + 1))
+                else:
+                    pages_list = [int(page_info)]
+                
+                page_marker = f"[PAGES {page_info}]\n"
+                test_length = current_length + 1 + len(page_marker) + len(page_content)
+                
+                # 分塊內容皆為去除空白的文字或頁面標記，累計長度大於0即代表分塊非空
+                if test_length > max_tokens and current_length:
+                    chunks.append(self._build_ocr_chunk(current_parts, current_page_info.copy()))
+                    
+                    current_parts = [page_marker, page_content]
+                    current_length = len(page_marker) + len(page_content)
+                    current_page_info = pages_list.copy()
+                else:
+                    if current_length:
+                        current_parts.extend(["\n", page_marker, page_content])
+                        current_length += 1 + len(page_marker) + len(page_content)
+                    else:
+                        current_parts = [page_marker, page_content]
+                        current_length = len(page_marker) + len(page_content)
+                    current_page_info.extend(pages_list)
+            
+            i += 1
+        
+        # 添加最後一個塊
+        if current_length:
+            chunks.append(self._build_ocr_chunk(current_parts, current_page_info))
+        
+        logger.info(f"OCR內容分割完成：{len(chunks)} 塊")
+        return chunks
+    
+    def _build_ocr_chunk(self, parts: List[str], pages: List[int]) -> Dict:
+        return self._build_chunk(
+            parts,
+            pages,
+            str(pages[0]) if pages else None,
+            str(pages[-1]) if pages else None,
+            is_ocr=True
+        )
+
+class FixedWindowChunkingStrategy(ChunkingStrategy):
+    """固定長度視窗分割，作為其他策略失敗時的降級方案"""
+    name = "fixed_window"
+    
+    def __init__(self, is_ocr: bool = False):
+        self.is_ocr = is_ocr
+    
+    def split(self, text: str, max_tokens: int) -> List[Dict]:
+        chunks = []
+        
+        for i in range(0, len(text), max_tokens):
+            chunk_text = text[i:i + max_tokens]
+            
+            if chunk_text.strip():
+                chunks.append({
+                    'text': chunk_text.strip(),
+                    'pages': ['unknown'],
+                    'start_page': 'unknown',
+                    'end_page': 'unknown',
+                    'has_structured_data': False,
+                    'is_fallback': True,
+                    'is_ocr_content': self.is_ocr
+                })
+        
+        logger.info(f"降級分割完成：{len(chunks)} 塊")
+        return chunks
+
+def is_ocr_text(text: str) -> bool:
+    """檢查是否為OCR提取的文本"""
+    return "[PAGES " in text and "=" * 50 in text
+
+def select_chunking_strategy(text: str) -> ChunkingStrategy:
+    """依文本內容選擇分塊策略"""
+    return OCRMarkerChunkingStrategy() if is_ocr_text(text) else PageChunkingStrategy()
+
+def split_text(text: str, max_tokens: int = None, strategy: ChunkingStrategy = None) -> List[Dict]:
+    """分割文本，策略失敗時降級為固定長度分割"""
+    max_tokens = max_tokens or settings.get("vector_search.chunk_max_tokens", 6000)
+    strategy = strategy or select_chunking_strategy(text)
+    
+    with metrics.timer("chunking"):
+        try:
+            chunks = strategy.split(text, max_tokens)
+        except Exception as e:
+            logger.error(f"{strategy.name} 分割時發生錯誤: {e}")
+            try:
+                chunks = FixedWindowChunkingStrategy(is_ocr=is_ocr_text(text)).split(text, max_tokens)
+            except Exception as fallback_error:
+                logger.error(f"降級分割時發生錯誤: {fallback_error}")
+                chunks = []
+    
+    metrics.increment("chunks_created", len(chunks))
+    return chunks
+
+# 句子邊界：中日韓句末標點後、英文句點後的空白、換行
+SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[。！？!?；;])|(?<=\.)\s+|\n+')
+
+def split_sentences(text: str) -> List[str]:
+    """將文本切分為句子（去除空白句）"""
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY_PATTERN.split(text) if sentence and sentence.strip()]
+
+def sentence_windows(text: str, window_sentences: int = None, stride: int = None, max_windows: int = None, max_chars: int = None) -> List[str]:
+    """以滑動句子視窗切分分塊，讓向量模型能涵蓋整個分塊而不只是開頭；視窗過多時加大步幅"""
+    window_sentences = window_sentences or settings.get("vector_search.multi_vector.window_sentences", 3)
+    stride = stride or settings.get("vector_search.multi_vector.window_stride", 2)
+    max_windows = max_windows or settings.get("vector_search.multi_vector.max_windows", 64)
+    max_chars = max_chars or settings.get("vector_search.multi_vector.window_max_chars", 500)
+    
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    
+    last_start = max(len(sentences) - window_sentences, 0)
+    if max_windows > 1 and last_start // stride + 1 > max_windows:
+        stride = -(-last_start // (max_windows - 1))
+    
+    starts = list(range(0, last_start + 1, stride))
+    if starts[-1] != last_start:
+        # 確保最後幾句也被涵蓋
+        starts.append(last_start)
+    
+    return [" ".join(sentences[start:start + window_sentences])[:max_chars] for start in starts[:max_windows]]
@@ -0,0 +1,173 @@
+import re
+import pandas as pd
+from typing import List, Dict, Optional, Tuple
+from config.settings import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 預設的財務指標別名（比對前會轉為小寫並移除註腳、標點）
+DEFAULT_METRIC_ALIASES = {
+    "revenue": ["revenue", "revenues", "total revenue", "total revenues", "net revenue", "net revenues",
+                "營業收入", "營業收入合計", "營收", "매출액", "영업수익"],
+    "operating_income": ["operating income", "income from operations", "operating profit", "operating income (loss)",
+                         "營業利益", "營業淨利", "영업이익"],
+    "net_income": ["net income", "net profit", "net income (loss)", "本期淨利", "淨利", "당기순이익"],
+    "adjusted_ebitda": ["adjusted ebitda", "ebitda"],
+}
+
+# 數值單位（倍數）與幣別的辨識規則
+SCALE_PATTERNS = [
+    (re.compile(r"in billions|billions|十億", re.IGNORECASE), "billions", 1e9),
+    (re.compile(r"억원|億", re.IGNORECASE), "100 millions", 1e8),
+    (re.compile(r"in millions|millions|百萬|백만", re.IGNORECASE), "millions", 1e6),
+    (re.compile(r"in thousands|thousands|千元|천원", re.IGNORECASE), "thousands", 1e3),
+]
+CURRENCY_PATTERNS = [
+    (re.compile(r"NT\$|新台幣|TWD"), "TWD"),
+    (re.compile(r"₩|KRW|원"), "KRW"),
+    (re.compile(r"US\$|USD|\$"), "USD"),
+]
+
+NUMBER_PATTERN = re.compile(r"^(\()?\s*(-|−)?\s*(?:US\$|NT\$|\$|₩|€|£|¥)?\s*(-|−)?\s*(\d[\d,]*(?:\.\d+)?|\.\d+)\s*(\))?\s*(%)?$")
+PERIOD_PATTERNS = [
+    re.compile(r"\bQ([1-4])\s*'?\s*(\d{4}|\d{2})\b", re.IGNORECASE),
+    re.compile(r"\b([1-4])Q\s*'?\s*(\d{4}|\d{2})\b", re.IGNORECASE),
+]
+YEAR_FIRST_PATTERNS = [
+    re.compile(r"(\d{4})\s*'?\s*Q([1-4])", re.IGNORECASE),
+    re.compile(r"(\d{4})\s*年\s*第?\s*([1-4一二三四])\s*季"),
+    re.compile(r"(\d{4})\s*년\s*([1-4])\s*분기"),
+]
+CHINESE_DIGITS = {"一": "1", "二": "2", "三": "3", "四": "4"}
+
+def normalize_label(label: str) -> str:
+    """標準化列名稱：移除註腳標記與多餘空白並轉為小寫"""
+    text = re.sub(r"\(\s*\d+\s*\)|\[\s*\d+\s*\]|\*+", "", str(label))
+    text = re.sub(r"[:：]", "", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def build_alias_lookup(metric_aliases: Dict[str, List[str]] = None) -> Dict[str, str]:
+    """建立 標準化別名 -> 指標名稱 的對照表"""
+    metric_aliases = metric_aliases or settings.get("financial_facts.metric_aliases", DEFAULT_METRIC_ALIASES)
+    lookup = {}
+    for metric, aliases in metric_aliases.items():
+        for alias in aliases:
+            lookup[normalize_label(alias)] = metric
+    return lookup
+
+def parse_numeric_cell(value) -> Tuple[Optional[float], bool]:
+    """解析表格中的數值，返回 (數值, 是否為百分比)；括號與負號表示負數"""
+    text = str(value).strip().replace("\u00a0", " ")
+    if not text:
+        return None, False
+    
+    match = NUMBER_PATTERN.match(text)
+    if not match:
+        return None, False
+    
+    open_paren, sign_before, sign_after, digits, close_paren, percent = match.groups()
+    if bool(open_paren) != bool(close_paren):
+        return None, False
+    
+    number = float(digits.replace(",", ""))
+    if open_paren or sign_before or sign_after:
+        number = -number
+    return number, bool(percent)
+
+def parse_period(header: str) -> Optional[str]:
+    """從欄位標題解析期間（例如 "Q3 2024"、"3Q24"、"2024年第三季"），返回 "2024_Q3" 格式"""
+    text = str(header)
+    
+    for pattern in YEAR_FIRST_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            quarter = CHINESE_DIGITS.get(match.group(2), match.group(2))
+            return f"{match.group(1)}_Q{quarter}"
+    
+    for pattern in PERIOD_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            year = match.group(2)
+            if len(year) == 2:
+                year = f"20{year}"
+            return f"{year}_Q{match.group(1)}"
+    
+    return None
+
+def detect_scale_and_currency(text: str) -> Tuple[Optional[str], float, Optional[str]]:
+    """從表格標題文字辨識數值單位與幣別"""
+    unit, scale = None, 1.0
+    for pattern, scale_name, factor in SCALE_PATTERNS:
+        if pattern.search(text):
+            unit, scale = scale_name, factor
+            break
+    
+    currency = None
+    for pattern, currency_name in CURRENCY_PATTERNS:
+        if pattern.search(text):
+            currency = currency_name
+            break
+    
+    return unit, scale, currency
+
+def extract_facts_from_table(df: pd.DataFrame, page: int, alias_lookup: Dict[str, str]) -> List[Dict]:
+    """從單一表格提取財務數據：第一欄為列名稱，其餘欄位標題為期間"""
+    if df is None or df.empty or len(df.columns) < 2:
+        return []
+    
+    headers = [str(col).strip() for col in df.columns]
+    first_column = [str(value).strip() for value in df.iloc[:, 0].tolist()]
+    unit, scale, currency = detect_scale_and_currency(" ".join(headers + first_column[:3]))
+    
+    facts = []
+    for row in df.itertuples(index=False):
+        row_label = str(row[0]).strip()
+        if not row_label:
+            continue
+        
+        metric = alias_lookup.get(normalize_label(row_label))
+        for column_index in range(1, len(headers)):
+            value, is_percent = parse_numeric_cell(row[column_index])
+            if value is None:
+                continue
+            
+            facts.append({
+                "page": page,
+                "row_label": row_label,
+                "column_header": headers[column_index],
+                "period": parse_period(headers[column_index]),
+                "metric": metric,
+                "value": value,
+                "unit": "%" if is_percent else unit,
+                "scale": 1.0 if is_percent else scale,
+                "currency": None if is_percent else currency
+            })
+    
+    return facts
+
+def extract_facts_from_tables(tables: List[Dict], metric_aliases: Dict[str, List[str]] = None) -> List[Dict]:
+    """從 PDFProcessor.extract_tables_from_pdf 的結果提取所有財務數據"""
+    alias_lookup = build_alias_lookup(metric_aliases)
+    facts = []
+    
+    for table_index, table in enumerate(tables or []):
+        try:
+            table_facts = extract_facts_from_table(table.get("dataframe"), table.get("page"), alias_lookup)
+            for fact in table_facts:
+                fact["table_index"] = table_index
+            facts.extend(table_facts)
+        except Exception as e:
+            logger.warning(f"解析第 {table.get('page')} 頁表格數據時發生錯誤: {e}")
+    
+    return facts
+
+def format_fact_value(fact: Dict) -> str:
+    """格式化單一數據供提示使用"""
+    value = fact["value"]
+    number = f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+    if fact.get("unit") == "%":
+        return f"{number}%"
+    
+    suffix = " ".join(part for part in (fact.get("currency"), fact.get("unit")) if part)
+    return f"{number} {suffix}".strip()
@@ -7,13 +7,17 @@ from typing import List, Dict, Tuple
 from openai import OpenAI
 from config.settings import settings
 from utils.logger import get_logger
+from utils.metrics import metrics
 
 logger = get_logger(__name__)
 
+# 批次重試後仍失敗時插入文字中的標記；含此標記的結果不完整，不可寫入提取結果快取
+OCR_ERROR_MARKER = "[ERROR: 無法處理頁面"
+
 class OCRProcessor:
     """OCR圖像處理器"""
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.client = OpenAI(api_key=settings.openai_api_key, base_url=settings.get("openai_settings.base_url"))
         self.current_images = []
     
     def read_pdf_with_ocr(self, file_path: str, max_pages: int = None) -> Tuple[str, int]:
@@ -58,7 +62,8 @@ class OCRProcessor:
         """將PDF轉換為圖像列表"""
         try:
             logger.info(f"將PDF轉換為圖像: {pdf_path}")
-            pdf_document = fitz.open(pdf_path)
+            with metrics.timer("pdf_open"):
+                pdf_document = fitz.open(pdf_path)
             images = []
             
             total_pages = len(pdf_document)
@@ -69,19 +74,20 @@ class OCRProcessor:
             
             for page_num in range(pages_to_process):
                 try:
-                    page = pdf_document[page_num]
-                    # 將頁面轉換為圖像 (高DPI以獲得更好的OCR效果)
-                    mat = fitz.Matrix(dpi/72, dpi/72)
-                    pix = page.get_pixmap(matrix=mat)
-                    img_data = pix.tobytes(image_format)
-                    
-                    # 轉換為PIL Image
-                    pil_image = Image.open(io.BytesIO(img_data))
-                    
-                    # 轉換為base64
-                    buffered = io.BytesIO()
-                    pil_image.save(buffered, format=image_format.upper())
-                    img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+                    with metrics.timer("ocr_render"):
+                        page = pdf_document[page_num]
+                        # 將頁面轉換為圖像 (高DPI以獲得更好的OCR效果)
+                        mat = fitz.Matrix(dpi/72, dpi/72)
+                        pix = page.get_pixmap(matrix=mat)
+                        img_data = pix.tobytes(image_format)
+                        
+                        # 轉換為PIL Image
+                        pil_image = Image.open(io.BytesIO(img_data))
+                        
+                        # 轉換為base64
+                        buffered = io.BytesIO()
+                        pil_image.save(buffered, format=image_format.upper())
+                        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
                     
                     images.append({
                         'page': page_num + 1,
@@ -96,6 +102,7 @@ class OCRProcessor:
                     continue
             
             pdf_document.close()
+            metrics.increment("ocr_pages_rendered", len(images))
             logger.info(f"成功轉換 {len(images)} 頁為圖像")
             return images
             
@@ -161,13 +168,15 @@ class OCRProcessor:
                         })
                     
                     # 調用GPT-4 Vision
-                    response = self.client.chat.completions.create(
-                        model=settings.vision_model,
-                        messages=messages,
-                        max_tokens=4000,
-                        temperature=0.1,
-                        timeout=settings.get("openai_settings.timeout", 90)
-                    )
+                    metrics.increment("ocr_requests")
+                    with metrics.timer("ocr_call"):
+                        response = self.client.chat.completions.create(
+                            model=settings.vision_model,
+                            messages=messages,
+                            max_tokens=4000,
+                            temperature=0.1,
+                            timeout=settings.get("openai_settings.timeout", 90)
+                        )
                     
                     extracted_text = response.choices[0].message.content
                     
@@ -196,7 +205,7 @@ class OCRProcessor:
                     else:
                         # 最後一次嘗試失敗，添加錯誤標記但繼續處理
                         error_pages = [img['page'] for img in batch]
-                        error_marker = f"\n{'='*50}\n[ERROR: 無法處理頁面 {error_pages}]\n{'='*50}\n[無法識別區域]\n"
+                        error_marker = f"\n{'='*50}\n{OCR_ERROR_MARKER} {error_pages}]\n{'='*50}\n[無法識別區域]\n"
                         all_text_parts.append(error_marker)
             
             # 避免API限制
@@ -1,8 +1,10 @@
 import fitz  # PyMuPDF
+import time
 import pandas as pd
 from typing import List, Dict, Tuple
 from config.settings import settings
 from utils.logger import get_logger
+from utils.metrics import metrics
 
 logger = get_logger(__name__)
 
@@ -16,7 +18,8 @@ class PDFProcessor:
         """使用 PyMuPDF 進行文字提取"""
         try:
             logger.info(f"使用 PyMuPDF 文字提取讀取 PDF: {file_path}")
-            pdf_document = fitz.open(file_path)
+            with metrics.timer("pdf_open"):
+                pdf_document = fitz.open(file_path)
             
             total_pages = len(pdf_document)
             max_pages_setting = settings.get("file_processing.max_pages_per_pdf", 50)
@@ -27,23 +30,25 @@ class PDFProcessor:
             # 提取文本內容
             all_text_parts = []
             
-            for page_num in range(pages_to_read):
-                try:
-                    page = pdf_document[page_num]
-                    
-                    # 使用更好的文本提取方法
-                    text_dict = page.get_text("dict")
-                    page_text = self._extract_text_from_dict(text_dict)
+            with metrics.timer("text_extraction"):
+                for page_num in range(pages_to_read):
+                    try:
+                        page = pdf_document[page_num]
+                        
+                        # 使用更好的文本提取方法
+                        text_dict = page.get_text("dict")
+                        page_text = self._extract_text_from_dict(text_dict)
+                        
+                        # 添加清晰的頁碼標記
+                        page_marker = f"\n{'='*50}\n[PAGE {page_num + 1}]\n{'='*50}\n"
+                        all_text_parts.append(page_marker + page_text)
                     
-                    # 添加清晰的頁碼標記
-                    page_marker = f"\n{'='*50}\n[PAGE {page_num + 1}]\n{'='*50}\n"
-                    all_text_parts.append(page_marker + page_text)
-                
-                except Exception as page_err:
-                    logger.warning(f"處理頁面 {page_num + 1} 時發生錯誤: {page_err}")
-                    continue
+                    except Exception as page_err:
+                        logger.warning(f"處理頁面 {page_num + 1} 時發生錯誤: {page_err}")
+                        continue
             
             pdf_document.close()
+            metrics.increment("pages_extracted", pages_to_read)
             
             # 合併文本
             combined_text = "\n".join(all_text_parts)
@@ -80,6 +85,17 @@ class PDFProcessor:
             logger.error(f"讀取 {file_path} 時發生錯誤: {e}")
             return "", 0
     
+    @staticmethod
+    def read_first_page(file_path: str) -> Tuple[str, int]:
+        """讀取首頁文字與總頁數（用於比對重複檔案）"""
+        pdf_document = fitz.open(file_path)
+        try:
+            if len(pdf_document) == 0:
+                return "", 0
+            return pdf_document[0].get_text(), len(pdf_document)
+        finally:
+            pdf_document.close()
+    
     def _extract_text_from_dict(self, text_dict: Dict) -> str:
         """從 PyMuPDF 的字典格式中提取文本"""
         try:
@@ -104,8 +120,10 @@ class PDFProcessor:
         """使用 PyMuPDF 從 PDF 中提取表格"""
         try:
             logger.info(f"從 PDF 提取表格: {pdf_path}")
-            pdf_document = fitz.open(pdf_path)
+            with metrics.timer("pdf_open"):
+                pdf_document = fitz.open(pdf_path)
             tables = []
+            table_start = time.perf_counter()
             
             for page_num, page in enumerate(pdf_document):
                 try:
@@ -152,6 +170,8 @@ class PDFProcessor:
                     continue
             
             pdf_document.close()
+            metrics.observe("find_tables", time.perf_counter() - table_start)
+            metrics.increment("tables_extracted", len(tables))
             logger.info(f"從 {pdf_path} 中提取了 {len(tables)} 個表格")
             return tables
         
@@ -185,7 +205,8 @@ class PDFProcessor:
     def extract_images_info(self, pdf_path: str) -> List[Dict]:
         """提取 PDF 中的圖像資訊"""
         try:
-            pdf_document = fitz.open(pdf_path)
+            with metrics.timer("pdf_open"):
+                pdf_document = fitz.open(pdf_path)
             images = []
             
             for page_num, page in enumerate(pdf_document):
@@ -0,0 +1,276 @@
+"""
+常駐財報查詢服務
+
+啟動時載入一次向量模型，並在程序中保留查詢向量快取、候選塊向量矩陣與語意答案快取，
+以 HTTP 回答臨時的（公司, 季度, 問題）查詢：
+
+    POST /query   {"company": "Playtika", "quarter": "2025_Q1", "question": "...", "keywords_en": "Revenue, Income"}
+    GET  /health  服務狀態、並行數與快取統計
+    GET  /metrics 各階段耗時與計數（Prometheus 文字格式）
+
+同時執行的查詢數以 query_service.max_concurrency 限制，等候超過 queue_timeout_seconds 時返回 503；
+每個回應附帶排隊、檢索、LLM 與總耗時（毫秒）。
+
+執行方式（於 Insight 目錄）：
+    python query_service.py --port 8765 --warm
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+from config.settings import settings
+from utils.logger import setup_logger, get_logger
+from utils.metrics import metrics
+from models.vector_store import EnhancedMongoDBVectorStore
+from analyzers.rag_analyzer import RAGAnalyzer
+
+logger = get_logger(__name__)
+
+# RAG 流程無法產生答案時返回的固定訊息
+FAILED_ANSWERS = ("無法找到相關資訊", "處理查詢時發生錯誤")
+
+class QueryService:
+    """包裝向量資料庫與 RAG 分析器的查詢服務：模型與快取常駐於程序中，並限制同時執行的查詢數"""
+    def __init__(self, vector_store=None, analyzer=None, max_concurrency: int = None, queue_timeout: float = None):
+        self.vector_store = vector_store if vector_store is not None else EnhancedMongoDBVectorStore()
+        self.analyzer = analyzer if analyzer is not None else RAGAnalyzer()
+        
+        self.max_concurrency = max_concurrency or settings.get("query_service.max_concurrency", 4)
+        self.queue_timeout = settings.get("query_service.queue_timeout_seconds", 30) if queue_timeout is None else queue_timeout
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.stats = {"requests": 0, "completed": 0, "rejected": 0, "failed": 0, "in_flight": 0}
+    
+    def _count(self, key: str, delta: int = 1):
+        with self._lock:
+            self.stats[key] += delta
+    
+    def warm_up(self) -> Dict[str, int]:
+        """預先載入所有公司-季度的候選塊，讓第一個查詢不需讀取資料庫"""
+        start = time.perf_counter()
+        self.vector_store._encode_queries(["warm up"])
+        
+        company_quarters, candidates = 0, 0
+        for source in self.vector_store.get_company_quarter_sources():
+            candidates += self.vector_store.warm_candidate_cache(source["company"], source["quarter"])
+            company_quarters += 1
+        
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"預先載入 {company_quarters} 個公司-季度的 {candidates} 個候選塊，耗時 {elapsed_ms} ms")
+        return {"company_quarters": company_quarters, "candidates": candidates, "elapsed_ms": elapsed_ms}
+    
+    def answer(self, company: str, quarter: str, question: str, keywords_en: str = "") -> Tuple[int, Dict]:
+        """回答單一查詢，返回 (HTTP 狀態碼, 回應內容)"""
+        request_start = time.perf_counter()
+        self._count("requests")
+        
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            logger.warning(f"查詢服務忙碌（{self.max_concurrency} 個查詢執行中），拒絕 {company} - {quarter} 的查詢")
+            return 503, {"error": "服務忙碌，請稍後再試", "max_concurrency": self.max_concurrency}
+        
+        queue_ms = round((time.perf_counter() - request_start) * 1000, 2)
+        self._count("in_flight")
+        try:
+            self.vector_store.last_search_stats = {}
+            answer = self.analyzer.answer_with_cache(question, self.vector_store, company, quarter, keywords_en or "")
+        except Exception as e:
+            total_ms = round((time.perf_counter() - request_start) * 1000, 2)
+            self._count("failed")
+            logger.error(f"查詢 {company} - {quarter} 時發生錯誤: {e}")
+            return 500, {
+                "error": f"處理查詢時發生錯誤: {e}",
+                "timing_ms": {
+                    "queue": queue_ms,
+                    "retrieval": self.vector_store.last_search_stats.get("latency_ms"),
+                    "llm": self.analyzer.last_llm_ms,
+                    "total": total_ms
+                }
+            }
+        finally:
+            self._count("in_flight", -1)
+            self._slots.release()
+        
+        provenance = self.analyzer.last_answer_provenance or {"source": "retrieval"}
+        search_stats = self.vector_store.last_search_stats
+        total_ms = round((time.perf_counter() - request_start) * 1000, 2)
+        
+        failed = answer in FAILED_ANSWERS
+        self._count("failed" if failed else "completed")
+        logger.info(f"查詢 {company} - {quarter} 完成（來源 {provenance.get('source')}），耗時 {total_ms} ms")
+        
+        return (502 if failed else 200), {
+            "company": company,
+            "quarter": quarter,
+            "question": question,
+            "answer": answer,
+            "source": provenance.get("source"),
+            "timing_ms": {
+                "queue": queue_ms,
+                "retrieval": search_stats.get("latency_ms"),
+                "llm": self.analyzer.last_llm_ms,
+                "total": total_ms
+            },
+            "retrieval": search_stats,
+            "usage": self.analyzer.last_usage,
+            "prompt_chars": self.analyzer.last_prompt_chars
+        }
+    
+    def health(self) -> Dict:
+        """服務狀態與快取統計"""
+        with self._lock:
+            stats = dict(self.stats)
+        
+        answer_cache = self.analyzer.answer_cache
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "max_concurrency": self.max_concurrency,
+            "requests": stats,
+            "candidate_cache": dict(self.vector_store.candidate_cache_stats),
+            "answer_cache": {"hits": answer_cache.hits, "misses": answer_cache.misses} if answer_cache else None,
+            "llm_usage": dict(self.analyzer.usage_stats)
+        }
+
+class QueryServer:
+    """以 ThreadingHTTPServer 提供查詢服務的 HTTP 端點（每個連線一個執行緒，實際並行數由 QueryService 限制）"""
+    def __init__(self, service: QueryService, host: str = None, port: int = None):
+        self.service = service
+        self.max_body_bytes = settings.get("query_service.max_body_bytes", 65536)
+        host = settings.get("query_service.host", "127.0.0.1") if host is None else host
+        port = settings.get("query_service.port", 8765) if port is None else port
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+    
+    def start(self):
+        """在背景執行緒啟動服務"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def serve_forever(self):
+        """在目前的執行緒執行服務直到中斷"""
+        self._server.serve_forever()
+    
+    def stop(self):
+        """停止服務"""
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                if self.path.rstrip("/") == "/health":
+                    self._send_json(200, server.service.health())
+                elif self.path.rstrip("/") == "/metrics":
+                    body = metrics.prometheus_text("query_service").encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+            
+            def do_POST(self):
+                if self.path.rstrip("/") != "/query":
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+                    return
+                
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    self._send_json(400, {"error": "Content-Length 不是有效的長度"})
+                    return
+                if length > server.max_body_bytes:
+                    self._send_json(413, {"error": f"請求內容超過 {server.max_body_bytes} bytes"})
+                    return
+                
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send_json(400, {"error": "請求內容不是有效的 JSON"})
+                    return
+                if not isinstance(body, dict):
+                    self._send_json(400, {"error": "請求內容必須是 JSON 物件"})
+                    return
+                
+                missing = [field for field in ("company", "quarter", "question") if not body.get(field)]
+                if missing:
+                    self._send_json(400, {"error": f"缺少欄位: {', '.join(missing)}"})
+                    return
+                invalid = [field for field in ("company", "quarter", "question", "keywords_en") if body.get(field) is not None and not isinstance(body[field], str)]
+                if invalid:
+                    self._send_json(400, {"error": f"欄位必須是字串: {', '.join(invalid)}"})
+                    return
+                
+                status, payload = server.service.answer(body["company"], body["quarter"], body["question"], body.get("keywords_en", ""))
+                self._send_json(status, payload)
+            
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+        
+        return Handler
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="常駐財報查詢服務")
+    parser.add_argument("--host", default=None, help="監聽位址（預設 query_service.host）")
+    parser.add_argument("--port", type=int, default=None, help="監聽埠號（預設 query_service.port）")
+    parser.add_argument("--max-concurrency", type=int, default=None, help="同時執行的查詢數上限（預設 query_service.max_concurrency）")
+    parser.add_argument("--warm", action="store_true", help="啟動時預先載入所有公司-季度的候選塊")
+    return parser.parse_args()
+
+def main():
+    """主程式"""
+    setup_logger()
+    args = parse_args()
+    
+    if not settings.validate_required_settings():
+        logger.error("設定驗證失敗，程式結束")
+        return
+    
+    service = QueryService(max_concurrency=args.max_concurrency)
+    if args.warm or settings.get("query_service.warm_on_start", False):
+        service.warm_up()
+    
+    server = QueryServer(service, args.host, args.port)
+    logger.info(f"查詢服務啟動於 {server.url}（同時查詢上限 {service.max_concurrency}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("查詢服務停止")
+    finally:
+        server.stop()
+        service.vector_store.bulk_writer.close()
+
+if __name__ == "__main__":
+    main()
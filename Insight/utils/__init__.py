@@ -2,12 +2,12 @@ from .logger import setup_logger, get_logger
 from .file_utils import (
     is_annual_report, is_quarterly_report, extract_year_and_quarter,
     extract_company_name, find_report_folders, find_pdf_files,
-    create_output_directory, generate_excel_filename
+    compute_file_sha256, create_output_directory, generate_excel_filename
 )
 
 __all__ = [
     'setup_logger', 'get_logger',
     'is_annual_report', 'is_quarterly_report', 'extract_year_and_quarter',
     'extract_company_name', 'find_report_folders', 'find_pdf_files',
-    'create_output_directory', 'generate_excel_filename'
+    'compute_file_sha256', 'create_output_directory', 'generate_excel_filename'
 ]
\ No newline at end of file
@@ -0,0 +1,184 @@
+import os
+import re
+import unicodedata
+from typing import Callable, Dict, List, Tuple
+from config.settings import settings
+from utils.file_utils import extract_year_and_quarter
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def normalize_file_name(file_name: str) -> str:
+    """正規化檔名以比對相近檔名：全形轉半形、忽略大小寫、空白與底線差異（例如 "2024Q2季報 .pdf" 與 "2024Q2季報.pdf"）"""
+    stem, extension = os.path.splitext(unicodedata.normalize("NFKC", file_name))
+    stem = re.sub(r"[\s_\-]+", "", stem.lower())
+    return f"{stem}{extension.strip().lower()}"
+
+def normalize_text(text: str) -> str:
+    """正規化首頁文字：全形轉半形、忽略大小寫與空白"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text or "").lower())
+
+def shingles(text: str, size: int = 5) -> set:
+    """字元 n-gram 集合（中英文混合的文字不需斷詞）"""
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[index:index + size] for index in range(len(text) - size + 1)}
+
+def jaccard(left: set, right: set) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+def read_first_page(file_path: str) -> Tuple[str, int]:
+    """讀取 PDF 首頁文字與總頁數"""
+    from processors.pdf_processor import PDFProcessor
+    return PDFProcessor.read_first_page(file_path)
+
+class DuplicateDetector:
+    """找出同一公司資料夾中重複的財報檔案
+
+    - 內容相同（SHA-256 相同）：重複
+    - 內容不同但檔名的年份與季度相同、總頁數相同且首頁文字的 n-gram 相似度達 near_duplicate_threshold：近似重複（例如重新存檔的同一份報告）
+      不同期間的季報首頁版型幾乎相同，因此只比對同一期間的檔案
+    每組重複檔案保留一個代表檔案（已向量化者優先，其次為檔名沒有多餘空白者，再依檔名排序），其餘檔案連結至代表檔案。
+    不同公司資料夾中的相同檔案只記錄警告，仍各自處理。
+    """
+    def __init__(self, read_first_page_func: Callable[[str], Tuple[str, int]] = None):
+        self.read_first_page = read_first_page_func or read_first_page
+        self.near_duplicates = settings.get("duplicate_detection.near_duplicates", True)
+        self.threshold = settings.get("duplicate_detection.near_duplicate_threshold", 0.9)
+        self.first_page_chars = settings.get("duplicate_detection.first_page_chars", 4000)
+        self._first_pages = {}
+    
+    def _first_page(self, item: Dict) -> Tuple[set, int]:
+        """首頁文字的 n-gram 集合與總頁數（依 SHA-256 快取）"""
+        if item["sha256"] not in self._first_pages:
+            try:
+                text, page_count = self.read_first_page(item["path"])
+            except Exception as e:
+                logger.warning(f"讀取 {item['file_name']} 首頁時發生錯誤: {e}")
+                text, page_count = "", 0
+            self._first_pages[item["sha256"]] = (shingles(normalize_text(text)[:self.first_page_chars]), page_count)
+        return self._first_pages[item["sha256"]]
+    
+    def page_count(self, item: Dict) -> int:
+        return self._first_page(item)[1]
+    
+    @staticmethod
+    def _canonical_order(item: Dict):
+        file_name = item["file_name"]
+        stem = os.path.splitext(file_name)[0]
+        untidy = stem != stem.strip() or "  " in stem
+        return (not item.get("indexed", False), untidy, len(file_name), file_name)
+    
+    def find_duplicates(self, files: List[Dict]) -> Dict[str, Dict]:
+        """返回 {重複檔案鍵: {"duplicate_of": 代表檔案鍵, "reason": "content" 或 "first_page", "similarity": 相似度}}
+
+        files 的每個項目需包含 key、path、company_name、file_name、sha256（可選 indexed）。
+        """
+        duplicates = {}
+        by_company = {}
+        for item in files:
+            by_company.setdefault(item["company_name"], []).append(item)
+        
+        for company_name, items in by_company.items():
+            items = sorted(items, key=self._canonical_order)
+            
+            # 內容相同的檔案
+            canonical_by_sha = {}
+            for item in items:
+                canonical = canonical_by_sha.setdefault(item["sha256"], item)
+                if canonical is not item:
+                    duplicates[item["key"]] = {"duplicate_of": canonical["key"], "reason": "content", "similarity": 1.0}
+            
+            # 首頁文字近似且頁數相同的檔案
+            if self.near_duplicates:
+                representatives = list(canonical_by_sha.values())
+                for index, item in enumerate(representatives):
+                    # 兩者都已向量化時不再比對，避免每次執行都讀取所有檔案的首頁
+                    if item["key"] in duplicates or item.get("indexed", False):
+                        continue
+                    item_shingles, item_pages = self._first_page(item)
+                    item_period = extract_year_and_quarter(item["file_name"])
+                    for canonical in representatives[:index]:
+                        if canonical["key"] in duplicates or extract_year_and_quarter(canonical["file_name"]) != item_period:
+                            continue
+                        canonical_shingles, canonical_pages = self._first_page(canonical)
+                        if not item_pages or item_pages != canonical_pages:
+                            continue
+                        similarity = jaccard(item_shingles, canonical_shingles)
+                        if similarity >= self.threshold:
+                            duplicates[item["key"]] = {"duplicate_of": canonical["key"], "reason": "first_page", "similarity": round(similarity, 3)}
+                            break
+            
+            # 檔名相近但內容不同：不視為重複，只提醒確認
+            names = {}
+            for item in items:
+                if item["key"] in duplicates:
+                    continue
+                other = names.setdefault(normalize_file_name(item["file_name"]), item)
+                if other is not item:
+                    logger.warning(f"{company_name} 的 {other['file_name']!r} 與 {item['file_name']!r} 檔名相近但內容不同，兩者皆會處理")
+        
+        self._warn_cross_company(files)
+        return duplicates
+    
+    @staticmethod
+    def _warn_cross_company(files: List[Dict]):
+        companies_by_sha = {}
+        for item in files:
+            companies_by_sha.setdefault(item["sha256"], set()).add(item["company_name"])
+        for sha256, companies in companies_by_sha.items():
+            if len(companies) > 1:
+                logger.warning(f"相同內容的檔案出現在多個公司資料夾（{', '.join(sorted(companies))}），各自處理")
+
+def link_duplicates(vector_store, files: List[Dict], detector: DuplicateDetector = None) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """找出重複檔案並在檔案清單中連結至代表檔案，返回 (需要處理的檔案, 重複檔案)
+
+    重複檔案不提取、不向量化也不分析；先前已單獨處理過的重複檔案會移除其文檔塊。
+    """
+    if not settings.get("duplicate_detection.enabled", True) or not files:
+        return files, {}
+    
+    detector = detector or DuplicateDetector()
+    duplicates = detector.find_duplicates(files)
+    if not duplicates:
+        return files, {}
+    
+    items_by_key = {item["key"]: item for item in files}
+    manifest = vector_store.get_file_manifest()
+    for key, duplicate in duplicates.items():
+        item = items_by_key[key]
+        canonical = items_by_key[duplicate["duplicate_of"]]
+        duplicate["page_count"] = (manifest.get(canonical["key"]) or {}).get("page_count") or detector.page_count(item)
+        duplicate["chunk_count"] = (manifest.get(canonical["key"]) or {}).get("chunk_count")
+        duplicate["size"] = os.path.getsize(item["path"])
+        vector_store.record_duplicate_file(item["path"], item["company_name"], item["sha256"], canonical["file_name"], duplicate["reason"])
+        logger.info(
+            f"重複檔案: {item['company_name']} - {item['file_name']!r} 連結至 {canonical['file_name']!r}"
+            f"（{'內容相同' if duplicate['reason'] == 'content' else '首頁相似度 ' + str(duplicate['similarity'])}）"
+        )
+    
+    report = skipped_cost_report(duplicates, items_by_key, vector_store)
+    logger.info(
+        f"略過 {report['files']} 個重複檔案：{report['pages']} 頁、{report['bytes'] / 1024 / 1024:.1f} MB、"
+        f"約 {report['chunks']} 個文檔塊，其中 OCR {report['ocr_pages']} 頁（約 {report['ocr_requests']} 次視覺模型請求）"
+    )
+    return [item for item in files if item["key"] not in duplicates], duplicates
+
+def skipped_cost_report(duplicates: Dict[str, Dict], items_by_key: Dict[str, Dict], vector_store) -> Dict[str, int]:
+    """估算略過重複檔案所節省的處理量：檔案數、頁數、位元組、文檔塊與 OCR 頁數"""
+    batch_size = settings.get("ocr_settings.batch_size", 2)
+    report = {"files": 0, "pages": 0, "bytes": 0, "chunks": 0, "ocr_pages": 0, "ocr_requests": 0}
+    for key, duplicate in duplicates.items():
+        item = items_by_key[key]
+        pages = duplicate.get("page_count") or 0
+        report["files"] += 1
+        report["pages"] += pages
+        report["bytes"] += duplicate.get("size") or 0
+        report["chunks"] += duplicate.get("chunk_count") or 0
+        if vector_store.should_use_ocr_processing(item["file_name"], item["company_name"]):
+            ocr_pages = min(pages, settings.get("file_processing.max_pages_per_pdf", 50))
+            report["ocr_pages"] += ocr_pages
+            report["ocr_requests"] += -(-ocr_pages // batch_size)
+    return report
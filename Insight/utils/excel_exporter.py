@@ -0,0 +1,190 @@
+import os
+import json
+from typing import Dict, List, Optional, Tuple
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, NamedStyle
+from config.settings import settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+HEADER_STYLE = "insight_header"
+BODY_STYLE = "insight_body"
+JOURNAL_SUFFIX = ".partial.jsonl"
+
+def _create_named_styles() -> List[NamedStyle]:
+    """建立表頭與內容共用的命名樣式"""
+    header_style = NamedStyle(name=HEADER_STYLE)
+    header_style.font = Font(bold=True, size=12)
+    header_style.fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+    header_style.alignment = Alignment(horizontal='center', vertical='center')
+    
+    body_style = NamedStyle(name=BODY_STYLE)
+    body_style.alignment = Alignment(wrapText=True, vertical='top')
+    
+    return [header_style, body_style]
+
+class StreamingExcelExporter:
+    """串流Excel輸出：每完成一個公司-季度即寫入記錄檔，中斷後可由記錄檔續跑，結束時以 write_only 工作簿輸出"""
+    def __init__(self, output_path: str, checkpoint_interval: int = None, resume: bool = True):
+        self.output_path = output_path
+        self.checkpoint_interval = checkpoint_interval or settings.get("excel_output.checkpoint_interval", 5)
+        
+        base_path, _ = os.path.splitext(output_path)
+        self.journal_path = f"{base_path}{JOURNAL_SUFFIX}"
+        
+        self.headers = settings.get("excel_output.headers", ["年份_季度", "公司概況", "商業策略", "風險"])
+        self.column_widths = settings.get("excel_output.column_widths", {"A": 15, "B": 70, "C": 70, "D": 70})
+        self.row_height = settings.get("excel_output.row_height", 200)
+        self.analysis_types = settings.get("analysis_settings.analysis_types", ["company_overview", "business_strategy", "risks"])
+        
+        # 以公司分組的資料列（依首次出現順序建立工作表）
+        self.rows: Dict[str, List[List[str]]] = {}
+        self.rows_since_checkpoint = 0
+        
+        # 中斷的執行已完成的公司-季度 {(公司, 年份_季度): {"row": 資料列, "source_fingerprint": 來源版本指紋}}
+        self.resumed: Dict[Tuple[str, str], Dict] = self._load_journal() if resume else {}
+        self._journal = open(self.journal_path, "a" if resume else "w", encoding="utf-8")
+    
+    @staticmethod
+    def find_interrupted(directory: str) -> Optional[str]:
+        """尋找目錄中最近一次中斷的分析，返回其Excel輸出路徑（沒有時返回 None）"""
+        journals = [
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith(JOURNAL_SUFFIX)
+        ]
+        if not journals:
+            return None
+        latest = max(journals, key=os.path.getmtime)
+        return latest[:-len(JOURNAL_SUFFIX)] + ".xlsx"
+    
+    def _load_journal(self) -> Dict[Tuple[str, str], Dict]:
+        """讀取記錄檔中已完成的公司-季度，同一組合以最後一筆為準"""
+        if not os.path.exists(self.journal_path):
+            return {}
+        
+        resumed = {}
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 中斷時可能留下寫到一半的最後一行
+                    continue
+                resumed[(entry["company"], entry["row"][0])] = entry
+        return resumed
+    
+    def resumed_analysis(self, company: str, year_quarter: str, source_fingerprint: str = None) -> Optional[Dict]:
+        """返回中斷的執行中已完成且來源版本未變更的分析結果"""
+        entry = self.resumed.get((company, year_quarter))
+        if not entry or entry.get("source_fingerprint") != source_fingerprint:
+            return None
+        return dict(zip(self.analysis_types, entry["row"][1:]))
+    
+    def add_analysis(self, company: str, year_quarter: str, analysis: Dict, source_fingerprint: str = None):
+        """依分析類型順序加入一個公司-季度的分析結果"""
+        values = [analysis.get(analysis_type, "") for analysis_type in self.analysis_types]
+        self.add_row(company, [year_quarter] + values, source_fingerprint)
+    
+    def add_row(self, company: str, row: List[str], source_fingerprint: str = None):
+        """加入一列資料並寫入記錄檔（記錄檔中已有相同資料列時不重複寫入），達到間隔時寫入磁碟"""
+        self.rows.setdefault(company, []).append(row)
+        
+        entry = {"company": company, "row": row, "source_fingerprint": source_fingerprint}
+        if self.resumed.get((company, row[0])) == entry:
+            return
+        self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        
+        self.rows_since_checkpoint += 1
+        if self.rows_since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+    
+    def add_company(self, company: str):
+        """確保公司工作表存在（即使沒有任何資料列）"""
+        self.rows.setdefault(company, [])
+    
+    def checkpoint(self):
+        """將記錄檔寫入磁碟，只同步新增的資料列而不重新輸出工作簿"""
+        try:
+            os.fsync(self._journal.fileno())
+            self.rows_since_checkpoint = 0
+        except OSError as e:
+            logger.warning(f"寫入分析記錄檔時發生錯誤: {e}")
+    
+    def close(self) -> str:
+        """輸出最終工作簿並移除記錄檔"""
+        self._write_workbook(self.output_path)
+        
+        self._journal.close()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        
+        return self.output_path
+    
+    def _write_workbook(self, path: str):
+        """以 write_only 工作簿逐列寫出所有資料"""
+        workbook = Workbook(write_only=True)
+        for style in _create_named_styles():
+            workbook.add_named_style(style)
+        
+        for company, rows in self.rows.items():
+            worksheet = workbook.create_sheet(title=company[:31])
+            
+            # 設定列寬
+            for col_letter, width in self.column_widths.items():
+                worksheet.column_dimensions[col_letter].width = width
+            
+            header_cells = []
+            for header in self.headers:
+                cell = WriteOnlyCell(worksheet, value=header)
+                cell.style = HEADER_STYLE
+                header_cells.append(cell)
+            worksheet.append(header_cells)
+            
+            for row_index, row in enumerate(rows, 2):
+                # 設定行高（write_only 模式需在寫入該列前設定）
+                worksheet.row_dimensions[row_index].height = self.row_height
+                
+                row_cells = []
+                for value in row:
+                    cell = WriteOnlyCell(worksheet, value=value)
+                    cell.style = BODY_STYLE
+                    row_cells.append(cell)
+                worksheet.append(row_cells)
+        
+        workbook.save(path)
+
+def export_analysis_from_mongodb(analysis_collection, output_path: str) -> str:
+    """不重新分析，直接以一次投影查詢讀取已保存的分析結果並輸出Excel"""
+    title_mapping = settings.get("analysis_settings.title_mapping", {})
+    analysis_types = settings.get("analysis_settings.analysis_types", ["company_overview", "business_strategy", "risks"])
+    type_by_title = {title_mapping.get(analysis_type, analysis_type): analysis_type for analysis_type in analysis_types}
+    
+    cursor = analysis_collection.find(
+        {},
+        {"_id": 0, "company": 1, "quarter": 1, "title": 1, "analysis": 1}
+    ).sort([("company", 1), ("quarter", 1)])
+    
+    # 依公司與季度彙整各分析類型
+    grouped: Dict[str, Dict[str, Dict]] = {}
+    for doc in cursor:
+        analysis_type = type_by_title.get(doc.get("title"))
+        if not analysis_type:
+            continue
+        quarters = grouped.setdefault(doc["company"], {})
+        quarters.setdefault(doc["quarter"], {})[analysis_type] = doc.get("analysis", "")
+    
+    exporter = StreamingExcelExporter(output_path, checkpoint_interval=float("inf"), resume=False)
+    row_count = 0
+    for company, quarters in grouped.items():
+        for quarter in sorted(quarters):
+            exporter.rows.setdefault(company, []).append(
+                [quarter] + [quarters[quarter].get(analysis_type, "") for analysis_type in analysis_types]
+            )
+            row_count += 1
+    
+    exporter.close()
+    logger.info(f"從資料庫匯出 {len(grouped)} 家公司、{row_count} 個公司-季度的分析結果: {output_path}")
+    return output_path
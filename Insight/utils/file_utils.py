@@ -1,6 +1,7 @@
 import os
 import re
 import glob
+import hashlib
 from typing import Tuple, Optional, List
 from config.settings import settings
 from utils.logger import get_logger
@@ -62,6 +63,46 @@ def find_pdf_files(folder: str) -> List[str]:
     
     return pdf_files
 
+def compute_file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """計算檔案內容的 SHA-256"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def classify_file(pdf_file: str, manifest_entry: Optional[dict]) -> Tuple[str, str]:
+    """依檔案清單判斷檔案為新增、變更或未變更，返回 (狀態, SHA-256)
+
+    先前連結至其他檔案的重複檔案沒有自己的文檔塊，視為新增（是否仍為重複由重複檔案檢查決定）。
+    """
+    if manifest_entry is None:
+        return "new", compute_file_sha256(pdf_file)
+    
+    # 大小與修改時間相同時不重新計算雜湊
+    file_stat = os.stat(pdf_file)
+    if file_stat.st_size == manifest_entry.get("size") and file_stat.st_mtime == manifest_entry.get("mtime"):
+        sha256 = manifest_entry.get("sha256")
+    else:
+        sha256 = compute_file_sha256(pdf_file)
+    
+    if manifest_entry.get("duplicate_of"):
+        return "new", sha256
+    if sha256 == manifest_entry.get("sha256"):
+        return "unchanged", sha256
+    
+    return "changed", sha256
+
+def analysis_file_name(company_name: str, quarter: str) -> str:
+    """依公司-季度產生分析用的虛擬檔名（用於判斷年報或季報的查詢模板）"""
+    if "_" in quarter:
+        year_part, quarter_part = quarter.split("_", 1)
+        if quarter_part == "全年":
+            return f"{company_name}_{year_part}年報.pdf"
+        if quarter_part.startswith("Q"):
+            return f"{company_name}_{year_part}{quarter_part}季報.pdf"
+    return f"{company_name}_{quarter}.pdf"
+
 def create_output_directory(base_dir: str) -> str:
     """創建輸出目錄"""
     output_dir = settings.get("excel_output.output_directory", "財報分析")
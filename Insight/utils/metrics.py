@@ -0,0 +1,314 @@
+"""
+流程各階段的耗時與計數指標
+
+以 timer() 量測各階段的耗時、increment() 累計計數，依公司與檔案標籤分組：
+    pdf_open          開啟 PDF（每次 fitz.open）
+    text_extraction   PyMuPDF 逐頁文字提取（每個檔案）
+    find_tables       PyMuPDF 表格偵測與轉換（每個檔案）
+    ocr_render        OCR 頁面轉圖像（每頁）
+    ocr_call          視覺模型 OCR 請求（每次請求，含重試）
+    chunking          文本分塊（每次分塊）
+    embedding         向量化（每次 encode）
+    mongo_write       背景批次寫入（每個 bulk_write 批次，以集合為標籤）
+    retrieval         多查詢檢索（每次檢索）
+    llm_call          分析與摘要的 LLM 請求（每次請求）
+
+公司與檔案標籤以 labels() 設定於目前的執行緒（或工作），期間的所有量測自動帶上標籤。
+每次執行結束時以 finish_run() 輸出：
+    {metrics.directory}/{執行名稱}.prom                Prometheus textfile（供 node_exporter textfile collector 讀取）
+    {metrics.directory}/runs/{執行名稱}_{時間}.json     本次執行的摘要，並與上一次同名執行比較各階段平均耗時
+所有 Prometheus 時間序列都帶有 run 標籤；同時執行多個工作程序時另以 worker 標籤（工作程序編號）區分，
+執行名稱含工作程序編號，每個編號的 .prom 檔案在每次執行時覆寫，不會隨執行次數累積。
+"""
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from utils.logger import get_logger
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = get_logger(__name__)
+
+STAGES = (
+    "pdf_open", "text_extraction", "find_tables", "ocr_render", "ocr_call",
+    "chunking", "embedding", "mongo_write", "retrieval", "llm_call"
+)
+
+# Prometheus 直方圖的上限（秒）
+BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_labels = contextvars.ContextVar("metric_labels", default={})
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class MetricsRegistry:
+    """執行緒安全的階段耗時與計數指標"""
+    def __init__(self):
+        self.enabled = settings.get("metrics.enabled", True)
+        # 檔案數量多時可關閉檔案標籤，減少 Prometheus 時間序列數量
+        self.file_labels = settings.get("metrics.file_labels", True)
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """清除所有指標並重新開始計時"""
+        with self._lock:
+            self.started_at = datetime.now()
+            self._start = time.perf_counter()
+            self._timers: Dict[tuple, Dict] = {}
+            self._counters: Dict[tuple, float] = {}
+    
+    @contextmanager
+    def labels(self, **labels):
+        """設定期間所有量測的標籤（例如 company、file），可巢狀使用"""
+        token = _current_labels.set({**_current_labels.get(), **labels})
+        try:
+            yield
+        finally:
+            _current_labels.reset(token)
+    
+    def _label_key(self, labels: Dict) -> tuple:
+        merged = {**_current_labels.get(), **labels}
+        if not self.file_labels:
+            merged.pop("file", None)
+        return tuple(sorted((name, str(value)) for name, value in merged.items() if value is not None))
+    
+    def observe(self, stage: str, seconds: float, **labels):
+        """記錄一次階段耗時"""
+        if not self.enabled:
+            return
+        
+        key = (stage, self._label_key(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(BUCKETS)}
+            timer["count"] += 1
+            timer["sum"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    timer["buckets"][index] += 1
+    
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """量測區塊的耗時（發生例外時仍記錄）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+    
+    def increment(self, name: str, value: float = 1, **labels):
+        """累計計數（例如 pages_extracted、chunks_embedded、llm_prompt_tokens）"""
+        if not self.enabled or not value:
+            return
+        
+        key = (name, self._label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    @staticmethod
+    def resource_usage() -> Dict[str, Optional[float]]:
+        """目前程序的 CPU 時間與最大記憶體用量"""
+        times = os.times()
+        max_rss_bytes = None
+        if resource is not None:
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # Linux 以 KB 為單位，macOS 以 byte 為單位
+            max_rss_bytes = max_rss if sys.platform == "darwin" else max_rss * 1024
+        return {
+            "cpu_user_seconds": round(times.user, 3),
+            "cpu_system_seconds": round(times.system, 3),
+            "max_rss_bytes": max_rss_bytes
+        }
+    
+    def summary(self, run_name: str = "insight") -> Dict:
+        """本次執行的摘要：各階段合計、依公司與檔案的耗時、計數與資源用量"""
+        with self._lock:
+            timers = {key: dict(value) for key, value in self._timers.items()}
+            counters = dict(self._counters)
+        
+        stages, by_company, by_file = {}, {}, {}
+        for (stage, label_key), timer in timers.items():
+            labels = dict(label_key)
+            total = stages.setdefault(stage, {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            total["count"] += timer["count"]
+            total["seconds"] += timer["sum"]
+            total["max_seconds"] = max(total["max_seconds"], timer["max"])
+            
+            if "company" in labels:
+                company = by_company.setdefault(labels["company"], {})
+                company[stage] = company.get(stage, 0.0) + timer["sum"]
+            if "file" in labels:
+                file_key = f"{labels.get('company', '')}/{labels['file']}"
+                entry = by_file.setdefault(file_key, {})
+                entry[stage] = entry.get(stage, 0.0) + timer["sum"]
+        
+        for total in stages.values():
+            total["mean_ms"] = round(total["seconds"] * 1000 / total["count"], 3) if total["count"] else None
+            total["seconds"] = round(total["seconds"], 3)
+            total["max_seconds"] = round(total["max_seconds"], 3)
+        
+        counter_totals = {}
+        for (name, _), value in counters.items():
+            counter_totals[name] = counter_totals.get(name, 0) + value
+        
+        order = lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES)
+        return {
+            "run": run_name,
+            "started_at": self.started_at.isoformat(),
+            "elapsed_seconds": round(time.perf_counter() - self._start, 3),
+            "stages": {stage: stages[stage] for stage in sorted(stages, key=order)},
+            "counters": counter_totals,
+            "by_company": self._round_groups(by_company),
+            "by_file": self._round_groups(by_file),
+            "resources": self.resource_usage()
+        }
+    
+    @staticmethod
+    def _round_groups(groups: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+        return {key: {stage: round(seconds, 3) for stage, seconds in values.items()} for key, values in groups.items()}
+    
+    def prometheus_text(self, run_name: str = "insight", worker: str = None) -> str:
+        """Prometheus 文字格式（textfile collector 或 HTTP /metrics），每個時間序列都帶有 run（及 worker）標籤"""
+        with self._lock:
+            timers = sorted((key, dict(value)) for key, value in self._timers.items())
+            counters = sorted(self._counters.items())
+        
+        run_labels = (("run", run_name),) + ((("worker", worker),) if worker else ())
+        lines = [
+            "# HELP insight_stage_seconds Time spent in each Insight processing stage.",
+            "# TYPE insight_stage_seconds histogram"
+        ]
+        for (stage, label_key), timer in timers:
+            labels = run_labels + (("stage", stage),) + label_key
+            # observe() 已累計至每個不小於耗時的上限，直接輸出即為累積計數
+            for bound, count in zip(BUCKETS, timer["buckets"]):
+                lines.append(f"insight_stage_seconds_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"insight_stage_seconds_bucket{_format_labels(labels + (('le', '+Inf'),))} {timer['count']}")
+            lines.append(f"insight_stage_seconds_sum{_format_labels(labels)} {timer['sum']:.6f}")
+            lines.append(f"insight_stage_seconds_count{_format_labels(labels)} {timer['count']}")
+        
+        names = []
+        for (name, _), _ in counters:
+            if name not in names:
+                names.append(name)
+        for name in names:
+            metric = f"insight_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, label_key), value in counters:
+                if counter_name == name:
+                    lines.append(f"{metric}{_format_labels(run_labels + label_key)} {value:g}")
+        
+        run_labels = _format_labels(run_labels)
+        usage = self.resource_usage()
+        lines += [
+            "# TYPE insight_run_elapsed_seconds gauge",
+            f"insight_run_elapsed_seconds{run_labels} {time.perf_counter() - self._start:.3f}",
+            "# TYPE insight_run_cpu_seconds gauge",
+            f"insight_run_cpu_seconds{run_labels} {usage['cpu_user_seconds'] + usage['cpu_system_seconds']:.3f}",
+            "# TYPE insight_run_last_completed_timestamp_seconds gauge",
+            f"insight_run_last_completed_timestamp_seconds{run_labels} {time.time():.0f}"
+        ]
+        if usage["max_rss_bytes"] is not None:
+            lines += ["# TYPE insight_run_max_rss_bytes gauge", f"insight_run_max_rss_bytes{run_labels} {usage['max_rss_bytes']}"]
+        return "\n".join(lines) + "\n"
+    
+    @staticmethod
+    def _write_atomic(path: str, content: str):
+        """先寫入暫存檔再改名，textfile collector 不會讀到寫入一半的檔案"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    
+    @staticmethod
+    def _previous_summary(runs_directory: str, run_name: str, current_name: str) -> Optional[Dict]:
+        if not os.path.isdir(runs_directory):
+            return None
+        
+        pattern = re.compile(rf"^{re.escape(run_name)}_\d{{8}}_\d{{6}}\.json$")
+        names = sorted(name for name in os.listdir(runs_directory) if pattern.match(name) and name != current_name)
+        if not names:
+            return None
+        try:
+            with open(os.path.join(runs_directory, names[-1]), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def compare(previous: Dict, current: Dict, threshold: float = None) -> List[Dict]:
+        """比較兩次執行各階段的平均耗時，返回增加超過 threshold（比例）的階段"""
+        threshold = settings.get("metrics.regression_threshold", 0.2) if threshold is None else threshold
+        regressions = []
+        for stage, stats in current.get("stages", {}).items():
+            before = previous.get("stages", {}).get(stage)
+            if not before or not before.get("mean_ms") or stats.get("mean_ms") is None:
+                continue
+            change = stats["mean_ms"] / before["mean_ms"] - 1
+            if change > threshold:
+                regressions.append({"stage": stage, "previous_mean_ms": before["mean_ms"], "mean_ms": stats["mean_ms"], "change": round(change, 3)})
+        return regressions
+    
+    def finish_run(self, run_name: str, worker: str = None, **extra) -> Dict:
+        """輸出 Prometheus textfile 與本次執行的 JSON 摘要，並與上一次同名執行比較
+
+        指定 worker（工作程序編號）時檔名為 {執行名稱}_{worker}，同一編號的工作程序每次執行覆寫同一個 .prom 檔案。
+        """
+        if not self.enabled:
+            return {}
+        
+        directory = settings.get("metrics.directory", "metrics")
+        runs_directory = os.path.join(directory, "runs")
+        file_name = f"{run_name}_{re.sub(r'[^a-zA-Z0-9_.-]', '_', worker)}" if worker else run_name
+        summary = self.summary(run_name)
+        if worker:
+            summary["worker"] = worker
+        summary.update(extra)
+        
+        try:
+            self._write_atomic(os.path.join(directory, f"{file_name}.prom"), self.prometheus_text(run_name, worker))
+            summary_name = f"{file_name}_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json"
+            previous = self._previous_summary(runs_directory, file_name, summary_name)
+            if previous:
+                summary["regressions"] = self.compare(previous, summary)
+                summary["previous_run"] = previous.get("started_at")
+            
+            summary_path = os.path.join(runs_directory, summary_name)
+            self._write_atomic(summary_path, json.dumps(summary, ensure_ascii=False, indent=2, default=str))
+        except OSError as e:
+            logger.warning(f"輸出執行指標時發生錯誤: {e}")
+            return summary
+        
+        for stage, stats in summary["stages"].items():
+            logger.info(f"[指標] {stage}: {stats['count']} 次，累計 {stats['seconds']:.1f} 秒，平均 {stats['mean_ms']} ms")
+        for regression in summary.get("regressions", []):
+            logger.warning(
+                f"[指標] {regression['stage']} 平均耗時較上次執行增加 {regression['change']:.0%}"
+                f"（{regression['previous_mean_ms']} → {regression['mean_ms']} ms）"
+            )
+        logger.info(f"執行指標已保存到: {summary_path}")
+        return summary
+
+metrics = MetricsRegistry()